@@ -1,6 +1,6 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+import data_layer
+from simulator import SCOPES
 
 ## Cufflink is also a python library that connects plotly with pandas so that we can create charts 
 # directly on data frames. It basically acts as a plugin.
@@ -27,14 +27,9 @@ st.markdown("""
 #################################################################################
 st.markdown(""" This this the database where we gonna work""")
 
-DATA_URL = ('src/data_clean_dataframe.csv')
-@st.cache
-def load_data():
-    data = pd.read_csv(DATA_URL)
-    return data
-
-data = load_data()
-st.write(data.head(10))
+# Datasets, filtered views and figures are built once per version of the data files and shared by
+# all the sessions (see data_layer.py)
+st.write(data_layer.preview(10))
 
 st.markdown("""
     Here is the list of questions :
@@ -57,16 +52,23 @@ Select question in the sidebar to see analysis
 #####                                                                       #####
 #################################################################################
 
+QUESTIONS = {
+    'Question 1': 'How often are drivers late for the next check-in ?',
+    'Question 2': 'How does it impact the next driver ?',
+    'Question 3': 'How many problematic cases will it solve depending on the chosen threshold and scope ?',
+    'Question 4': 'How many rentals would be affected by the feature depending on the threshold and scope we choose ?',
+    'Question 5': "Which share of our owner's revenue would potentially be affected by the feature ?",
+}
+
 st.sidebar.header('Questions')
 st.sidebar.text('Select question to see the analysis')
-st.sidebar.selectbox('Select a question :', 
-                        ['Question 1',
-                        'Question 2',
-                        'Question 3',
-                        'Question 4',
-                        'Question 5'])
-if st.sidebar.selectbox == 'Question 1':
-    st.text('Question 1 : How often are drivers late for the next check-in ?')
+question = st.sidebar.selectbox('Select a question :', list(QUESTIONS))
+st.sidebar.markdown(f"**{question}** : {QUESTIONS[question]}")
+
+st.sidebar.header('Simulator')
+st.sidebar.text('Threshold and scope used in questions 3 to 5')
+threshold = st.sidebar.slider('Minimum time between two rentals (minutes) :', 0, 720, 180, step=15)
+scope = st.sidebar.selectbox('Scope :', list(SCOPES))
 
 #################################################################################
 #####                                                                       #####
@@ -74,26 +76,9 @@ if st.sidebar.selectbox == 'Question 1':
 #####                                                                       #####
 #################################################################################
 
-mask1 = data['previous_rental'] == "Yes"
-data_F1 = data.loc[mask1,:]
-
-mask2 = data_F1['is_delay'] == "Yes"
-data_F2 = data_F1.loc[mask2,:]
-
-mask3 = data_F2['state'] == 'canceled'
-data_F3 = data_F2.loc[mask3,:]
-
-mask4 = data_F2['state'] == "ended"
-data_F4 = data_F2.loc[mask4,:]
-
-mask5 = data['state'] == 'canceled'
-data_F5 = data.loc[mask5,:]
-
-mask6 = data_F1['state'] == 'canceled'
-data_F6 = data_F1.loc[mask6,:]
-
-mask7 = data['delay_types'].isin(['No_delay', 'Less than an hours','1h to 3h'])
-data_F7 = data.loc[mask7,:]
+# Graphs 1 to 10 are drawn from a count cube of the dataset filtered on previous_rental, is_delay
+# and state (see data_layer.VIEWS)
+figures = data_layer.bar_charts()
 
 #################################################################################
 #####                                                                       #####
@@ -105,7 +90,7 @@ st.header("QUESTION 1 : How often are drivers late for the next check-in ?")
 ######## GRAPH 1 ######### 
 
 st.subheader("Graph 1 - Percent of 'delay' of previous rental car")
-fig1 = px.histogram(data_F1, x='is_delay', histnorm='percent')
+fig1 = figures[1]
 st.plotly_chart(fig1)
 
 st.markdown("""
@@ -126,7 +111,7 @@ st.markdown("=> To know how does it impact the next driver we gonna analyze late
 ######## GRAPH 2 ######### 
 
 st.subheader("Graph 2 - Percent of 'state' of late return of previous rental car")
-fig2 = px.histogram(data_F2, x='state', histnorm='percent')
+fig2 = figures[2]
 st.plotly_chart(fig2)
 
 st.markdown("""Graph 2 - Quick data analysis :
@@ -135,14 +120,7 @@ st.markdown("""Graph 2 - Quick data analysis :
 ######## GRAPH 3 ######### 
 
 st.subheader("Graph 3 - Percent of 'delay types' of late return of previous rental car")
-fig3 = px.histogram(data_F2, x='delay_types', histnorm='percent', category_orders={'delay types' :["No_delay",
-                                                                                                    "Less than an hours",
-                                                                                                    "1h to 3h", 
-                                                                                                    "3h to 6h", 
-                                                                                                    "6h to 12h",
-                                                                                                    "12h to 24h",
-                                                                                                    "Two day", 
-                                                                                                    "More than 3 days"]})
+fig3 = figures[3]
 st.plotly_chart(fig3)
 
 st.markdown("""Graph 3 - Quick data analysis :
@@ -151,14 +129,7 @@ st.markdown("""Graph 3 - Quick data analysis :
 ######## GRAPH 4 #########
 
 st.subheader("Graph 4 - Percent of 'time delta' of late return of previous rental car")
-fig4 = px.histogram(data_F2, x='time_delta', histnorm='percent', category_orders={'time_delta' :["No_time_delta",
-                                                                 "Less than an hours",
-                                                                 "1h to 3h", 
-                                                                 "3h to 6h", 
-                                                                 "6h to 12h",
-                                                                 "12h to 24h",
-                                                                 "Two day", 
-                                                                 "More than 3 days"]})
+fig4 = figures[4]
 st.plotly_chart(fig4)
 
 st.markdown(""" Graph 4 - Quick data analysis :
@@ -169,14 +140,7 @@ st.markdown(""" Graph 4 - Quick data analysis :
 ######## GRAPH 5 #########
 
 st.subheader("Graph 5 - Percent of 'delay types' of late return of previous rental car")
-fig5 = px.histogram(data_F3, x='delay_types', histnorm='percent', category_orders={'delay types' :["No_delay",
-                                                                                                    "Less than an hours",
-                                                                                                    "1h to 3h", 
-                                                                                                    "3h to 6h", 
-                                                                                                    "6h to 12h",
-                                                                                                    "12h to 24h",
-                                                                                                    "Two day", 
-                                                                                                    "More than 3 days"]})
+fig5 = figures[5]
 st.plotly_chart(fig5)
 
 st.markdown("""Graph 5 - Quick data analysis :
@@ -186,14 +150,7 @@ st.markdown("""Graph 5 - Quick data analysis :
 ######## GRAPH 6 #########
 
 st.subheader("Graph 6 - Percent of 'delay types' of late return of previous rental car")
-fig6 = px.histogram(data_F3, x='time_delta', histnorm='percent', category_orders={'delay types' :["No_time_delta",
-                                                                                                "Less than an hours",
-                                                                                                "1h to 3h", 
-                                                                                                "3h to 6h", 
-                                                                                                "6h to 12h",
-                                                                                                "12h to 24h",
-                                                                                                "Two day", 
-                                                                                                "More than 3 days"]})
+fig6 = figures[6]
 st.plotly_chart(fig6)
 
 st.markdown("""Graph 6 - Quick data analysis :
@@ -204,7 +161,7 @@ st.markdown("""Graph 6 - Quick data analysis :
 ######## GRAPH 7 #########
 
 st.subheader("Graph 7 -Percent of 'checkin type' of late return of previous rental car")
-fig7 = px.histogram(data_F3, x='checkin_type', histnorm='percent')
+fig7 = figures[7]
 st.plotly_chart(fig7)
 
 st.markdown("""Graph 7 - Quick data analysis :
@@ -213,13 +170,7 @@ st.markdown("""Graph 7 - Quick data analysis :
 ######## GRAPH 8 #########
 
 st.subheader("Graph 8 - Percent of 'delay types' of late return of previous rental car")
-fig8 = px.histogram(data_F4, x='delay_types', histnorm='percent', category_orders={'delay_types' : ['No_delay', 
-                                                                                                    'Less than an hours', 
-                                                                                                    '1h to 3h', 
-                                                                                                    '3h to 6h',
-                                                                                                    '6h to 12h', 
-                                                                                                    '12h to 24h', 
-                                                                                                    'Two day']})
+fig8 = figures[8]
 
 st.plotly_chart(fig8)
 
@@ -229,13 +180,7 @@ st.markdown("""Graph 8 - Quick data analysis :
 ######## GRAPH 9 #########
 
 st.subheader("Graph 9 - Percent of 'time_delta' of late return of previous rental car")
-fig9 = px.histogram(data_F4, x='time_delta', histnorm='percent', category_orders={'delay_types' : ['No_time_delta',
-                                                                                                    'Less than an hours',
-                                                                                                    '1h to 3h', 
-                                                                                                    '3h to 6h', 
-                                                                                                    '6h to 12h', 
-                                                                                                    '12h to 24h', 
-                                                                                                    'two days']})
+fig9 = figures[9]
 
 st.plotly_chart(fig9)
 
@@ -249,9 +194,9 @@ st.markdown("""Graph 9 - Quick data analysis :
 
 st.subheader("Graph 10")
 st.markdown("Percent of checkin_type of late return of previous rental car")
-fig10 = px.histogram(data_F5, x='checkin_type', histnorm='percent')
+fig10 = figures[10]
 
-st.plotly_chart(fig9)
+st.plotly_chart(fig10)
 
 st.markdown("""Graph 10 - Quick data analysis :
 * From all cancelation the most chekin-in type is 'mobile' with 77%""")
@@ -289,15 +234,26 @@ st.markdown("""#### >>> So, now, we gonna measure the impact of those features (
 
 st.header("QUESTION 4 : How many rentals would be affected by the feature depending on the threshold and scope we choose ?")
 
-st.text("==> **Threshold** :") 
-st.text(" Minimum time between two rental will be set up at 3h :")
-st.text("=> It will solve : 86% late_rental (Graph 8)")
-st.text("Minimum canceling would be 24h before the time rental")
-st.text("=> It will solve : 100% of canceling (Graph 6)")
+# Computed on the raw dataset: time deltas and delays are sorted once per scope, so moving the
+# slider only costs a few binary searches
+simulator = data_layer.simulator()
+result = simulator.at(threshold, scope)
 
-st.text("==> **Scope** :")
-st.text("Even it is almost 50/50 with previous rental, the type of checking is up to 77% for mobile. ")
-st.text("We should have an action on it. But need to know more about this feature.")
+st.subheader(f"Threshold of {threshold} minutes, scope : {scope}")
+col1, col2, col3 = st.columns(3)
+col1.metric("Rentals blocked", f"{result['blocked_rentals']:.0f}", f"{result['blocked_share']:.1f}% of rentals", delta_color="inverse")
+col2.metric("Problematic cases solved", f"{result['solved_cases']:.0f} / {result['problem_cases']:.0f}", f"{result['solved_share']:.1f}%")
+col3.metric("Late checkouts within the threshold", f"{result['late_checkouts_absorbed_share']:.1f}%")
+
+st.markdown("""* A rental is blocked when it starts less than the threshold after the previous rental of the same car.
+* A problematic case is a rental whose previous driver came back later than the time planned between the two rentals.
+* Use the sidebar to change the threshold and the scope.""")
+
+######## GRAPH 11 #########
+
+st.subheader("Graph 11 - Blocked rentals and solved cases depending on the threshold")
+fig11 = data_layer.threshold_figure(scope)
+st.plotly_chart(fig11)
 
 #################################################################################
 #####                                                                       #####
@@ -307,19 +263,59 @@ st.text("We should have an action on it. But need to know more about this featur
 
 st.header("QUESTION 5 : Which share of our owner's revenue would potentially be affected by the feature ?")
 
-st.text("1. The marketing")
-st.text("2. App developpement with 'mobile' and 'connect'")
-st.text("3. Legal")
-st.text("4. Lawyer")
+# Each car of the delay dataset is given a listing of the pricing dataset (see revenue.py) and each
+# ended rental counts as one day at its daily price. Blocked revenue is read from a cumulative sum
+# sorted by time delta, so the whole curve is redrawn when the slider moves
+price_source = st.selectbox('Daily price of the cars :', data_layer.price_sources())
+
+impact = data_layer.revenue_impact(price_source)
+revenue = impact.at(threshold, scope)
+
+st.subheader(f"Threshold of {threshold} minutes, scope : {scope}")
+col1, col2 = st.columns(2)
+col1.metric("Revenue affected", f"{revenue['affected_revenue']:,.0f} $", f"{revenue['affected_share']:.1f}% of the scope revenue", delta_color="inverse")
+col2.metric("Revenue of the scope", f"{revenue['scope_revenue']:,.0f} $")
 
+st.markdown("""* The delay dataset has no car details : every car is matched with a car of the pricing dataset (Connect cars with Connect cars).
+* A rental is counted as one day at the daily price of its car, canceled rentals are not counted.""")
 
+######## GRAPH 12 #########
 
+st.subheader("Graph 12 - Share of the revenue affected depending on the threshold")
+fig12 = data_layer.revenue_figure(price_source)
+st.plotly_chart(fig12)
+
+#################################################################################
+#####                                                                       #####
+#####                             CHAINED DELAYS                            ##### 
+#####                                                                       #####
+#################################################################################
 
+st.header("CHAINED DELAYS : Does a late return push several next rentals ?")
 
+# Rentals of every car in order, with a pointer to the previous rental (see timeline.py): all the
+# cascades are followed at once, and the timeline of a car is a slice of the sorted rentals
+timeline = data_layer.timeline()
+cascades = timeline.cascades(scope)
 
+col1, col2, col3 = st.columns(3)
+col1.metric("Late returns making the next driver wait", f"{len(cascades)}")
+col2.metric("Rentals pushed back", f"{cascades['pushed_rentals'].sum()}", f"{cascades['canceled_rentals'].sum()} canceled", delta_color="off")
+col3.metric("Late returns pushing more than one rental", f"{(cascades['chain_length'] > 1).sum()}")
 
+st.markdown("""* The next driver waits when the previous car comes back later than the time planned between the two rentals.
+* If the car then comes back that much late, the wait moves on to the following rental, and so on.""")
 
+######## GRAPH 13 #########
 
+st.subheader("Graph 13 - Number of rentals in a row pushed back by one late return")
+fig13 = data_layer.chain_length_figure(scope)
+st.plotly_chart(fig13)
 
+st.subheader("Timeline of a car")
+longest = cascades.sort_values(['chain_length', 'total_wait'], ascending=False)
+default_car = int(longest['car_id'].iloc[0]) if len(longest) else int(timeline.cars[0])
+car_id = st.number_input('Car id :', value=default_car, step=1)
+st.dataframe(timeline.car(car_id))
 
 # st.balloons()
\ No newline at end of file
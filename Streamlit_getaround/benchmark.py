@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+import delay_etl
+import pricing_client
+from columnar import load_columnar, write_columnar
+from simulator import SCOPES, ThresholdSimulator, load_raw_arrays
+from timeline import RentalTimeline
+
+
+# Local benchmarks of the dashboard data layer.
+# Usage: python benchmark.py <name> [--scales 1 10 100]
+
+RAW_PATH = 'src/get_around_delay_analysis.xlsx'
+
+
+def load_raw():
+    return pd.read_excel(RAW_PATH, sheet_name='rentals_data')
+
+
+def synthetic_raw(raw, scale, seed=0):
+    """
+    `scale` times the raw delay dataset, rows resampled with jittered minutes.
+    """
+    rng = np.random.default_rng(seed)
+    df = raw.sample(len(raw) * scale, replace=True, random_state=seed).reset_index(drop=True)
+    for col in ['delay_at_checkout_in_minutes', 'time_delta_with_previous_rental_in_minutes']:
+        jitter = rng.integers(-30, 31, len(df))
+        df[col] = df[col] + np.where(rng.random(len(df)) < 0.5, jitter, 0)
+    return df
+
+
+def notebook_binning(x, zero_label):
+    # nested conditions of `formating_data` in PART_3_Formated_Dataset.ipynb
+    return (zero_label if x == 0 else
+            ('Less than an hours' if x > 0 and x < 60 else
+             ('Less than an hours' if x < 0 and x > -60 else
+              ('1h to 3h' if x >= 60 and x < 180 else
+               ('1h to 3h' if x <= -60 and x > -180 else
+                ('3h to 6h' if x >= 180 and x < 360 else
+                 ('3h to 6h' if x <= -180 and x > -360 else
+                  ("6h to 12h" if x >= 360 and x < 720 else
+                   ('6h to 12h' if x <= -360 and x > -720 else
+                    ("12h to 24h" if x >= 720 and x < 1440 else
+                     ("12h to 24h" if x <= -720 and x > -1440 else
+                      ("One day" if x == 1440 else
+                       ("One day" if x == -1440 else
+                        ("Two day" if x > 1440 and x < 2880 else
+                         ("Two day" if x < -1440 and x > -2880 else
+                          "More than 3 days")))))))))))))))
+
+
+def notebook_formating_data(data):
+    """
+    `formating_data` of PART_3_Formated_Dataset.ipynb, row by row with `Series.apply`.
+    """
+    data_formated = data
+    data_formated['delay_at_checkout_in_minutes'] = data_formated['delay_at_checkout_in_minutes'].fillna(0)
+    data_formated['previous_ended_rental_id'] = data_formated['previous_ended_rental_id'].fillna(0)
+    data_formated['time_delta_with_previous_rental_in_minutes'] = data_formated['time_delta_with_previous_rental_in_minutes'].fillna(0)
+    data_formated['previous_rental'] = data_formated['previous_ended_rental_id'].apply(lambda x: "Yes" if x != 0 else "No")
+    data_formated['is_delay'] = data_formated['delay_at_checkout_in_minutes'].apply(lambda x: "No" if x > 0 else "Yes")
+    data_formated['delay_types'] = data_formated['delay_at_checkout_in_minutes'].apply(lambda x: notebook_binning(x, 'No_delay'))
+    data_formated['time_delta'] = data_formated['time_delta_with_previous_rental_in_minutes'].apply(lambda x: notebook_binning(x, 'No_time_delta'))
+    return data_formated[delay_etl.CLEAN_COLUMNS]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_etl(args):
+    """
+    Notebook `Series.apply` formatting against the vectorized ETL, and the chunked CSV to CSV run.
+    """
+    raw = load_raw()
+    for scale in args.scales:
+        data = synthetic_raw(raw, scale) if scale > 1 else raw
+        expected, apply_time = timed(notebook_formating_data, data.copy())
+        result, vector_time = timed(delay_etl.formating_data, data)
+        same = expected.reset_index(drop=True).equals(result.astype(object).reset_index(drop=True))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            raw_csv = os.path.join(tmp, 'raw.csv')
+            data.to_csv(raw_csv, index=False)
+            _, run_time = timed(delay_etl.run, raw_csv, os.path.join(tmp, 'clean.csv'), args.chunksize)
+
+        print(f"x{scale:<4} {len(data):>9} rows | notebook apply {apply_time:7.2f}s | vectorized {vector_time:6.3f}s "
+              f"({apply_time / vector_time:5.0f}x) | chunked CSV run {run_time:6.2f}s | identical: {same}")
+
+
+LOAD_SCRIPT = """
+import os, sys, time
+import pandas as pd
+from columnar import load_columnar
+
+def private_mb():
+    # resident minus file backed pages (Linux), memory-mapped codes are shared through the page cache
+    with open('/proc/self/statm') as f:
+        _, resident, shared = map(int, f.read().split()[:3])
+    return (resident - shared) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+kind, path = sys.argv[1], sys.argv[2]
+before = private_mb()
+start = time.perf_counter()
+data = pd.read_csv(path) if kind == 'csv' else load_columnar(path)
+# touch every value as a dashboard page would
+counts = [data[col].value_counts() for col in data.columns]
+elapsed = time.perf_counter() - start
+print(elapsed, private_mb() - before)
+"""
+
+
+def measure_load(kind, path):
+    # a fresh process per measure, so resident memory only counts this load
+    output = subprocess.run([sys.executable, '-c', LOAD_SCRIPT, kind, path], check=True,
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed, rss = output.stdout.split()
+    return float(elapsed), float(rss)
+
+
+def bench_load(args):
+    """
+    Load time and private resident memory of the cleaned dataset: object CSV against memory-mapped columnar file.
+    """
+    csv_path = os.path.abspath('src/data_clean_dataframe.csv')
+    prefix = os.path.abspath('src/data_clean_dataframe')
+    files = [('real file', csv_path, prefix)]
+    tmp = tempfile.TemporaryDirectory()
+    if args.rows:
+        data = load_columnar(prefix)
+        rng = np.random.default_rng(0)
+        synthetic = data.iloc[rng.integers(0, len(data), args.rows)].reset_index(drop=True)
+        synthetic_csv = os.path.join(tmp.name, 'synthetic.csv')
+        synthetic.to_csv(synthetic_csv, index=False)
+        write_columnar(synthetic, os.path.join(tmp.name, 'synthetic'))
+        files.append((f'synthetic {args.rows} rows', synthetic_csv, os.path.join(tmp.name, 'synthetic')))
+
+    with tmp:
+        for name, csv, columnar in files:
+            csv_time, csv_rss = measure_load('csv', csv)
+            col_time, col_rss = measure_load('columnar', columnar)
+            print(f"{name:<24} | CSV {csv_time:7.3f}s {csv_rss:8.1f} MB | columnar {col_time:7.3f}s {col_rss:8.1f} MB "
+                  f"| {csv_time / col_time:5.0f}x faster")
+
+
+def synthetic_raw_arrays(arrays, n_rows, seed=0):
+    """
+    `n_rows` rentals resampled from the raw arrays, with new rental ids and chained previous rentals.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(arrays['rental_id']), n_rows)
+    synthetic = {name: values[rows] for name, values in arrays.items()}
+    synthetic['rental_id'] = np.arange(n_rows, dtype=np.float64)
+    chained = ~np.isnan(synthetic['time_delta'])
+    synthetic['previous_rental_id'] = np.where(chained, rng.integers(0, n_rows, n_rows), np.nan)
+    return synthetic
+
+
+def bench_simulator(args):
+    """
+    Build time of the threshold simulator and time per slider move (one threshold, every scope).
+    """
+    arrays = load_raw_arrays(RAW_PATH)
+    for n_rows in [len(arrays['rental_id'])] + ([args.rows] if args.rows else []):
+        data = arrays if n_rows == len(arrays['rental_id']) else synthetic_raw_arrays(arrays, n_rows)
+        simulator, build_time = timed(ThresholdSimulator, data)
+        thresholds = np.arange(0, 721, 15)
+        start = time.perf_counter()
+        for threshold in thresholds:
+            for scope in SCOPES:
+                simulator.at(threshold, scope)
+        move_time = (time.perf_counter() - start) / (len(thresholds) * len(SCOPES))
+        _, sweep_time = timed(simulator.simulate, thresholds, 'All cars')
+        print(f"{n_rows:>9} rentals | build {build_time:6.2f}s | one slider move {move_time * 1000:6.2f} ms "
+              f"| sweep of {len(thresholds)} thresholds {sweep_time * 1000:6.2f} ms")
+
+
+def merge_cascades(arrays):
+    """
+    Cascading delays with one DataFrame self-merge per hop, the way PART_1 joins previous rentals.
+    Returns the number of rentals pushed back.
+    """
+    df = pd.DataFrame(arrays)
+    frontier = df.loc[df['delay'] > 0, ['rental_id', 'delay']].rename(columns={'delay': 'lateness'})
+    pushed = 0
+    while len(frontier):
+        merged = df.merge(frontier.rename(columns={'rental_id': 'previous_rental_id'}), on='previous_rental_id')
+        merged['lateness'] = merged['lateness'] - merged['time_delta']
+        merged = merged[merged['lateness'] > 0]
+        pushed += len(merged)
+        frontier = merged.loc[merged['state'] == 0, ['rental_id', 'lateness']]
+    return pushed
+
+
+def bench_timeline(args):
+    """
+    Build time of the rental timeline and time to follow every cascade, against repeated merges.
+    """
+    arrays = load_raw_arrays(RAW_PATH)
+    for n_rows in [len(arrays['rental_id'])] + ([args.rows] if args.rows else []):
+        data = arrays if n_rows == len(arrays['rental_id']) else synthetic_raw_arrays(arrays, n_rows)
+        timeline, build_time = timed(RentalTimeline, data)
+        cascades, cascade_time = timed(timeline.cascades)
+        pushed, merge_time = timed(merge_cascades, data)
+        check = 'same' if pushed == cascades['pushed_rentals'].sum() else 'DIFFERENT'
+        print(f"{n_rows:>9} rentals | build {build_time:6.2f}s | cascades {cascade_time:6.2f}s "
+              f"| merges {merge_time:6.2f}s | {pushed} rentals pushed back ({check})")
+
+
+# widget changes of a session after its first page: (widget label, WidgetState field, value)
+SESSION_CHANGES = [
+    ('Minimum time between two rentals (minutes) :', 'double_array_value', [240]),
+    ('Scope :', 'int_value', 1),
+    ('Select a question :', 'int_value', 3),
+]
+
+
+def start_server(script, port):
+    server = subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', script, '--server.headless', 'true',
+                               '--server.port', str(port), '--browser.gatherUsageStats', 'false'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(600):
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"streamlit did not start for {script}")
+
+
+async def page(connection, widgets):
+    """
+    One run of the script in a session, as the browser asks for it. Returns the time until the
+    script finished and the widget ids by label.
+    """
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    message = BackMsg()
+    message.rerun_script.widget_states.widgets.extend(widgets.values())
+    start = time.perf_counter()
+    await connection.write_message(message.SerializeToString(), binary=True)
+    ids = {}
+    while True:
+        data = await connection.read_message()
+        if data is None:
+            raise RuntimeError("the server closed the session")
+        reply = ForwardMsg()
+        reply.ParseFromString(data)
+        kind = reply.WhichOneof('type')
+        if kind == 'delta' and reply.delta.WhichOneof('type') == 'new_element':
+            element = reply.delta.new_element
+            widget = getattr(element, element.WhichOneof('type'))
+            if getattr(widget, 'id', '') and hasattr(widget, 'label'):
+                ids[widget.label] = widget.id
+        elif kind == 'script_finished':
+            if reply.script_finished != reply.FINISHED_SUCCESSFULLY:
+                raise RuntimeError(f"script run ended with status {reply.script_finished}")
+            return time.perf_counter() - start, ids
+
+
+async def session(port, changes):
+    """
+    One browser tab: first page, then one page per widget change. Returns the page times.
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+    from tornado.websocket import websocket_connect
+
+    connection = await websocket_connect(f'ws://127.0.0.1:{port}/_stcore/stream', max_message_size=2**30)
+    widgets = {}
+    try:
+        first, ids = await page(connection, widgets)
+        times = [first]
+        for label, field, value in changes:
+            state = WidgetState(id=ids[label])
+            if field == 'double_array_value':
+                state.double_array_value.data.extend(value)
+            else:
+                setattr(state, field, value)
+            widgets[label] = state
+            elapsed, ids = await page(connection, widgets)
+            times.append(elapsed)
+        return times
+    finally:
+        connection.close()
+
+
+async def sessions_at_once(port, n_sessions, changes):
+    start = time.perf_counter()
+    times = await asyncio.gather(*[session(port, changes) for _ in range(n_sessions)])
+    return np.array(times), time.perf_counter() - start
+
+
+def bench_sessions(args):
+    """
+    Page times of the dashboard served by streamlit: first page of a new server (cold caches), first
+    page once the caches are built (warm), then concurrent sessions each moving the sidebar widgets.
+    --baseline also serves the dashboard of a git revision to compare with.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    scripts = [('current', 'app.py')]
+    tmp = None
+    if args.baseline:
+        # the script of the revision next to this one, so it imports the modules of this directory
+        source = subprocess.run(['git', 'show', f'{args.baseline}:Streamlit_getaround/app.py'], check=True,
+                                capture_output=True, text=True, cwd=here).stdout
+        tmp = tempfile.NamedTemporaryFile('w', suffix='.py', dir=here, delete=False)
+        with tmp:
+            tmp.write(source)
+        scripts.insert(0, (args.baseline, os.path.basename(tmp.name)))
+
+    try:
+        for name, script in scripts:
+            server = start_server(script, args.port)
+            try:
+                cold = asyncio.run(session(args.port, []))[0]
+                warm = asyncio.run(session(args.port, []))[0]
+                print(f"{name:<10} | cold first page {cold:6.2f}s | warm first page {warm * 1000:6.0f} ms")
+                for n_sessions in args.sessions:
+                    times, wall = asyncio.run(sessions_at_once(args.port, n_sessions, SESSION_CHANGES))
+                    first_p50, first_p95 = np.percentile(times[:, 0], [50, 95]) * 1000
+                    change_p50, change_p95 = np.percentile(times[:, 1:], [50, 95]) * 1000
+                    print(f"{name:<10} | {n_sessions:>4} sessions in {wall:6.2f}s | first page p50 {first_p50:6.0f} ms "
+                          f"p95 {first_p95:6.0f} ms | widget change p50 {change_p50:6.0f} ms p95 {change_p95:6.0f} ms")
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        if tmp:
+            os.remove(tmp.name)
+
+
+def start_api(port):
+    env = dict(os.environ, CACHE_MAX_ENTRIES='0', LOG_SAMPLE_RATE='0')
+    api = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port),
+                            '--log-level', 'warning'], cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                        '..', 'fast_API_getaround'), env=env)
+    for _ in range(600):
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/admin/model', timeout=1):
+                return api
+        except OSError:
+            time.sleep(0.1)
+    api.kill()
+    raise RuntimeError("the pricing API did not start")
+
+
+def sequential_prices(cars, base_url):
+    """
+    One `requests.post` per car to /predict, as test_api.ipynb calls the API.
+    """
+    import requests
+
+    return np.array([requests.post(base_url + '/predict', json=payload).json()[pricing_client.PRICE]
+                     for payload in pricing_client.payloads(cars)])
+
+
+def bench_pricing(args):
+    """
+    Time to price --cars cars of the pricing dataset: sequential /predict calls against the pooled async
+    client, one car per request and in chunks, and the in-process fallback with the API down.
+    """
+    from revenue import model_predict
+
+    dataset = pd.read_csv('src/get_around_pricing_project.csv', index_col=0)
+    cars = dataset.sample(args.cars, replace=args.cars > len(dataset), random_state=0).reset_index(drop=True)
+    base_url = f'http://127.0.0.1:{args.port}'
+    fallback = model_predict('../fast_API_getaround/model.joblib')
+    api = start_api(args.port)
+    try:
+        expected, duration = timed(sequential_prices, cars, base_url)
+        print(f"{'sequential /predict':<40} | {len(cars)} cars in {duration:7.2f}s | {len(cars) / duration:8.0f} cars/s")
+        runs = [('pooled /predict, 8 at a time', {'per_car': True, 'concurrency': 8}),
+                ('pooled /predict/batch, 500 per request', {'chunk_size': 500, 'concurrency': 8})]
+        for name, options in runs:
+            result, duration = timed(lambda: pricing_client.price_cars(cars, base_url=base_url, fallback=fallback, **options))
+            difference = np.abs(result['prediction'].to_numpy() - expected).max()
+            print(f"{name:<40} | {len(cars)} cars in {duration:7.2f}s | {len(cars) / duration:8.0f} cars/s "
+                  f"| {(result['source'] == 'api').sum()} from the API, largest difference {difference:.1f}")
+    finally:
+        api.terminate()
+        api.wait()
+    result, duration = timed(lambda: pricing_client.price_cars(cars, base_url=base_url, fallback=fallback, retries=1))
+    difference = np.abs(result['prediction'].to_numpy() - expected).max()
+    print(f"{'API down, in-process fallback':<40} | {len(cars)} cars in {duration:7.2f}s | {len(cars) / duration:8.0f} cars/s "
+          f"| {(result['source'] == 'in-process').sum()} in-process, largest difference {difference:.1f}")
+
+
+BENCHMARKS = {
+    'etl': bench_etl,
+    'load': bench_load,
+    'pricing': bench_pricing,
+    'sessions': bench_sessions,
+    'simulator': bench_simulator,
+    'timeline': bench_timeline,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the Getaround dashboard data")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--rows', type=int, default=10000000, help="size of the synthetic dataset, 0 to skip it")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 50], help="concurrent dashboard sessions")
+    parser.add_argument('--baseline', help="git revision of the dashboard to compare with, e.g. HEAD~1")
+    parser.add_argument('--port', type=int, default=8599, help="port of the servers started by the benchmark")
+    parser.add_argument('--cars', type=int, default=10000, help="cars priced by the pricing benchmark")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Columnar storage of the cleaned delay dataset.
+# Every column is dictionary encoded: one row of int8 codes per column in `<prefix>.codes.npy`, and
+# the vocabulary of each column in `<prefix>.vocab.json`. The codes are memory-mapped when loaded, so
+# the dashboard processes share the file through the page cache instead of parsing a CSV.
+# Usage: python columnar.py src/data_clean_dataframe.csv   (writes src/data_clean_dataframe.codes.npy/.vocab.json)
+
+CODES_SUFFIX = '.codes.npy'
+VOCAB_SUFFIX = '.vocab.json'
+
+
+def columnar_prefix(path):
+    """
+    `src/data_clean_dataframe.csv` -> `src/data_clean_dataframe`
+    """
+    for suffix in (CODES_SUFFIX, VOCAB_SUFFIX, '.csv'):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def columnar_exists(prefix):
+    return os.path.exists(prefix + CODES_SUFFIX) and os.path.exists(prefix + VOCAB_SUFFIX)
+
+
+class ColumnarWriter:
+    """
+    Appends DataFrame chunks to a columnar file with bounded memory.
+    Codes are spooled to one temporary file per column, then copied into the final `.npy`.
+    Vocabularies only grow, so codes written for earlier chunks stay valid.
+    """
+
+    def __init__(self, prefix, columns, vocabularies=None):
+        self.prefix = prefix
+        self.columns = list(columns)
+        self.vocabularies = {col: list((vocabularies or {}).get(col, [])) for col in self.columns}
+        self._index = {col: {value: i for i, value in enumerate(vocab)} for col, vocab in self.vocabularies.items()}
+        self._spools = {col: open(f"{prefix}.{i}.tmp", 'wb') for i, col in enumerate(self.columns)}
+        self.n_rows = 0
+
+    def _codes(self, col, values):
+        categorical = pd.Categorical(values)
+        index = self._index[col]
+        vocab = self.vocabularies[col]
+        mapping = np.empty(len(categorical.categories) + 1, dtype=np.int8)
+        for i, value in enumerate(categorical.categories):
+            if value not in index:
+                if len(vocab) >= 127:
+                    raise ValueError(f"Column {col} has more than 127 distinct values")
+                index[value] = len(vocab)
+                vocab.append(value)
+            mapping[i] = index[value]
+        mapping[-1] = -1 # missing values
+        return mapping[categorical.codes]
+
+    def append(self, df):
+        for col in self.columns:
+            self._codes(col, df[col]).tofile(self._spools[col])
+        self.n_rows += len(df)
+
+    def close(self):
+        for spool in self._spools.values():
+            spool.close()
+        codes = np.lib.format.open_memmap(self.prefix + CODES_SUFFIX + '.tmp', mode='w+', dtype=np.int8,
+                                          shape=(len(self.columns), self.n_rows))
+        for i, col in enumerate(self.columns):
+            spool_path = f"{self.prefix}.{i}.tmp"
+            codes[i] = np.fromfile(spool_path, dtype=np.int8)
+            os.remove(spool_path)
+        codes.flush()
+        del codes
+        with open(self.prefix + VOCAB_SUFFIX + '.tmp', 'w') as f:
+            json.dump({'columns': self.columns, 'vocabularies': self.vocabularies, 'n_rows': self.n_rows}, f, indent=1)
+        os.replace(self.prefix + CODES_SUFFIX + '.tmp', self.prefix + CODES_SUFFIX)
+        os.replace(self.prefix + VOCAB_SUFFIX + '.tmp', self.prefix + VOCAB_SUFFIX)
+
+
+def write_columnar(df, prefix, vocabularies=None):
+    writer = ColumnarWriter(prefix, df.columns, vocabularies)
+    writer.append(df)
+    writer.close()
+
+
+def load_columnar(prefix, mmap=True):
+    """
+    DataFrame of `category` columns whose codes are read from the memory-mapped `.npy`.
+    """
+    with open(prefix + VOCAB_SUFFIX) as f:
+        meta = json.load(f)
+    codes = np.load(prefix + CODES_SUFFIX, mmap_mode='r' if mmap else None)
+    # copy=False: the columns keep the mapped codes instead of copies of them, so they are read-only
+    return pd.DataFrame({
+        col: pd.Categorical.from_codes(codes[i], categories=meta['vocabularies'][col])
+        for i, col in enumerate(meta['columns'])
+    }, copy=False)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write the columnar copy of a cleaned delay dataset CSV")
+    parser.add_argument('csv', help="e.g. src/data_clean_dataframe.csv")
+    args = parser.parse_args()
+    prefix = columnar_prefix(args.csv)
+    write_columnar(pd.read_csv(args.csv, dtype='category'), prefix)
+    print(f"Wrote {prefix}{CODES_SUFFIX} and {prefix}{VOCAB_SUFFIX}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from columnar import CODES_SUFFIX, VOCAB_SUFFIX, columnar_exists
+
+
+# Count cube of the cleaned delay dataset.
+# All columns are categorical, so the dataset is summarized by the number of rentals for every
+# combination of their values (2 x 2 x 2 x 2 x 9 x 9 cells). Filters and graph data are slices and
+# sums of this small array, whatever the number of rentals.
+# The cube is written by delay_etl.py in `<prefix>.cube.npy`, next to the columnar file.
+
+CUBE_SUFFIX = '.cube.npy'
+
+
+def build_cube(prefix, chunksize=1000000):
+    """
+    Count cube of the columnar file `prefix`, reading the codes chunk by chunk.
+    """
+    with open(prefix + VOCAB_SUFFIX) as f:
+        meta = json.load(f)
+    shape = tuple(len(meta['vocabularies'][col]) for col in meta['columns'])
+    codes = np.load(prefix + CODES_SUFFIX, mmap_mode='r')
+    counts = np.zeros(int(np.prod(shape)), dtype=np.int64)
+    for start in range(0, codes.shape[1], chunksize):
+        chunk = np.asarray(codes[:, start:start + chunksize], dtype=np.int64)
+        chunk = chunk[:, (chunk >= 0).all(axis=0)] # rows with a missing value are not counted
+        counts += np.bincount(np.ravel_multi_index(tuple(chunk), shape), minlength=len(counts))
+    return CountCube(counts.reshape(shape), meta['columns'], meta['vocabularies'])
+
+
+class CountCube:
+    """
+    Number of rows for each combination of category values, with one axis per column.
+    """
+
+    def __init__(self, counts, columns, vocabularies):
+        self.counts = counts
+        self.columns = list(columns)
+        self.vocabularies = {col: list(vocabularies[col]) for col in self.columns}
+
+    @classmethod
+    def load(cls, prefix):
+        """
+        Cube saved by `save`, or built from the columnar file when it is missing.
+        """
+        try:
+            counts = np.load(prefix + CUBE_SUFFIX)
+        except FileNotFoundError:
+            if not columnar_exists(prefix):
+                raise
+            return build_cube(prefix)
+        with open(prefix + VOCAB_SUFFIX) as f:
+            meta = json.load(f)
+        return cls(counts, meta['columns'], meta['vocabularies'])
+
+    @classmethod
+    def from_frame(cls, data):
+        """
+        Cube of a DataFrame of `category` columns.
+        """
+        columns = list(data.columns)
+        vocabularies = {col: list(data[col].cat.categories) for col in columns}
+        shape = tuple(len(vocabularies[col]) for col in columns)
+        codes = np.stack([data[col].cat.codes.to_numpy() for col in columns]).astype(np.int64)
+        codes = codes[:, (codes >= 0).all(axis=0)]
+        counts = np.bincount(np.ravel_multi_index(tuple(codes), shape), minlength=int(np.prod(shape)))
+        return cls(counts.reshape(shape), columns, vocabularies)
+
+    def save(self, prefix):
+        np.save(prefix + CUBE_SUFFIX, self.counts)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def filter(self, **selection):
+        """
+        Sub-cube of the rows whose values are in the selection, e.g. `cube.filter(state='ended')`
+        or `cube.filter(delay_types=['No_delay', '1h to 3h'])`.
+        """
+        index = []
+        for col in self.columns:
+            if col in selection:
+                values = selection[col]
+                values = [values] if isinstance(values, str) else list(values)
+                mask = np.isin(self.vocabularies[col], values)
+                index.append(mask)
+            else:
+                index.append(slice(None))
+        counts = self.counts
+        for axis, selected in enumerate(index):
+            if not isinstance(selected, slice):
+                counts = np.compress(selected, counts, axis=axis)
+        vocabularies = {col: [v for v, keep in zip(self.vocabularies[col], index[i]) if keep]
+                        if not isinstance(index[i], slice) else self.vocabularies[col]
+                        for i, col in enumerate(self.columns)}
+        return CountCube(counts, self.columns, vocabularies)
+
+    def value_counts(self, col):
+        axis = self.columns.index(col)
+        other_axes = tuple(i for i in range(len(self.columns)) if i != axis)
+        return pd.Series(self.counts.sum(axis=other_axes), index=self.vocabularies[col], name='count')
+
+    def bar_data(self, col, drop_empty=True):
+        """
+        Counts and percentages of `col`, in vocabulary order, ready for `px.bar(x=col, y='percent')`.
+        """
+        counts = self.value_counts(col)
+        if drop_empty:
+            counts = counts[counts > 0]
+        total = counts.sum()
+        return pd.DataFrame({col: counts.index, 'count': counts.to_numpy(),
+                             'percent': counts.to_numpy() / total * 100 if total else 0.0})
+
+
+def load_cube(prefix):
+    """
+    Cube of the dataset `prefix`: saved cube, columnar file, or CSV, in that order.
+    """
+    try:
+        return CountCube.load(prefix)
+    except FileNotFoundError:
+        return CountCube.from_frame(pd.read_csv(prefix + '.csv', dtype='category'))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write the count cube of a columnar delay dataset")
+    parser.add_argument('prefix', help="e.g. src/data_clean_dataframe")
+    args = parser.parse_args()
+    if not columnar_exists(args.prefix):
+        raise SystemExit(f"No columnar file for {args.prefix}, run columnar.py first")
+    cube = build_cube(args.prefix)
+    cube.save(args.prefix)
+    print(f"Wrote {args.prefix}{CUBE_SUFFIX}: {cube.counts.shape} cells, {cube.total} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import hashlib
+import os
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from columnar import CODES_SUFFIX, VOCAB_SUFFIX, columnar_exists, columnar_prefix, load_columnar
+from cube import CUBE_SUFFIX, load_cube
+from revenue import RevenueImpact, model_predict
+from simulator import SCOPES, ThresholdSimulator
+from timeline import RentalTimeline
+
+
+# Data layer of the dashboard, imported by app.py and streamlit_getaround.py.
+# Everything derived from a data file (dataset, filtered count cubes, figures, simulator, revenue,
+# timeline) is built once per content hash of the files it reads and kept with st.cache_resource, so
+# all the sessions of the server share the same objects and a rerun only costs a `stat` of the files.
+# When a file changes, its new hash is a new cache key: the objects are built again on the next run.
+# Objects are shared between sessions: pages read them and must not modify them.
+
+DATA_URL = 'src/data_clean_dataframe.csv'
+RAW_DATA_URL = 'src/get_around_delay_analysis.xlsx'
+PRICING_DATA_URL = 'src/get_around_pricing_project.csv'
+MODEL_URL = '../fast_API_getaround/model.joblib'
+
+THRESHOLDS = range(0, 721, 15)
+PRICE_SOURCES = ['Listing price (rental_price_per_day)', 'Pricing model']
+
+# {view: (parent view, filter)}, the filtered datasets of questions 1 and 2
+VIEWS = {
+    'F1': ('all', {'previous_rental': 'Yes'}),
+    'F2': ('F1', {'is_delay': 'Yes'}),
+    'F3': ('F2', {'state': 'canceled'}),
+    'F4': ('F2', {'state': 'ended'}),
+    'F5': ('all', {'state': 'canceled'}),
+}
+
+# {graph number: (view, column)}, bar charts of questions 1 and 2
+BAR_CHARTS = {
+    1: ('F1', 'is_delay'),
+    2: ('F2', 'state'),
+    3: ('F2', 'delay_types'),
+    4: ('F2', 'time_delta'),
+    5: ('F3', 'delay_types'),
+    6: ('F3', 'time_delta'),
+    7: ('F3', 'checkin_type'),
+    8: ('F4', 'delay_types'),
+    9: ('F4', 'time_delta'),
+    10: ('F5', 'checkin_type'),
+}
+
+# (path, size, mtime) -> sha256 of the content, so a file is hashed again only when it changes
+_digests = {}
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = _digests[key] = h.hexdigest()
+    return digest
+
+
+def price_sources():
+    return PRICE_SOURCES if os.path.exists(MODEL_URL) else PRICE_SOURCES[:1]
+
+
+def _dataset_key(path):
+    # the columnar file when delay_etl.py wrote one, the CSV otherwise
+    prefix = columnar_prefix(path)
+    paths = [prefix + CODES_SUFFIX, prefix + VOCAB_SUFFIX] if columnar_exists(prefix) else [path]
+    return tuple(file_digest(p) for p in paths)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _dataset(path, digests):
+    # Columnar copy written by delay_etl.py: memory-mapped int8 codes loaded as `category` columns
+    prefix = columnar_prefix(path)
+    if columnar_exists(prefix):
+        return load_columnar(prefix)
+    return pd.read_csv(path, dtype='category')
+
+
+def dataset(path=DATA_URL):
+    return _dataset(path, _dataset_key(path))
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _preview(path, digests, rows):
+    return _dataset(path, digests).head(rows)
+
+
+def preview(rows=10, path=DATA_URL):
+    return _preview(path, _dataset_key(path), rows)
+
+
+def bar_chart(cube, x):
+    # same bars as px.histogram(data, x=x, histnorm='percent'), from pre-aggregated counts
+    return px.bar(cube.bar_data(x), x=x, y='percent', hover_data=['count'])
+
+
+def _cube_key(path):
+    # the saved cube when there is one, and the dataset it falls back to (see cube.load_cube)
+    cube_path = columnar_prefix(path) + CUBE_SUFFIX
+    return (file_digest(cube_path) if os.path.exists(cube_path) else None,) + _dataset_key(path)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _bar_charts(path, digests):
+    # Graphs are drawn from a count cube of the dataset (one count per combination of values),
+    # so the filtered views are slices of a small array instead of copies of the data
+    views = {'all': load_cube(columnar_prefix(path))}
+    for name, (parent, condition) in VIEWS.items():
+        views[name] = views[parent].filter(**condition)
+    return {number: bar_chart(views[view], x) for number, (view, x) in BAR_CHARTS.items()}
+
+
+def bar_charts(path=DATA_URL):
+    """
+    Figures of graphs 1 to 10, by graph number.
+    """
+    return _bar_charts(path, _cube_key(path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _simulator(path, digest):
+    return ThresholdSimulator.from_path(path)
+
+
+def simulator(path=RAW_DATA_URL):
+    return _simulator(path, file_digest(path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _threshold_figure(path, digest, scope):
+    sweep = _simulator(path, digest).simulate(THRESHOLDS, scope)
+    return px.line(sweep, x='threshold', y=['blocked_share', 'solved_share'],
+                   labels={'threshold': 'Threshold (minutes)', 'value': 'Percent'})
+
+
+def threshold_figure(scope, path=RAW_DATA_URL):
+    """
+    Figure of graph 11: blocked rentals and solved cases depending on the threshold.
+    """
+    return _threshold_figure(path, file_digest(path), scope)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _revenue_impact(model_path, digests):
+    if model_path is not None:
+        return RevenueImpact.from_paths(RAW_DATA_URL, PRICING_DATA_URL, predict=model_predict(model_path))
+    return RevenueImpact.from_paths(RAW_DATA_URL, PRICING_DATA_URL)
+
+
+def _revenue_key(price_source):
+    # the delay and pricing datasets, and the model when it gives the prices
+    model_path = MODEL_URL if price_source == 'Pricing model' else None
+    paths = [RAW_DATA_URL, PRICING_DATA_URL] + ([model_path] if model_path else [])
+    return model_path, tuple(file_digest(path) for path in paths)
+
+
+def revenue_impact(price_source):
+    # Each car of the delay dataset is given a listing of the pricing dataset (see revenue.py)
+    return _revenue_impact(*_revenue_key(price_source))
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _revenue_figure(model_path, digests):
+    impact = _revenue_impact(model_path, digests)
+    sweep = pd.concat([impact.affected(THRESHOLDS, s).assign(scope=s) for s in SCOPES])
+    return px.line(sweep, x='threshold', y='affected_share', color='scope', hover_data=['affected_revenue'],
+                   labels={'threshold': 'Threshold (minutes)', 'affected_share': 'Revenue affected (%)'})
+
+
+def revenue_figure(price_source):
+    """
+    Figure of graph 12: share of the revenue affected depending on the threshold, for every scope.
+    """
+    return _revenue_figure(*_revenue_key(price_source))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _timeline(path, digest):
+    return RentalTimeline.from_path(path)
+
+
+def timeline(path=RAW_DATA_URL):
+    return _timeline(path, file_digest(path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _chain_length_figure(path, digest, scope):
+    lengths = _timeline(path, digest).chain_lengths(scope)
+    return px.bar(x=lengths.index.astype(str), y=lengths.values,
+                  labels={'x': 'Rentals in a row', 'y': 'Late returns'})
+
+
+def chain_length_figure(scope, path=RAW_DATA_URL):
+    """
+    Figure of graph 13: number of rentals in a row pushed back by one late return.
+    """
+    return _chain_length_figure(path, file_digest(path), scope)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _pricing_cars(path, digest):
+    return pd.read_csv(path, index_col=0)
+
+
+def pricing_cars(path=PRICING_DATA_URL):
+    """
+    Cars of the pricing dataset, with their features and listing price.
+    """
+    return _pricing_cars(path, file_digest(path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _pricing_model(path, digest):
+    return model_predict(path)
+
+
+def pricing_model(path=MODEL_URL):
+    """
+    `predict` of the pricing model file, None when there is no model file.
+    """
+    if not os.path.exists(path):
+        return None
+    return _pricing_model(path, file_digest(path))
+
+
+def pricing_fallback(features):
+    """
+    Prices of `features` with the model file, the fallback of the pricing page when the API gives no price.
+    The model is only loaded on the first call, and a missing file or library is raised as an error of the cars.
+    """
+    try:
+        predict = pricing_model()
+    except ImportError as error:
+        raise RuntimeError(f"pricing in-process needs joblib and scikit-learn ({error})") from error
+    if predict is None:
+        raise FileNotFoundError(f"no model file at {MODEL_URL} to price in-process")
+    return predict(features)
@@ -0,0 +1,139 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar import ColumnarWriter, columnar_prefix
+from cube import build_cube
+
+
+# ETL of the delay analysis dataset (PART_3_Formated_Dataset.ipynb).
+# Reads `get_around_delay_analysis.xlsx` (or a CSV export of it) in chunks, bins the delay and
+# time delta columns with vectorized NumPy code on shared bin edges, and appends every formatted
+# chunk to the output file, so memory stays bounded by the chunk size. A columnar copy with
+# dictionary encoded columns (see columnar.py) and its count cube (see cube.py) are written next to the CSV.
+# Usage: python delay_etl.py src/get_around_delay_analysis.xlsx src/data_clean_dataframe.csv
+
+RAW_COLUMNS = ['rental_id', 'car_id', 'checkin_type', 'state', 'delay_at_checkout_in_minutes',
+               'previous_ended_rental_id', 'time_delta_with_previous_rental_in_minutes']
+CLEAN_COLUMNS = ['checkin_type', 'state', 'previous_rental', 'is_delay', 'delay_types', 'time_delta']
+
+# Bins on the absolute number of minutes, shared by both columns: [0, 60) [60, 180) ... [1440, 2880) [2880, +inf)
+# Exactly 0 and exactly 1440 minutes have their own labels.
+BIN_EDGES = np.array([60, 180, 360, 720, 1440, 2880])
+ONE_DAY = 1440
+
+DELAY_TYPES = ['No_delay', 'Less than an hours', '1h to 3h', '3h to 6h', '6h to 12h', '12h to 24h',
+               'One day', 'Two day', 'More than 3 days']
+TIME_DELTAS = ['No_time_delta'] + DELAY_TYPES[1:]
+VOCABULARIES = {'previous_rental': ['No', 'Yes'], 'is_delay': ['No', 'Yes'],
+                'delay_types': DELAY_TYPES, 'time_delta': TIME_DELTAS}
+
+
+def bin_codes(minutes):
+    """
+    Index in DELAY_TYPES (or TIME_DELTAS) of each number of minutes, as int8.
+    Missing values count as 0 minutes.
+    """
+    minutes = np.abs(np.nan_to_num(np.asarray(minutes, dtype=np.float64)))
+    # +1 as label 0 is the "no delay" label
+    codes = (np.searchsorted(BIN_EDGES, minutes, side='right') + 1).astype(np.int8)
+    # the "One day" label sits between "12h to 24h" and "Two day"
+    codes[codes >= DELAY_TYPES.index('One day')] += 1
+    codes[minutes == 0] = 0
+    codes[minutes == ONE_DAY] = DELAY_TYPES.index('One day')
+    return codes
+
+
+def bin_minutes(minutes, labels=DELAY_TYPES):
+    return pd.Categorical.from_codes(bin_codes(minutes), categories=labels)
+
+
+def yes_no(condition):
+    return pd.Categorical.from_codes(condition.astype(np.int8), categories=['No', 'Yes'])
+
+
+def formating_data(data):
+    """
+    Vectorized version of `formating_data` of the notebooks, returns a new DataFrame with CLEAN_COLUMNS
+    as `category` columns and does not modify `data`.
+    As in the notebooks, `is_delay` is "No" when the car was returned late (positive delay).
+    """
+    delay = data['delay_at_checkout_in_minutes'].fillna(0).to_numpy(dtype=np.float64)
+    previous = data['previous_ended_rental_id'].fillna(0).to_numpy(dtype=np.float64)
+    time_delta = data['time_delta_with_previous_rental_in_minutes'].fillna(0).to_numpy(dtype=np.float64)
+    return pd.DataFrame({
+        'checkin_type': pd.Categorical(data['checkin_type']),
+        'state': pd.Categorical(data['state']),
+        'previous_rental': yes_no(previous != 0),
+        'is_delay': yes_no(delay <= 0),
+        'delay_types': bin_minutes(delay, DELAY_TYPES),
+        'time_delta': bin_minutes(time_delta, TIME_DELTAS),
+    }, index=data.index)
+
+
+def read_chunks(path, chunksize=100000, sheet_name='rentals_data'):
+    """
+    Yield the raw dataset as DataFrames of at most `chunksize` rows, from an xlsx or a CSV file.
+    """
+    if path.endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            # read-only sheets can report extra empty columns
+            header = [name for name in next(rows) if name is not None]
+            width = len(header)
+            chunk = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                chunk.append(row[:width])
+                if len(chunk) == chunksize:
+                    yield pd.DataFrame.from_records(chunk, columns=header)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame.from_records(chunk, columns=header)
+        finally:
+            workbook.close()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def run(input_path, output_path, chunksize=100000, columnar=True):
+    """
+    Format `input_path` chunk by chunk into the CSV `output_path`, and its columnar copy and
+    count cube unless `columnar` is False. Returns the number of rows written.
+    """
+    tmp_path = output_path + '.tmp'
+    writer = ColumnarWriter(columnar_prefix(output_path), CLEAN_COLUMNS, VOCABULARIES) if columnar else None
+    n_rows = 0
+    with open(tmp_path, 'w', newline='') as f:
+        for chunk in read_chunks(input_path, chunksize):
+            clean = formating_data(chunk)
+            clean.to_csv(f, index=False, header=n_rows == 0)
+            if writer is not None:
+                writer.append(clean)
+            n_rows += len(chunk)
+    os.replace(tmp_path, output_path)
+    if writer is not None:
+        writer.close()
+        build_cube(writer.prefix).save(writer.prefix)
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Format the Getaround delay analysis dataset")
+    parser.add_argument('input', help="get_around_delay_analysis.xlsx or a CSV export of it")
+    parser.add_argument('output', help="formatted CSV, e.g. src/data_clean_dataframe.csv")
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--no-columnar', action='store_true', help="only write the CSV")
+    args = parser.parse_args()
+    n_rows = run(args.input, args.output, args.chunksize, columnar=not args.no_columnar)
+    print(f"Wrote {n_rows} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import time
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import data_layer
+from pricing_client import API_URL, price_cars
+
+### Config
+st.set_page_config(
+    page_title="Getaround pricing",
+    layout="wide"
+)
+
+###  Set a title and presentation
+st.title("Getaround Pricing")
+
+st.markdown("""
+    Here you can price the cars of the pricing dataset with the pricing API.
+    * Cars are sent to the API in chunks, several chunks at a time, and the table fills in as the prices come back.
+    * When the API cannot be reached, cars are priced here with the same model file.
+""")
+
+#################################################################################
+#####                                                                       #####
+#####                         CREATING OF SIDE BAR                          #####
+#####                                                                       #####
+#################################################################################
+
+cars = data_layer.pricing_cars()
+
+st.sidebar.header('Pricing API')
+api_url = st.sidebar.text_input('API url :', API_URL)
+n_cars = st.sidebar.slider('Number of cars :', 100, len(cars), min(1000, len(cars)), step=100)
+concurrency = st.sidebar.slider('Requests at a time :', 1, 32, 8)
+chunk_size = st.sidebar.select_slider('Cars per chunk :', [50, 100, 250, 500, 1000], 500)
+per_car = st.sidebar.checkbox('One request per car (/predict)', False)
+start = st.sidebar.button('Price the cars')
+
+#################################################################################
+#####                                                                       #####
+#####                               PRICING                                 #####
+#####                                                                       #####
+#################################################################################
+
+st.header("Predicted price against listing price")
+
+selection = cars.head(n_cars)
+progress = st.progress(0.0)
+col1, col2, col3 = st.columns(3)
+metric1, metric2, metric3 = col1.empty(), col2.empty(), col3.empty()
+table = st.empty()
+
+def show(result, done, elapsed):
+    # called after every chunk: the cars priced so far, in dataset order
+    progress.progress(done / len(selection))
+    metric1.metric("Cars priced", f"{done} / {len(selection)}")
+    metric2.metric("Priced by the API", f"{(result['source'] == 'api').sum()}",
+                   f"{(result['source'] == 'in-process').sum()} in-process", delta_color="off")
+    metric3.metric("Cars per second", f"{done / elapsed:,.0f}")
+    table.dataframe(result.join(selection[['model_key', 'mileage', 'engine_power', 'rental_price_per_day']]))
+
+if start:
+    begin = time.perf_counter()
+    chunks = []
+
+    def on_chunk(chunk, done):
+        chunks.append(chunk)
+        show(pd.concat(chunks).sort_index(), done, time.perf_counter() - begin)
+
+    result = price_cars(selection, on_chunk=on_chunk, base_url=api_url, concurrency=concurrency,
+                        chunk_size=chunk_size, per_car=per_car, fallback=data_layer.pricing_fallback)
+    st.session_state['pricing'] = (result, time.perf_counter() - begin)
+elif 'pricing' in st.session_state:
+    result, elapsed = st.session_state['pricing']
+    selection = cars.loc[result.index]
+    show(result, len(result), elapsed)
+else:
+    st.markdown("Choose the cars and the client settings in the sidebar, then click **Price the cars**.")
+
+if 'pricing' in st.session_state:
+    result, elapsed = st.session_state['pricing']
+    errors = result['error'].dropna().unique()
+    if len(errors):
+        st.warning(f"Some cars were not priced by the API : {errors[0]}")
+
+    ######## GRAPH 1 #########
+
+    st.subheader("Graph 1 - Predicted price against listing price")
+    compared = result.join(cars[['rental_price_per_day', 'car_type']])
+    fig1 = px.scatter(compared, x='rental_price_per_day', y='prediction', color='car_type',
+                      labels={'rental_price_per_day': 'Listing price per day', 'prediction': 'Predicted price per day'})
+    st.plotly_chart(fig1)
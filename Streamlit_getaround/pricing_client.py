@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from revenue import MODEL_FEATURES, model_predict
+
+
+# Client of the pricing API (fast_API_getaround) used by the pricing page.
+# Cars are sent in chunks to /predict/batch, or one by one to /predict (`per_car`), over a single
+# httpx.AsyncClient: keep-alive connections are pooled and reused, at most `concurrency` requests are
+# in flight, and every request has a timeout. Connection errors, timeouts and 502, 503
+# and 504 answers are retried with exponential backoff and jitter (at least the Retry-After of a 503).
+# A chunk the API could not price after the retries is priced in-process with the model file, and
+# once the API cannot be reached at all the remaining chunks skip it, so every car gets a price.
+# Chunks are yielded as they complete, so the page can be drawn while the other chunks are running.
+# Usage: python pricing_client.py src/get_around_pricing_project.csv --api http://localhost:4000 --cars 10000
+
+API_URL = os.environ.get('PRICING_API_URL', 'http://localhost:4000')
+PRICE = 'Predicted rental price per day in dollars'
+RETRY_STATUS = {502, 503, 504}
+
+
+class ApiError(Exception):
+    """
+    Raised when the API gives no price: the request failed after its retries, or the input was rejected.
+    """
+
+
+def payloads(cars):
+    """
+    JSON-ready PredictionFeatures of every car.
+    """
+    return json.loads(cars[MODEL_FEATURES].to_json(orient='records'))
+
+
+class PricingClient:
+    """
+    Prices of many cars from the pricing API, chunk by chunk, with an in-process fallback.
+    `per_car` sends the cars of a chunk one by one to /predict instead of one /predict/batch request.
+    `fallback` is a `predict(features DataFrame)` function, or None to leave unpriced cars as NaN.
+    """
+
+    def __init__(self, base_url=API_URL, concurrency=8, chunk_size=500, per_car=False, timeout=10.0, retries=3,
+                 backoff=0.2, fallback=None):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.per_car = per_car
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.fallback = fallback
+        self.api_down = False
+        self.client = None
+        self.slots = None
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self.client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.timeout)
+        self.slots = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    async def _post(self, url, payload):
+        for attempt in range(self.retries + 1):
+            wait = self.backoff * 2 ** attempt * (1 + random.random())
+            try:
+                response = await self.client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response
+                reason = f"HTTP {response.status_code}"
+                wait = max(wait, float(response.headers.get('Retry-After', 0)))
+            except httpx.TransportError as error:
+                reason = f"{type(error).__name__}: {error}"
+                if isinstance(error, httpx.ConnectError) and attempt == self.retries:
+                    self.api_down = True
+            except httpx.HTTPStatusError as error:
+                # input the API rejects (422, 413): retrying would not help
+                raise ApiError(f"HTTP {error.response.status_code}") from error
+            if attempt < self.retries and not self.api_down:
+                await asyncio.sleep(wait)
+        raise ApiError(reason)
+
+    async def _request(self, url, payload):
+        async with self.slots:
+            if self.api_down:
+                raise ApiError(f"{self.base_url} cannot be reached")
+            return await self._post(url, payload)
+
+    async def _predict_one(self, payload):
+        body = (await self._request('/predict', payload)).json()
+        # /predict answers a JSON string with the error message when the model rejects the car
+        if not isinstance(body, dict):
+            raise ApiError(body)
+        return body[PRICE], body['model_version']
+
+    async def _from_api(self, payloads):
+        """
+        Prices of the cars of `payloads` from the API (NaN for the cars it did not price), model version and error.
+        """
+        prices = np.full(len(payloads), np.nan)
+        version, error = None, None
+        if self.per_car:
+            results = await asyncio.gather(*map(self._predict_one, payloads), return_exceptions=True)
+            for i, result in enumerate(results):
+                if isinstance(result, ApiError):
+                    error = str(result)
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    prices[i], version = result
+            return prices, version, error
+        try:
+            response = await self._request('/predict/batch', payloads)
+        except ApiError as exc:
+            return prices, version, str(exc)
+        for line in response.text.splitlines():
+            result = json.loads(line)
+            if 'prediction' in result:
+                prices[result['index']], version = result['prediction'], result['model_version']
+            else:
+                error = result['error']
+        return prices, version, error
+
+    async def _price_chunk(self, cars, payloads):
+        prices, version, error = await self._from_api(payloads)
+        missing = np.isnan(prices)
+        source = np.where(missing, 'in-process', 'api')
+        if missing.any():
+            try:
+                if self.fallback is None:
+                    raise ApiError(error)
+                prices[missing] = np.round(await asyncio.to_thread(self.fallback, cars[MODEL_FEATURES][missing]), 1)
+            except Exception as exc:
+                source[missing], error = 'unpriced', str(exc)
+        return pd.DataFrame({'prediction': prices, 'source': source, 'model_version': version, 'error': error},
+                            index=cars.index)
+
+    async def price(self, cars):
+        """
+        Yield one DataFrame per chunk of `cars` (same index), in the order chunks complete.
+        """
+        features = payloads(cars)
+        tasks = [asyncio.ensure_future(self._price_chunk(cars.iloc[start:start + self.chunk_size],
+                                                         features[start:start + self.chunk_size]))
+                 for start in range(0, len(cars), self.chunk_size)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def price_cars(cars, on_chunk=None, **options):
+    """
+    Prices of all `cars`, in their order. `on_chunk(chunk, done)` is called after every chunk,
+    with the number of cars priced so far.
+    """
+    async def run():
+        chunks = []
+        async with PricingClient(**options) as client:
+            async for chunk in client.price(cars):
+                chunks.append(chunk)
+                if on_chunk is not None:
+                    on_chunk(chunk, sum(len(c) for c in chunks))
+        return pd.concat(chunks).reindex(cars.index) if chunks else pd.DataFrame(index=cars.index)
+
+    return asyncio.run(run())
+
+
+def client_options(args):
+    return {'base_url': args.api, 'concurrency': args.concurrency, 'chunk_size': args.chunk_size,
+            'per_car': args.per_car, 'timeout': args.timeout, 'retries': args.retries,
+            'fallback': model_predict(args.model) if args.model else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price cars of the pricing dataset with the API")
+    parser.add_argument('path', help="get_around_pricing_project.csv")
+    parser.add_argument('--api', default=API_URL)
+    parser.add_argument('--cars', type=int, default=10000, help="cars drawn from the dataset (with replacement)")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=500, help="cars per /predict/batch request")
+    parser.add_argument('--per-car', action='store_true', help="one /predict request per car")
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--model', help="model file of the in-process fallback (model.joblib)")
+    args = parser.parse_args()
+
+    dataset = pd.read_csv(args.path, index_col=0)
+    cars = dataset.sample(args.cars, replace=args.cars > len(dataset), random_state=0).reset_index(drop=True)
+    start = time.perf_counter()
+    result = price_cars(cars, **client_options(args))
+    duration = time.perf_counter() - start
+    print(f"{len(cars)} cars in {duration:.2f} s ({len(cars) / duration:.0f} cars/s)")
+    print(result['source'].value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main()
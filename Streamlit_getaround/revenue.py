@@ -0,0 +1,157 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from simulator import CHECKIN_TYPES, SCOPES, STATES, load_raw_arrays
+
+
+# Revenue impact of the threshold, on the raw delay dataset joined with daily rental prices.
+# The delay dataset has no car attributes and the pricing dataset has no car_id, so every car_id is
+# given one listing of get_around_pricing_project.csv: cars with at least one Connect check-in among
+# the listings with `has_getaround_connect`, the other cars among the remaining ones, picked by a hash
+# of the car_id (the same car always gets the same listing). Each ended rental is counted as one day
+# at the daily price of its listing: `rental_price_per_day`, or the price predicted by the pricing model.
+# Rentals are sorted once per scope by time delta with the cumulative revenue, so the revenue blocked
+# by any threshold is a binary search, and results are kept per (threshold, scope).
+# Usage: python revenue.py src/get_around_delay_analysis.xlsx src/get_around_pricing_project.csv --threshold 180
+
+PRICE_COLUMN = 'rental_price_per_day'
+MODEL_FEATURES = ['model_key', 'mileage', 'engine_power', 'fuel', 'paint_color', 'car_type',
+                  'private_parking_available', 'has_gps', 'has_air_conditioning', 'automatic_car',
+                  'has_getaround_connect', 'has_speed_regulator', 'winter_tires']
+
+
+def listing_prices(pricing, predict=None):
+    """
+    Daily price of every listing: `rental_price_per_day`, or `predict(features)` of the pricing model.
+    """
+    if predict is None:
+        return pricing[PRICE_COLUMN].to_numpy(dtype=np.float64)
+    return np.asarray(predict(pricing[MODEL_FEATURES]), dtype=np.float64)
+
+
+def model_predict(path):
+    """
+    `predict` of the pricing model saved by the API (model.joblib), scikit-learn is imported here only.
+    """
+    import joblib
+
+    return joblib.load(path).predict
+
+
+def hash_ids(ids):
+    """
+    Well mixed unsigned 64 bits hash of integer ids (splitmix64 finalizer).
+    """
+    h = np.asarray(ids, dtype=np.float64).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+
+def rental_prices(arrays, prices, connect_listings):
+    """
+    Daily price of every rental of the delay dataset, through the listing given to its car.
+    """
+    cars, car_index = np.unique(arrays['car_id'], return_inverse=True)
+    is_connect = arrays['checkin_type'] == CHECKIN_TYPES.index('connect')
+    connect_car = np.bincount(car_index, weights=is_connect, minlength=len(cars)) > 0
+
+    connect_pool = np.flatnonzero(connect_listings)
+    other_pool = np.flatnonzero(~connect_listings)
+    # a car falls back on every listing when its pool is empty
+    if len(connect_pool) == 0:
+        connect_pool = np.arange(len(prices))
+    if len(other_pool) == 0:
+        other_pool = np.arange(len(prices))
+
+    h = hash_ids(cars)
+    listing = np.where(connect_car,
+                       connect_pool[(h % np.uint64(len(connect_pool))).astype(np.int64)],
+                       other_pool[(h % np.uint64(len(other_pool))).astype(np.int64)])
+    return prices[listing][car_index]
+
+
+class RevenueImpact:
+    """
+    Revenue of the rentals blocked by any threshold (minutes) and scope.
+    """
+
+    def __init__(self, arrays, prices):
+        time_delta = arrays['time_delta']
+        checkin_type = arrays['checkin_type']
+        ended = arrays['state'] == STATES.index('ended')
+        chained = ~np.isnan(time_delta)
+
+        self.scopes = {}
+        for scope, checkin in SCOPES.items():
+            in_scope = ended if checkin is None else ended & (checkin_type == CHECKIN_TYPES.index(checkin))
+            blockable = in_scope & chained
+            order = np.argsort(time_delta[blockable], kind='stable')
+            self.scopes[scope] = {
+                'revenue': float(prices[in_scope].sum()),
+                'time_delta': time_delta[blockable][order],
+                # cumulative[i] is the revenue of the i rentals with the smallest time delta
+                'cumulative': np.concatenate([[0.0], np.cumsum(prices[blockable][order])]),
+            }
+        self._results = {scope: {} for scope in self.scopes}
+
+    @classmethod
+    def from_paths(cls, delay_path, pricing_path, predict=None, cache=True):
+        arrays = load_raw_arrays(delay_path, cache=cache)
+        pricing = pd.read_csv(pricing_path, index_col=0)
+        prices = rental_prices(arrays, listing_prices(pricing, predict),
+                               pricing['has_getaround_connect'].to_numpy(dtype=bool))
+        return cls(arrays, prices)
+
+    def _blocked(self, thresholds, scope):
+        s = self.scopes[scope]
+        return s['cumulative'][np.searchsorted(s['time_delta'], thresholds, side='left')]
+
+    def affected(self, thresholds, scope='All cars'):
+        """
+        DataFrame with one row per threshold: revenue of the blocked rentals, revenue of the scope and
+        share of it. Only the thresholds not computed yet for this scope are searched.
+        """
+        thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+        results = self._results[scope]
+        missing = np.array([t for t in np.unique(thresholds).tolist() if t not in results])
+        if len(missing):
+            results.update(zip(missing.tolist(), self._blocked(missing, scope).tolist()))
+        blocked = np.array([results[t] for t in thresholds.tolist()])
+        revenue = self.scopes[scope]['revenue']
+        return pd.DataFrame({
+            'threshold': thresholds,
+            'affected_revenue': blocked,
+            'scope_revenue': revenue,
+            'affected_share': blocked / revenue * 100 if revenue else 0.0,
+        })
+
+    def at(self, threshold, scope='All cars'):
+        """
+        Results for one threshold, as a dict.
+        """
+        return self.affected([threshold], scope).iloc[0].to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Revenue affected by a minimum time between two rentals")
+    parser.add_argument('delay', help="get_around_delay_analysis.xlsx or a CSV export of it")
+    parser.add_argument('pricing', help="get_around_pricing_project.csv")
+    parser.add_argument('--model', help="price with this pricing model (model.joblib) instead of rental_price_per_day")
+    parser.add_argument('--threshold', type=float, action='append', help="minutes, can be repeated")
+    args = parser.parse_args()
+    if args.model and not os.path.exists(args.model):
+        raise SystemExit(f"No model at {args.model}")
+    impact = RevenueImpact.from_paths(args.delay, args.pricing, model_predict(args.model) if args.model else None)
+    thresholds = args.threshold or list(range(0, 721, 60))
+    for scope in SCOPES:
+        print(f"--- {scope} ---")
+        print(impact.affected(thresholds, scope).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from delay_etl import read_chunks
+
+
+# Threshold / scope simulator on the raw delay dataset (get_around_delay_analysis.xlsx).
+# A threshold of T minutes blocks every rental booked less than T minutes after the previous one on
+# the same car. A problem case is a rental whose previous driver came back later than the time delta
+# between the two rentals: the next driver had to wait. A blocked problem case is a solved one.
+# Every column needed is sorted once per scope, then any threshold is answered with `searchsorted`.
+
+SCOPES = {
+    'All cars': None,
+    'Connect only': 'connect',
+    'Mobile only': 'mobile',
+}
+CHECKIN_TYPES = ['connect', 'mobile']
+STATES = ['ended', 'canceled']
+RAW_ARRAYS = ['rental_id', 'car_id', 'checkin_type', 'state', 'delay', 'previous_rental_id', 'time_delta']
+
+
+def load_raw_arrays(path, cache=True):
+    """
+    Columns used by the simulator, as NumPy arrays. Read from the xlsx (or CSV) in chunks, and cached
+    next to it in `<path>.raw.npz` until the source file changes. Without write access to the data
+    directory (read-only container or volume), the arrays are read from the source file every time.
+    """
+    cache_path = path + '.raw.npz'
+    if cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        arrays = dict(np.load(cache_path))
+        if set(arrays) == set(RAW_ARRAYS):
+            return arrays
+
+    parts = {name: [] for name in RAW_ARRAYS}
+    for chunk in read_chunks(path):
+        parts['rental_id'].append(chunk['rental_id'].to_numpy(dtype=np.float64))
+        parts['car_id'].append(chunk['car_id'].to_numpy(dtype=np.float64))
+        parts['checkin_type'].append(pd.Categorical(chunk['checkin_type'], categories=CHECKIN_TYPES).codes.astype(np.int8))
+        parts['state'].append(pd.Categorical(chunk['state'], categories=STATES).codes.astype(np.int8))
+        parts['delay'].append(chunk['delay_at_checkout_in_minutes'].to_numpy(dtype=np.float64))
+        parts['previous_rental_id'].append(chunk['previous_ended_rental_id'].to_numpy(dtype=np.float64))
+        parts['time_delta'].append(chunk['time_delta_with_previous_rental_in_minutes'].to_numpy(dtype=np.float64))
+    arrays = {name: np.concatenate(values) for name, values in parts.items()}
+    if cache:
+        try:
+            np.savez(cache_path, **arrays)
+        except OSError:
+            pass
+    return arrays
+
+
+def previous_delays(rental_id, delay, previous_rental_id):
+    """
+    Delay at checkout of the previous rental of every rental, NaN when unknown.
+    """
+    order = np.argsort(rental_id, kind='stable')
+    sorted_ids = rental_id[order]
+    has_previous = ~np.isnan(previous_rental_id)
+    position = np.searchsorted(sorted_ids, previous_rental_id[has_previous])
+    position = np.minimum(position, len(sorted_ids) - 1)
+    found = sorted_ids[position] == previous_rental_id[has_previous]
+    result = np.full(len(rental_id), np.nan)
+    result[np.flatnonzero(has_previous)[found]] = delay[order[position[found]]]
+    return result
+
+
+class ThresholdSimulator:
+    """
+    Blocked rentals and solved problem cases for any threshold (minutes) and scope.
+    """
+
+    def __init__(self, arrays):
+        time_delta = arrays['time_delta']
+        checkin_type = arrays['checkin_type']
+        delay = arrays['delay']
+        previous_delay = previous_delays(arrays['rental_id'], delay, arrays['previous_rental_id'])
+        chained = ~np.isnan(time_delta)
+        problem = chained & (previous_delay > time_delta)
+
+        self.scopes = {}
+        for scope, checkin in SCOPES.items():
+            in_scope = np.ones(len(time_delta), dtype=bool) if checkin is None else checkin_type == CHECKIN_TYPES.index(checkin)
+            late = in_scope & (delay > 0)
+            self.scopes[scope] = {
+                'rentals': int(in_scope.sum()),
+                'time_delta': np.sort(time_delta[in_scope & chained]),
+                'problem_time_delta': np.sort(time_delta[in_scope & problem]),
+                'late_delay': np.sort(delay[late]),
+            }
+
+    @classmethod
+    def from_path(cls, path, cache=True):
+        return cls(load_raw_arrays(path, cache=cache))
+
+    def simulate(self, thresholds, scope='All cars'):
+        """
+        DataFrame with one row per threshold: blocked rentals, solved problem cases, and late
+        checkouts short enough to fit in the threshold, with their shares.
+        """
+        s = self.scopes[scope]
+        thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+        blocked = np.searchsorted(s['time_delta'], thresholds, side='left')
+        solved = np.searchsorted(s['problem_time_delta'], thresholds, side='left')
+        absorbed = np.searchsorted(s['late_delay'], thresholds, side='right')
+        n_problems = len(s['problem_time_delta'])
+        n_late = len(s['late_delay'])
+        return pd.DataFrame({
+            'threshold': thresholds,
+            'blocked_rentals': blocked,
+            'blocked_share': blocked / s['rentals'] * 100 if s['rentals'] else 0.0,
+            'problem_cases': n_problems,
+            'solved_cases': solved,
+            'solved_share': solved / n_problems * 100 if n_problems else 0.0,
+            'late_checkouts_absorbed_share': absorbed / n_late * 100 if n_late else 0.0,
+        })
+
+    def at(self, threshold, scope='All cars'):
+        """
+        Results for one threshold, as a dict.
+        """
+        return self.simulate([threshold], scope).iloc[0].to_dict()
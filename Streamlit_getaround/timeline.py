@@ -0,0 +1,245 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from revenue import hash_ids
+from simulator import CHECKIN_TYPES, SCOPES, STATES, load_raw_arrays
+
+
+# Per-car rental timeline of the raw delay dataset, built once.
+# Rentals are sorted by car then rental_id, with CSR offsets: the rentals of the i-th car are the rows
+# offsets[i]:offsets[i + 1]. A hash index maps a rental_id to its row, which turns every
+# `previous_ended_rental_id` into a row pointer, and the rentals following each rental are kept as a
+# second CSR array (a rental can be followed by several bookings, some of them canceled).
+# A cascade starts at a late return: the next driver waits `delay - time_delta` minutes when it is
+# positive, and if the car then comes back that much late the wait moves on to the following rental.
+# All cascades are followed together, one hop per step over NumPy arrays, so the whole dataset is
+# walked in linear time instead of merging the DataFrame with itself once per hop.
+# Usage: python timeline.py src/get_around_delay_analysis.xlsx --car 159533
+
+MAX_HOPS = 1000 # a chain of previous rentals cannot be longer than the dataset, but guard against loops
+
+
+class HashIndex:
+    """
+    Open addressing hash table (linear probing) from integer keys to their position, built and
+    queried for whole arrays of keys at once.
+    """
+
+    def __init__(self, keys):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        size = 1 << max(4, (2 * len(self.keys) - 1).bit_length()) # load factor below 1/2
+        self.mask = np.uint64(size - 1)
+        self.slots = np.full(size, -1, dtype=np.int64)
+
+        pending = np.arange(len(self.keys))
+        slot = hash_ids(self.keys) & self.mask
+        while len(pending):
+            targets = slot[pending]
+            free = self.slots[targets] == -1
+            # the first key of every free slot gets it, the others probe the next slot
+            claimed, first = np.unique(targets[free], return_index=True)
+            won = np.flatnonzero(free)[first]
+            self.slots[claimed] = pending[won]
+            pending = np.delete(pending, won)
+            slot[pending] = (slot[pending] + np.uint64(1)) & self.mask
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """
+        Position of every key, -1 for keys that are not in the index (or NaN).
+        """
+        keys = np.asarray(keys, dtype=np.float64)
+        result = np.full(len(keys), -1, dtype=np.int64)
+        pending = np.flatnonzero(~np.isnan(keys))
+        query = keys[pending].astype(np.int64)
+        slot = hash_ids(query) & self.mask
+        while len(pending):
+            rows = self.slots[slot]
+            found = rows >= 0
+            found[found] = self.keys[rows[found]] == query[found]
+            result[pending[found]] = rows[found]
+            # stop on a match or an empty slot, probe the next slot otherwise
+            going_on = (rows >= 0) & ~found
+            pending, query = pending[going_on], query[going_on]
+            slot = (slot[going_on] + np.uint64(1)) & self.mask
+        return result
+
+
+def csr(groups, n_groups):
+    """
+    Order of the rows grouped by `groups` (stable) and the offsets of each group.
+    """
+    order = np.argsort(groups, kind='stable')
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=n_groups), out=offsets[1:])
+    return order, offsets
+
+
+def expand(offsets, items, parents):
+    """
+    For every parent, all the items of its CSR group: `(position of the parent, item)` pairs.
+    """
+    counts = offsets[parents + 1] - offsets[parents]
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(parents)), counts)
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, items[offsets[parents][owner] + within]
+
+
+class RentalTimeline:
+    """
+    Rentals of every car in order, with row pointers to the previous and following rentals.
+    """
+
+    def __init__(self, arrays):
+        order = np.lexsort((arrays['rental_id'], arrays['car_id']))
+        self.arrays = {name: values[order] for name, values in arrays.items()}
+        self.cars, car_index = np.unique(self.arrays['car_id'], return_inverse=True)
+        _, self.offsets = csr(car_index, len(self.cars))
+
+        self.index = HashIndex(self.arrays['rental_id'])
+        self.previous = self.index.lookup(self.arrays['previous_rental_id'])
+        has_previous = np.flatnonzero(self.previous >= 0)
+        next_order, self.next_offsets = csr(self.previous[has_previous], len(self.previous))
+        self.next_rows = has_previous[next_order]
+        self._cascades = None
+
+    @classmethod
+    def from_path(cls, path, cache=True):
+        return cls(load_raw_arrays(path, cache=cache))
+
+    def __len__(self):
+        return len(self.previous)
+
+    def rows_of(self, rental_ids):
+        return self.index.lookup(np.atleast_1d(rental_ids))
+
+    def rentals_per_car(self):
+        return pd.Series(np.diff(self.offsets), index=self.cars.astype(np.int64), name='rentals')
+
+    def frame(self, rows):
+        """
+        DataFrame of the rentals at `rows`, with the delay of their previous rental and the wait it caused.
+        """
+        a = self.arrays
+        previous = self.previous[rows]
+        previous_delay = np.where(previous >= 0, a['delay'][np.maximum(previous, 0)], np.nan)
+        return pd.DataFrame({
+            'rental_id': a['rental_id'][rows].astype(np.int64),
+            'car_id': a['car_id'][rows].astype(np.int64),
+            'checkin_type': np.asarray(CHECKIN_TYPES)[a['checkin_type'][rows]],
+            'state': np.asarray(STATES)[a['state'][rows]],
+            'delay': a['delay'][rows],
+            'previous_rental_id': a['previous_rental_id'][rows],
+            'time_delta': a['time_delta'][rows],
+            'previous_delay': previous_delay,
+            'wait': np.clip(previous_delay - a['time_delta'][rows], 0, None),
+        })
+
+    def car(self, car_id):
+        """
+        Timeline of one car, empty when the car is unknown.
+        """
+        i = np.searchsorted(self.cars, car_id)
+        if i == len(self.cars) or self.cars[i] != car_id:
+            return self.frame(np.empty(0, dtype=np.int64))
+        return self.frame(np.arange(self.offsets[i], self.offsets[i + 1]))
+
+    def _follow(self, origins):
+        """
+        Walk the cascades of the late returns at `origins` together, one hop per step.
+        Returns `(origin position, row, hop, wait)` of every rental pushed back.
+        """
+        a = self.arrays
+        lateness = a['delay'][origins]
+        owner = np.arange(len(origins))
+        rows = origins
+        pushed = []
+        for hop in range(1, MAX_HOPS + 1):
+            parent, child = expand(self.next_offsets, self.next_rows, rows)
+            wait = lateness[parent] - a['time_delta'][child]
+            late = wait > 0
+            if not late.any():
+                break
+            owner, rows, lateness = owner[parent[late]], child[late], wait[late]
+            pushed.append((owner, rows, np.full(len(rows), hop), lateness))
+            # a canceled rental gives no car back, its cascade stops there
+            going_on = a['state'][rows] == STATES.index('ended')
+            owner, rows, lateness = owner[going_on], rows[going_on], lateness[going_on]
+        if not pushed:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, np.empty(0)
+        return tuple(np.concatenate(parts) for parts in zip(*pushed))
+
+    def cascades(self, scope='All cars'):
+        """
+        One row per late return that made at least one next driver wait: number of rentals pushed
+        back, how many of them were canceled, total minutes waited and length of the chain.
+        """
+        if self._cascades is None:
+            a = self.arrays
+            origins = np.flatnonzero((a['delay'] > 0) & (self.next_offsets[1:] > self.next_offsets[:-1]))
+            owner, rows, hop, wait = self._follow(origins)
+            n = len(origins)
+            canceled = a['state'][rows] == STATES.index('canceled')
+            result = self.frame(origins)[['rental_id', 'car_id', 'checkin_type', 'delay']]
+            result['pushed_rentals'] = np.bincount(owner, minlength=n)
+            result['canceled_rentals'] = np.bincount(owner, weights=canceled, minlength=n).astype(np.int64)
+            result['total_wait'] = np.bincount(owner, weights=wait, minlength=n)
+            depth = np.zeros(n, dtype=np.int64)
+            np.maximum.at(depth, owner, hop)
+            result['chain_length'] = depth
+            self._cascades = result[result['pushed_rentals'] > 0].reset_index(drop=True)
+        checkin = SCOPES[scope]
+        return self._cascades if checkin is None else self._cascades[self._cascades['checkin_type'] == checkin]
+
+    def chain(self, rental_id):
+        """
+        Rentals pushed back by the late return of `rental_id`, with their hop and wait in minutes.
+        """
+        origin = self.rows_of(rental_id)
+        if origin[0] < 0:
+            raise KeyError(f"Unknown rental {rental_id}")
+        _, rows, hop, wait = self._follow(origin)
+        result = self.frame(rows)
+        result['hop'] = hop
+        result['wait'] = wait
+        return result.sort_values('hop', kind='stable').reset_index(drop=True)
+
+    def chain_lengths(self, scope='All cars'):
+        """
+        Number of late returns per chain length: 1 when only the next rental waited, and so on.
+        """
+        return self.cascades(scope)['chain_length'].value_counts().sort_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascading delays on the per-car rental timeline")
+    parser.add_argument('path', help="get_around_delay_analysis.xlsx or the same data as CSV")
+    parser.add_argument('--scope', choices=list(SCOPES), default='All cars')
+    parser.add_argument('--car', type=int, help="print the timeline of this car")
+    parser.add_argument('--rental', type=int, help="print the rentals pushed back by this late return")
+    args = parser.parse_args()
+
+    timeline = RentalTimeline.from_path(args.path)
+    cascades = timeline.cascades(args.scope)
+    print(f"{len(timeline)} rentals on {len(timeline.cars)} cars, {len(cascades)} late returns made the next driver wait")
+    print("Late returns per chain length:")
+    print(timeline.chain_lengths(args.scope).to_string())
+    print(cascades.sort_values(['chain_length', 'total_wait'], ascending=False).head(10).to_string(index=False))
+    if args.car is not None:
+        print(timeline.car(args.car).to_string(index=False))
+    if args.rental is not None:
+        try:
+            chain = timeline.chain(args.rental)
+        except KeyError as error:
+            parser.error(error.args[0])
+        print(chain.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
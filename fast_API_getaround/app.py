@@ -1,10 +1,28 @@
 import uvicorn
-from fastapi import FastAPI
-import pandas as pd 
-from pydantic import BaseModel
-from typing import Union
-import joblib
+from fastapi import FastAPI, File, Header, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError, ValidationInfo, model_validator
+from typing import List, Literal, Optional
 import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from registry import ModelRegistry
+from engines import INLINE_ENGINES, build_engine
+from preview import DATASET_PATH, PreviewDataset
+from cache import PredictionCache
+from batch import BOOLEAN_FEATURES, CATEGORICAL_FEATURES, BatchValidationError, features_frame, read_upload, stream_predictions, validate_columns
+from metrics import BATCH_ROWS, ERRORS, REGISTRY, STAGE_SECONDS, MetricsMiddleware, set_model
+from logs import log_event, setup_logging
+from executor import InferencePool, PoolSaturated
+from microbatch import DeadlineExceeded, MicroBatcher
+from whatif import GridTooLarge, alternatives, numeric_values, sensitivity
 
 
 
@@ -20,6 +38,15 @@ Where you can:
 ## Model-Prediction  
 Where you can:  
 * `/predict` insert your car details to receive an AI-based estimation on daily rental car price.  
+* `/predict/batch` send a list of cars and receive one estimation per car, streamed in the same order.  
+* `/predict/batch/file` same as above with a CSV or NDJSON file having the columns of `get_around_pricing_project.csv`.  
+* `/predict/sensitivity` see how the price of a car changes with its mileage, engine power, options or car type.  
+## Admin  
+Where you can:  
+* `/admin/model` see the version of the model currently served  
+* `/admin/reload` load a new `model.joblib` without restarting the API  
+* `/admin/cache` see the counters of the prediction cache  
+* `/metrics` request counts, errors and per-stage latency histograms in the Prometheus text format  
 """
 
 # tags to identify different endpoints                              ### NOTE_ : Definition de l"URL /preview
@@ -32,9 +59,61 @@ tags_metadata = [
     {
         "name": "Model-Prediction",
         "description": "Estimate rental price based on machine learning model"
+    },
+
+    {
+        "name": "Admin",
+        "description": "Inspect and reload the served model, monitor the API"
     }
 ]
 
+# Model configuration, the model is loaded once per worker at startup
+MODEL_PATH = os.environ.get("MODEL_PATH", "model.joblib") # joblib Pipeline, or compact artifact written by artifact.py (e.g. "model.artifact")
+MODEL_ENGINE = os.environ.get("MODEL_ENGINE", "encoded") # "sklearn", "encoded" (NumPy preprocessing) or "compiled" (NumPy preprocessing and trees)
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "0")) # seconds, 0 disables the file watcher
+BATCH_MAX_ROWS = int(os.environ.get("BATCH_MAX_ROWS", "100000")) # maximum number of cars per batch request
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", str(BATCH_MAX_ROWS * 1024))) # maximum size of a /predict/batch body, a car is ~330 bytes of JSON
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "5000")) # number of cars per call to the model
+SENSITIVITY_MAX_ROWS = int(os.environ.get("SENSITIVITY_MAX_ROWS", "10000")) # maximum number of cars in a what-if grid
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000")) # predictions kept per worker, 0 disables the cache
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "3600")) # seconds
+CACHE_MILEAGE_BUCKET = float(os.environ.get("CACHE_MILEAGE_BUCKET", "0")) # e.g. 1000 to price every 1000 km bucket once, 0 keeps exact mileage
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") # if set, required in the `X-Admin-Token` header of admin endpoints
+
+# Inference pool, predictions of /predict run outside of the event loop
+INFERENCE_POOL = os.environ.get("INFERENCE_POOL", "thread") # "thread", "process" (one model per child process, no GIL) or "inline" (on the event loop), linear kernels always run inline
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0")) # threads or processes per API worker, 0 for the number of CPUs
+INFERENCE_MAX_PENDING = int(os.environ.get("INFERENCE_MAX_PENDING", "256")) # predictions waiting or running, more are answered with 503
+INFERENCE_RETRY_AFTER = int(os.environ.get("INFERENCE_RETRY_AFTER", "1")) # seconds, sent in the Retry-After header of a 503
+MODEL_SNAPSHOT_DIR = os.environ.get("MODEL_SNAPSHOT_DIR") # "process" pool: copies of the model versions read by the children, a temporary directory by default
+
+# Micro-batching, concurrent /predict requests are answered by one call to the model
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", "32")) # cars per call, 1 disables micro-batching, never used for a linear kernel
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "5")) # wait for more cars, only while the pool is busy
+PREDICT_TIMEOUT = float(os.environ.get("PREDICT_TIMEOUT", "0")) # seconds before /predict answers 504, 0 waits for the prediction
+
+# Logging configuration, one JSON line per record written by a background thread
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01")) # share of the predictions logged, warnings and errors are always logged
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000")) # records waiting to be written, more are dropped
+
+# Preview configuration, pricing dataset of the repository by default so the API runs offline
+PREVIEW_DATA_PATH = os.environ.get("PREVIEW_DATA_PATH", DATASET_PATH) # set PREVIEW_DATA_URL where the repository is not around (Docker image)
+PREVIEW_DATA_URL = os.environ.get("PREVIEW_DATA_URL") # e.g. https://full-stack-assets.s3.eu-west-3.amazonaws.com/Deployment/get_around_pricing_project.csv
+PREVIEW_CACHE_DIR = os.environ.get("PREVIEW_CACHE_DIR")
+
+# Child processes load a version from its own copy of the file, so a reload does not change the model of a running request
+snapshot_dir = (MODEL_SNAPSHOT_DIR or tempfile.mkdtemp(prefix="getaround-models-")) if INFERENCE_POOL == "process" else None
+registry = ModelRegistry(MODEL_PATH, build=lambda pipeline: build_engine(pipeline, MODEL_ENGINE), snapshot_dir=snapshot_dir)
+preview_data = PreviewDataset(PREVIEW_DATA_PATH, url=PREVIEW_DATA_URL, cache_dir=PREVIEW_CACHE_DIR)
+prediction_cache = PredictionCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_MILEAGE_BUCKET)
+registry.on_reload(prediction_cache.clear)
+registry.on_reload(set_model)
+inference_pool = InferencePool(INFERENCE_POOL, INFERENCE_WORKERS, INFERENCE_MAX_PENDING, INFERENCE_RETRY_AFTER,
+                               inline_engines=INLINE_ENGINES)
+batcher = MicroBatcher(inference_pool, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS / 1000, PREDICT_TIMEOUT,
+                       INFERENCE_MAX_PENDING) if MICROBATCH_MAX_SIZE > 1 else None
+log_listener = setup_logging(LOG_SAMPLE_RATE, max_queue=LOG_QUEUE_SIZE)
+
 app = FastAPI(
     title="🔑 Getaround API 🚗",
     description=description,
@@ -45,11 +124,74 @@ app = FastAPI(
     },
     openapi_tags=tags_metadata
 )
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+def load_model():
+    inference_pool.start(registry.load(), MODEL_ENGINE)
+    preview_data.load()
+    if MODEL_WATCH_INTERVAL > 0:
+        registry.watch(MODEL_WATCH_INTERVAL)
+
+@app.on_event("shutdown")
+def stop_model_watcher():
+    registry.stop()
+    if batcher is not None:
+        batcher.stop()
+    inference_pool.stop()
+    if snapshot_dir is not None and not MODEL_SNAPSHOT_DIR:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    log_listener.stop()
+
+# Categorical fields of PredictionFeatures only accept the values the served model was trained on, so an
+# unknown car type is answered 422 instead of failing inside the model.
+# Handlers check the categories of the model version they predict with, so they follow a hot swap.
+# Elsewhere PredictionFeatures checks them only when given: `model_validate(car, context={"categories": ..})`.
+_served = {"model_version": None, "categories": {}} # {feature: set of categories} of the model version
+
+def served_categories(model_version):
+    if _served["model_version"] is not model_version:
+        _served["categories"] = {name: set(values) for name, values in (model_version.vocabularies or {}).items()
+                                 if name in CATEGORICAL_FEATURES}
+        _served["model_version"] = model_version
+    return _served["categories"]
+
+def check_category(feature, value, categories):
+    categories = categories.get(feature)
+    if categories is not None and value not in categories:
+        raise ValueError(f"{feature} should be one of {sorted(categories)}")
+    return value
+
+def check_categories(model_version, values):
+    """
+    Answer 422, like the validation of the body, when a value of `values` ([(location, feature, value)])
+    is not a category of `model_version`.
+    """
+    categories = served_categories(model_version)
+    errors = []
+    for loc, feature, value in values:
+        try:
+            check_category(feature, value, categories)
+        except ValueError as error:
+            errors.append({"type": "value_error", "loc": ("body", *loc), "msg": f"Value error, {error}",
+                           "input": value, "ctx": {"error": str(error)}})
+    if errors:
+        raise RequestValidationError(errors)
+
+def car_categories(item, loc=()):
+    return [((*loc, name), name, getattr(item, name)) for name in CATEGORICAL_FEATURES]
+
+def check_admin_token(token):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 class PredictionFeatures(BaseModel):
+    # 1e400 is read as inf, which the model cannot price
+    model_config = ConfigDict(allow_inf_nan=False)
+
     model_key: str
-    mileage: Union[int, float]
-    engine_power: Union[int, float]
+    mileage: float
+    engine_power: float
     fuel: str
     paint_color: str
     car_type: str
@@ -61,34 +203,85 @@ class PredictionFeatures(BaseModel):
     has_speed_regulator: bool
     winter_tires: bool
 
+    @model_validator(mode="after")
+    def trained_categories(self, info: ValidationInfo):
+        categories = (info.context or {}).get("categories")
+        if categories is not None:
+            for name in CATEGORICAL_FEATURES:
+                check_category(name, getattr(self, name), categories)
+        return self
+
+class NumericRange(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)
+
+    start: float
+    stop: float
+    steps: int = 10
+
+class SensitivityRequest(BaseModel):
+    base: PredictionFeatures
+    mileage: Optional[NumericRange] = None
+    engine_power: Optional[NumericRange] = None
+    toggle: List[Literal[tuple(BOOLEAN_FEATURES)]] = [] # only boolean options can be toggled
+    car_type: List[str] = []
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    # Same 422 as FastAPI, without the inputs that cannot be written back in JSON (inf, nan)
+    errors = []
+    for error in jsonable_encoder(exc.errors()):
+        try:
+            json.dumps(error, allow_nan=False)
+        except ValueError:
+            error = {key: value for key, value in error.items() if key != "input"}
+        errors.append(error)
+    return JSONResponse(status_code=422, content={"detail": errors})
+
+default_openapi = app.openapi
+
+def openapi():
+    # /docs lists the categories of the served model, the schema is built again after a reload
+    if app.openapi_schema is None:
+        properties = default_openapi()["components"]["schemas"]["PredictionFeatures"]["properties"]
+        for name, categories in served_categories(registry.current()).items():
+            properties[name]["enum"] = sorted(categories)
+    return app.openapi_schema
+
+app.openapi = openapi
+registry.on_reload(lambda model_version: setattr(app, "openapi_schema", None))
+
 @app.get("/", tags=["Preview"])
-async def random_data(rows: int= 3):
+async def random_data(rows: int= 3, seed: Optional[int] = None):
     """
     Get a sample of your whole dataset.   
-    You can specify amount of rows that you want by specifying a value for `rows`, default is `3`.
+    You can specify amount of rows that you want by specifying a value for `rows`, default is `3`.  
+    You can specify a `seed` to get the same rows on every call.
     """
     try:
         if rows < 51 :
-            fname ="https://full-stack-assets.s3.eu-west-3.amazonaws.com/Deployment/get_around_pricing_project.csv"
-            df = pd.read_csv(fname)
-            sample = df.sample(rows)
-            response0= sample.to_json(orient='records')
+            with STAGE_SECONDS.time(stage="preview_sample"):
+                sample = preview_data.sample(rows, seed=seed)
+                response0= sample.to_json(orient='records')
         else:
+            ERRORS.inc(endpoint="/", kind="too_many_rows")
             response0 = json.dumps({"message" : "Error! Row number should not be more than 50."})
     except:
+            ERRORS.inc(endpoint="/", kind="preview_failed")
+            log_event("preview_failed", logging.ERROR, rows=rows, exc_info=True)
             response0 = json.dumps({"message" : "Error! Problem."})
+    return response0
 
 
 @app.post("/predict", tags=["Model-Prediction"])
-async def predict(predictionFeatures: PredictionFeatures):
+async def predict(predictionFeatures: PredictionFeatures, response: Response, request: Request):
     """
     Prediction for single set of input variables. Possible input values are:  
-    model_key: str  
+    model_key: str, one of the brands the model was trained on  
     mileage: float  
     engine_power: float  
-    fuel: str  
-    paint_color: str  
-    car_type: str  
+    fuel: str, one of the fuels the model was trained on  
+    paint_color: str, one of the colors the model was trained on  
+    car_type: str, one of the car types the model was trained on  
     private_parking_available: bool  
     has_gps: bool  
     has_air_conditioning: bool  
@@ -96,38 +289,245 @@ async def predict(predictionFeatures: PredictionFeatures):
     has_getaround_connect: bool  
     has_speed_regulator: bool  
     winter_tires: bool  
+    Accepted values of the categorical fields are listed in the schema, other values are answered with 422.  
     Endpoint returns a dictionnary in the following format:  
     ```
-    {'prediction': rental_price_per_day}  
+    {'Predicted rental price per day in dollars': rental_price_per_day, 'model_version': version}  
     ```
     You need to use values as a dictionnary, or a form data.  
     """
     if predictionFeatures.json :  
-      # Printing JSON as dictionnary for user to check variables
-        print(predictionFeatures)
-        # Read data 
-        df = pd.DataFrame(dict(predictionFeatures), index=[0])
+        # Reading and validating the body happens before this handler runs
+        start = time.perf_counter()
+        STAGE_SECONDS.observe(start - request.state.request_start, stage="parse")
 
-        # Load the models from local
-        # prepro_getaround = 'prepro.joblib' # preprocessing model - *_* pas besoin de prepro
-        model_getaround  = 'model.joblib' # random forest model
+        # Model loaded once at startup, keep a reference so a reload does not change it mid-request
+        model_version = registry.current()
+        response.headers["X-Model-Version"] = model_version.version
+        check_categories(model_version, car_categories(predictionFeatures))
 
-        # preprocess = joblib.load(prepro_getaround) # *_* pas besoin de prepro
-        regressor = joblib.load(model_getaround)
+        # Same car configuration (and mileage bucket) as a recent request: reuse its prediction
+        if prediction_cache.enabled:
+            canonical = prediction_cache.canonical(predictionFeatures)
+            cache_key = prediction_cache.key(canonical, model_version.version)
+            cached = prediction_cache.get(cache_key)
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="cache_lookup")
+            if cached is not None:
+                response.headers["X-Cache"] = "HIT"
+                log_event("prediction", features=dict(predictionFeatures), prediction=cached,
+                          model_version=model_version.version, cache="HIT")
+                return {'Predicted rental price per day in dollars': cached,
+                        'model_version': model_version.version}
+            response.headers["X-Cache"] = "MISS"
+            if canonical["mileage"] != predictionFeatures.mileage:
+                predictionFeatures = PredictionFeatures(**canonical)
         
         try: 
-            # X_val = preprocess.transform(df.head(16)) # *_* pas besoin de prepro
-            Y_pred = regressor.predict(df)
-            print(Y_pred)
+            # Features are encoded straight from the validated input, no DataFrame needed
+            with STAGE_SECONDS.time(stage="predict"):
+                # a linear kernel is faster than the wait of a batch, only slower engines are batched
+                if batcher is not None and model_version.engine not in INLINE_ENGINES:
+                    Y_pred = [await batcher.predict(model_version, predictionFeatures,
+                                                    time.perf_counter() - request.state.request_start)]
+                else:
+                    Y_pred = (await inference_pool.predict(model_version, [predictionFeatures])).tolist()
             # Prediction
             # Format response
-            response = {'Predicted rental price per day in dollars': round(Y_pred.tolist()[0],1)}
+            if not math.isfinite(Y_pred[0]):
+                raise HTTPException(status_code=422, detail="Error! Prediction out of range, check mileage and engine_power.")
+            price = round(Y_pred[0],1)
+            if prediction_cache.enabled:
+                prediction_cache.put(cache_key, price)
+            result = {'Predicted rental price per day in dollars': price,
+                      'model_version': model_version.version}
+            log_event("prediction", features=dict(predictionFeatures), prediction=price,
+                      model_version=model_version.version, cache=response.headers.get("X-Cache"))
+        except PoolSaturated as error:
+            # Shed load rather than queueing: the client retries after a short wait
+            ERRORS.inc(endpoint="/predict", kind="pool_saturated")
+            raise HTTPException(status_code=503, detail="Error! Too many predictions in progress, retry later.",
+                                headers={"Retry-After": str(error.retry_after)})
+        except HTTPException:
+            ERRORS.inc(endpoint="/predict", kind="out_of_range")
+            raise
+        except DeadlineExceeded:
+            raise HTTPException(status_code=504, detail="Error! Prediction took too long, retry later.")
         except:
-            response = json.dumps({"message" : """Error! Check your input format."""})
-        return response
+            ERRORS.inc(endpoint="/predict", kind="predict_failed")
+            log_event("predict_failed", logging.ERROR, features=dict(predictionFeatures),
+                      model_version=model_version.version, exc_info=True)
+            result = json.dumps({"message" : """Error! Check your input format."""})
+        return result
     else:
+        ERRORS.inc(endpoint="/predict", kind="invalid_input")
         msg = json.dumps({"message" : """Error! Check your input format."""})
         return msg
 
+def batch_response(df, model_version, errors=None):
+    if len(df) > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Error! Batch should not have more than {BATCH_MAX_ROWS} rows.")
+    BATCH_ROWS.observe(len(df))
+    return StreamingResponse(stream_predictions(model_version.model, df, BATCH_CHUNK_SIZE, model_version.version, errors),
+                             media_type="application/x-ndjson",
+                             headers={"X-Model-Version": model_version.version})
+
+# /predict/batch reads its body itself: an oversized body is answered 413 from its size, or from its number of
+# cars, before any car is validated
+batch_adapter = TypeAdapter(List[PredictionFeatures])
+BATCH_BODY = {"requestBody": {"required": True, "content": {"application/json": {
+    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/PredictionFeatures"}}}}}}
+
+async def read_body(request, max_bytes):
+    too_large = HTTPException(status_code=413, detail=f"Error! Batch should not be larger than {max_bytes} bytes.")
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+def parse_batch(body):
+    """
+    Cars of a /predict/batch body, with the same 422 as a `List[PredictionFeatures]` body.
+    """
+    try:
+        rows = json.loads(body)
+    except ValueError as error:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body", error.pos), "msg": "JSON decode error",
+                                       "input": {}, "ctx": {"error": error.msg}}])
+    if not isinstance(rows, list):
+        raise RequestValidationError([{"type": "list_type", "loc": ("body",), "msg": "Input should be a valid list",
+                                       "input": rows}])
+    if len(rows) > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Error! Batch should not have more than {BATCH_MAX_ROWS} rows.")
+    try:
+        return batch_adapter.validate_python(rows)
+    except ValidationError as error:
+        raise RequestValidationError([dict(e, loc=("body", *e["loc"])) for e in error.errors(include_url=False)])
+
+def batch_predictions(body):
+    predictionFeatures = parse_batch(body)
+    model_version = registry.current()
+    check_categories(model_version, [value for index, item in enumerate(predictionFeatures)
+                                     for value in car_categories(item, (index,))])
+    return batch_response(features_frame(predictionFeatures), model_version)
+
+@app.post("/predict/batch", tags=["Model-Prediction"], openapi_extra=BATCH_BODY)
+async def predict_batch(request: Request):
+    """
+    Prediction for a list of cars, each one with the same fields as `/predict`.  
+    Endpoint streams one JSON line per car, in the same order as the input:  
+    ```
+    {"index": 0, "prediction": rental_price_per_day, "model_version": version}  
+    ```
+    Maximum number of cars is set with `BATCH_MAX_ROWS`, maximum size of the body with `BATCH_MAX_BYTES`.  
+    """
+    body = await read_body(request, BATCH_MAX_BYTES)
+    # validation of the cars and the DataFrame run in a thread, like the handler did before
+    return await run_in_threadpool(batch_predictions, body)
+
+@app.post("/predict/batch/file", tags=["Model-Prediction"])
+def predict_batch_file(file: UploadFile = File(...)):
+    """
+    Prediction for a CSV or NDJSON file with the columns of `get_around_pricing_project.csv`.  
+    Other columns (index, `rental_price_per_day`) are ignored. Response has the same format as `/predict/batch`.  
+    Rows with an invalid value get an error line instead of a prediction:  
+    ```
+    {"index": 3, "error": "Error! Check your input format. (fuel: unknown value 'coal')"}  
+    ```
+    """
+    model_version = registry.current()
+    try:
+        # every column is checked at once, only the valid rows are sent to the model
+        with STAGE_SECONDS.time(stage="batch_validation"):
+            df, errors = validate_columns(read_upload(file.file.read(), file.filename, file.content_type),
+                                          model_version.vocabularies)
+    except BatchValidationError as error:
+        raise HTTPException(status_code=422, detail=f"Error! Check your input format. {error}")
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=f"Error! Could not read the file. {error}")
+    return batch_response(df, model_version, errors)
+
+@app.post("/predict/sensitivity", tags=["Model-Prediction"])
+def predict_sensitivity(request: SensitivityRequest, response: Response):
+    """
+    Prices of a `base` car (same fields as `/predict`) and of every combination of its variants:  
+    `mileage` and `engine_power`: `{"start": 0, "stop": 200000, "steps": 10}`  
+    `toggle`: boolean options priced both without and with, e.g. `["has_gps", "winter_tires"]`  
+    `car_type`: other car types, e.g. `["suv", "van"]`  
+    All the grid is priced by one call to the model. Endpoint returns:  
+    ```
+    {"base_prediction": price, "dimensions": {name: values}, "shape": [..], "predictions": nested lists, "model_version": version}  
+    ```
+    `predictions[i][j]...` is the price for the i-th value of the first dimension, the j-th of the second, and so on.  
+    Maximum number of cars in the grid is set with `SENSITIVITY_MAX_ROWS`.  
+    """
+    model_version = registry.current()
+    response.headers["X-Model-Version"] = model_version.version
+    check_categories(model_version, car_categories(request.base, ("base",)) +
+                     [(("car_type", index), "car_type", value) for index, value in enumerate(request.car_type)])
+    base = dict(request.base)
+    try:
+        dimensions = {}
+        for name in ["mileage", "engine_power"]:
+            grid_range = getattr(request, name)
+            if grid_range is not None:
+                dimensions[name] = numeric_values(grid_range.start, grid_range.stop, grid_range.steps)
+        for name in request.toggle:
+            if name in dimensions:
+                raise ValueError(f"{name} is given twice, as a range or a toggle")
+            dimensions[name] = [False, True]
+        if request.car_type:
+            dimensions["car_type"] = alternatives(base["car_type"], request.car_type)
+        with STAGE_SECONDS.time(stage="sensitivity"):
+            result = sensitivity(model_version.model, base, dimensions, SENSITIVITY_MAX_ROWS)
+    except GridTooLarge as error:
+        ERRORS.inc(endpoint="/predict/sensitivity", kind="grid_too_large")
+        raise HTTPException(status_code=413, detail=f"Error! {error}.")
+    except ValueError as error:
+        ERRORS.inc(endpoint="/predict/sensitivity", kind="invalid_input")
+        raise HTTPException(status_code=422, detail=f"Error! Check your input format. {error}")
+    result["model_version"] = model_version.version
+    return result
+
+@app.get("/admin/model", tags=["Admin"])
+async def model_info():
+    """
+    Version of the model currently served by this worker, and its inference pool.
+    """
+    return dict(registry.current().describe(), inference=inference_pool.describe(),
+                microbatch=batcher.describe() if batcher is not None else None)
+
+@app.get("/admin/cache", tags=["Admin"])
+async def cache_stats():
+    """
+    Counters of the prediction cache of this worker: hits, misses, evictions, expirations and invalidations (model reloads).
+    """
+    return prediction_cache.stats()
+
+@app.post("/admin/reload", tags=["Admin"])
+def reload_model(x_admin_token: Optional[str] = Header(None)):
+    """
+    Reload `MODEL_PATH` from disk without restarting the API. Requests already running keep the previous model.  
+    With several gunicorn workers, each worker reloads on its own: prefer `MODEL_WATCH_INTERVAL` in that case.
+    """
+    check_admin_token(x_admin_token)
+    try:
+        model_version = registry.load()
+    except Exception as error:
+        raise HTTPException(status_code=400, detail=f"Could not load model: {error}")
+    return model_version.describe()
+
+@app.get("/metrics", tags=["Admin"])
+def metrics():
+    """
+    Metrics of this worker in the Prometheus text format: requests and latency per route, errors
+    (including those returned with a 200 status), time per stage of the prediction path and model version.
+    """
+    return Response(REGISTRY.render(worker=os.getpid()), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(app, host = "0.0.0.0", port = 4000, debug=True, reload=True)
\ No newline at end of file
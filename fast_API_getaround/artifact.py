@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from batch import BOOLEAN_FEATURES, CATEGORICAL_FEATURES, FEATURES, NUMERIC_FEATURES
+from encoding import FeatureEncoder, export_encoding
+from forest import ForestPredictor, export_forest, forest_estimator
+from linear import LinearKernel, is_linear
+
+
+# Compact model artifact of the API.
+# One file: a magic string, the length of a JSON manifest, the manifest (format version, feature
+# schema, vocabularies and scaling of the preprocessing, training metrics, array layout), then the
+# numeric arrays of the model, each aligned on 64 bytes. Arrays are memory-mapped read-only, so
+# every gunicorn worker reads the same pages from the page cache instead of unpickling its own copy,
+# and loading needs neither scikit-learn nor joblib.
+# Linear models keep their coefficients, random forests the node arrays of forest.py.
+# Usage: python artifact.py model.joblib model.artifact --check ../EDA_getaround/src/get_around_pricing_project.csv
+#        python artifact.py --show model.artifact
+
+MAGIC = b"GETAROUND-MODEL\0"
+FORMAT_VERSION = 1
+ALIGN = 64
+KINDS = ["linear", "forest"]
+
+
+class ArtifactError(ValueError):
+    """
+    Raised for a file that is not a model artifact, or of a format version this code cannot read.
+    """
+
+
+def is_artifact(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IsADirectoryError, FileNotFoundError):
+        return False
+
+
+def feature_schema():
+    types = {**{name: "number" for name in NUMERIC_FEATURES}, **{name: "boolean" for name in BOOLEAN_FEATURES},
+             **{name: "category" for name in CATEGORICAL_FEATURES}}
+    return [{"name": name, "type": types[name]} for name in FEATURES]
+
+
+def export_model(pipeline):
+    """
+    `(kind, params, arrays)` of a fitted pricing Pipeline: scalar parameters go to the manifest,
+    arrays to the data part of the file.
+    """
+    regressor = pipeline.steps[-1][1]
+    if is_linear(regressor):
+        return "linear", {"intercept": float(regressor.intercept_)}, {"coef": np.asarray(regressor.coef_, dtype=np.float64)}
+    try:
+        forest_estimator(regressor)
+    except TypeError:
+        raise TypeError(f"No artifact format for {type(regressor).__name__}, use the joblib file")
+    arrays = export_forest(regressor)
+    params = {"max_depth": int(arrays.pop("max_depth")), "n_features": int(arrays.pop("n_features"))}
+    return "forest", params, arrays
+
+
+def write_artifact(path, kind, params, arrays, encoding, metrics=None, source=None):
+    """
+    Write the artifact to `path` atomically (temporary file, then rename).
+    """
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "kind": kind,
+        "params": params,
+        "features": feature_schema(),
+        "encoding": encoding,
+        "metrics": metrics or {},
+        "source": source or {},
+        "created_at": time.time(),
+        "arrays": layout,
+    }
+    header = json.dumps(manifest, indent=1, ensure_ascii=False).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path):
+    """
+    `(manifest, data_start)` of an artifact, without reading its arrays.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ArtifactError(f"{path} is not a model artifact")
+        (length,) = struct.unpack("<Q", f.read(8))
+        manifest = json.loads(f.read(length))
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ArtifactError(f"{path} has format version {manifest.get('format_version')}, expected {FORMAT_VERSION}")
+    data_start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+    return manifest, data_start
+
+
+class ModelArtifact:
+    """
+    Manifest and memory-mapped arrays of an artifact file.
+    """
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        self.arrays = arrays
+        self.kind = manifest["kind"]
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        manifest, data_start = read_manifest(path)
+        arrays = {}
+        for name, layout in manifest["arrays"].items():
+            shape = tuple(layout["shape"])
+            if mmap:
+                arrays[name] = np.memmap(path, dtype=np.dtype(layout["dtype"]), mode="r",
+                                         offset=data_start + layout["offset"], shape=shape)
+            else:
+                with open(path, "rb") as f:
+                    f.seek(data_start + layout["offset"])
+                    count = int(np.prod(shape))
+                    arrays[name] = np.fromfile(f, dtype=np.dtype(layout["dtype"]), count=count).reshape(shape)
+        return cls(manifest, arrays)
+
+    @property
+    def vocabularies(self):
+        return {c["name"]: c["categories"] for c in self.manifest["encoding"]["categorical"]}
+
+    def build(self):
+        """
+        `(engine_name, model)` with `predict(df)` and `predict_features(items)`, like engines.build_engine.
+        """
+        encoding = self.manifest["encoding"]
+        params = self.manifest["params"]
+        if self.kind == "linear":
+            return "linear-kernel", LinearKernel.from_coefficients(encoding, self.arrays["coef"], params["intercept"])
+        if self.kind == "forest":
+            from engines import EncodedEngine
+
+            predictor = ForestPredictor(dict(self.arrays, **params))
+            return "compiled-forest", EncodedEngine(FeatureEncoder(encoding), predictor, "compiled-forest")
+        raise ArtifactError(f"Unknown artifact kind {self.kind!r}, expected one of {KINDS}")
+
+
+def export_file(model_path, output, metrics=None):
+    import joblib
+
+    from registry import file_version
+
+    pipeline = joblib.load(model_path)
+    kind, params, arrays = export_model(pipeline)
+    source = {"file": os.path.basename(model_path), "version": file_version(model_path)}
+    return pipeline, write_artifact(output, kind, params, arrays, export_encoding(pipeline), metrics, source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a joblib pricing model to the compact artifact format")
+    parser.add_argument("model", nargs="?", help="joblib file of the fitted Pipeline")
+    parser.add_argument("output", nargs="?", help="artifact file to write, e.g. model.artifact")
+    parser.add_argument("--metrics", help="JSON file of training metrics to store in the manifest")
+    parser.add_argument("--check", metavar="CSV", help="compare with the joblib model on this pricing CSV and store the RMSE")
+    parser.add_argument("--show", metavar="ARTIFACT", help="print the manifest of an artifact")
+    args = parser.parse_args()
+
+    if args.show:
+        manifest, _ = read_manifest(args.show)
+        print(json.dumps(manifest, indent=1, ensure_ascii=False))
+        return
+    if not args.model or not args.output:
+        parser.error("model and output are required")
+
+    metrics = {}
+    if args.metrics:
+        with open(args.metrics) as f:
+            metrics = json.load(f)
+    pipeline, manifest = export_file(args.model, args.output, metrics)
+    size = os.path.getsize(args.output)
+    print(f"Wrote {args.output}: {manifest['kind']}, {size / 2**20:.2f} MB "
+          f"(joblib file {os.path.getsize(args.model) / 2**20:.2f} MB)")
+
+    if args.check:
+        import pandas as pd
+
+        df = pd.read_csv(args.check, index_col=0)
+        _, model = ModelArtifact.load(args.output).build()
+        features = df[FEATURES]
+        predicted = model.predict(features)
+        error = float(np.abs(predicted - pipeline.predict(features)).max())
+        print(f"Rows: {len(df)}, max abs difference with the joblib model: {error:.3g}")
+        if error > 1e-6:
+            raise SystemExit("Artifact does not match the joblib model")
+        if "rental_price_per_day" in df:
+            rmse = float(np.sqrt(np.mean((predicted - df["rental_price_per_day"].to_numpy()) ** 2)))
+            metrics.update({"check_rmse": rmse, "check_dataset": os.path.basename(args.check), "check_rows": len(df)})
+            manifest = write_artifact(args.output, manifest["kind"], manifest["params"],
+                                      ModelArtifact.load(args.output, mmap=False).arrays, manifest["encoding"],
+                                      metrics, manifest["source"])
+            print(f"RMSE on {args.check}: {rmse:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import io
+import json
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+from logs import log_event
+from metrics import ERRORS, STAGE_SECONDS
+
+
+# Batch prediction helpers.
+# Rows are validated together, one NumPy column at a time, then the valid ones are sent to the
+# pipeline one chunk at a time so a single `predict` call covers many cars. Invalid rows get an error
+# line without going through the model. Results are written back as NDJSON, in input order.
+
+FEATURES = ['model_key', 'mileage', 'engine_power', 'fuel', 'paint_color', 'car_type',
+            'private_parking_available', 'has_gps', 'has_air_conditioning',
+            'automatic_car', 'has_getaround_connect', 'has_speed_regulator',
+            'winter_tires']
+NUMERIC_FEATURES = ['mileage', 'engine_power']
+BOOLEAN_FEATURES = ['private_parking_available', 'has_gps', 'has_air_conditioning',
+                    'automatic_car', 'has_getaround_connect', 'has_speed_regulator',
+                    'winter_tires']
+CATEGORICAL_FEATURES = ['model_key', 'fuel', 'paint_color', 'car_type']
+
+BOOLEAN_VALUES = {True: True, False: False, 'true': True, 'false': False, 'True': True,
+                  'False': False, 'TRUE': True, 'FALSE': False, 1: True, 0: False}
+
+
+class BatchValidationError(ValueError):
+    """
+    Raised when an uploaded batch does not match the `PredictionFeatures` schema.
+    """
+
+
+def read_upload(content, filename="", content_type=""):
+    """
+    Read an uploaded CSV or NDJSON file into a DataFrame.
+    Format is taken from the file extension, then from the content type. CSV is the default.
+    """
+    name = (filename or "").lower()
+    kind = (content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in kind or "jsonlines" in kind:
+        return pd.read_json(io.BytesIO(content), lines=True, dtype=False)
+    return pd.read_csv(io.BytesIO(content))
+
+
+def distinct(values):
+    """
+    Codes of `values` into its distinct values (-1 for missing values) and the distinct values,
+    so a column is checked once per distinct value instead of once per row.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def validate_columns(df, vocabularies=None):
+    """
+    Check and coerce a batch to the columns and types of `PredictionFeatures`, one NumPy column at a time.
+    Returns the features of every row (extra columns dropped) and the error of every row, None for the
+    valid rows. With `vocabularies` ({feature: categories}), values the model was not trained on are
+    rejected too. Features of the rows with an error are not meant to be sent to the model.
+    """
+    missing = [col for col in FEATURES if col not in df.columns]
+    if missing:
+        raise BatchValidationError(f"Missing columns: {missing}")
+
+    n_rows = len(df)
+    columns = {}
+    errors = np.full(n_rows, None, dtype=object)
+
+    def reject(bad, message):
+        # a row keeps the error of its first bad column
+        rows = np.flatnonzero(bad & pd.isna(errors))
+        errors[rows] = [message(row) for row in rows]
+
+    for col in NUMERIC_FEATURES:
+        values = df[col].to_numpy()
+        if values.dtype.kind in "iuf":
+            numbers = values.astype(np.float64)
+        else:
+            numbers = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+        # inf would give a prediction that is not valid JSON
+        reject(~np.isfinite(numbers), lambda row: f"{col}: not a finite number {values[row]!r}")
+        columns[col] = numbers
+    for col in BOOLEAN_FEATURES:
+        values = df[col].to_numpy()
+        if values.dtype.kind == "b":
+            columns[col] = values
+            continue
+        codes, uniques = distinct(values)
+        flags = np.array([BOOLEAN_VALUES.get(value) for value in uniques] + [None], dtype=object)[codes]
+        bad = pd.isna(flags)
+        reject(bad, lambda row: f"{col}: non boolean value {values[row]!r}")
+        flags[bad] = False
+        columns[col] = flags.astype(bool)
+    for col in CATEGORICAL_FEATURES:
+        values = df[col].to_numpy()
+        codes, uniques = distinct(values)
+        strings = np.array([str(value) for value in uniques] + [""], dtype=object)
+        reject(codes == -1, lambda row: f"{col}: missing value")
+        if vocabularies is not None and col in vocabularies:
+            known = np.isin(strings, np.asarray(vocabularies[col], dtype=object))
+            known[-1] = True
+            reject(~known[codes], lambda row: f"{col}: unknown value {values[row]!r}")
+        columns[col] = strings[codes]
+    return pd.DataFrame(columns, columns=FEATURES), errors
+
+
+def validate_frame(df, vocabularies=None):
+    """
+    Check and coerce a batch to the columns and types of `PredictionFeatures`, all of its rows must be valid.
+    Extra columns of `get_around_pricing_project.csv` (index, rental_price_per_day) are dropped.
+    """
+    features, errors = validate_columns(df, vocabularies)
+    rows = np.flatnonzero(~pd.isna(errors))
+    if len(rows):
+        raise BatchValidationError(f"{len(rows)} invalid rows: " +
+                                   "; ".join(f"row {row}: {errors[row]}" for row in rows[:10]))
+    return features
+
+
+def features_frame(items):
+    """
+    Build the batch DataFrame from a list of validated `PredictionFeatures`.
+    """
+    return pd.DataFrame([dict(item) for item in items], columns=FEATURES)
+
+
+def iter_chunks(n_rows, chunk_size):
+    for start in range(0, n_rows, chunk_size):
+        yield start, min(start + chunk_size, n_rows)
+
+
+def stream_predictions(model, df, chunk_size, model_version, errors=None):
+    """
+    Yield one NDJSON line per row, in input order, with one `predict` call per chunk.
+    Rows with an error in `errors` (see `validate_columns`) get an error line and are not sent to the model.
+    A chunk the model rejects yields an error line for each of its rows.
+    """
+    for start, stop in iter_chunks(len(df), chunk_size):
+        lines = [None] * (stop - start)
+        rows = np.arange(start, stop)
+        if errors is not None:
+            invalid = ~pd.isna(errors[start:stop])
+            if invalid.any():
+                ERRORS.inc(int(invalid.sum()), endpoint="batch", kind="rows_invalid")
+                for index in rows[invalid].tolist():
+                    message = f"Error! Check your input format. ({errors[index]})"
+                    lines[index - start] = json.dumps({"index": index, "error": message})
+                rows = rows[~invalid]
+        try:
+            with STAGE_SECONDS.time(stage="batch_chunk"):
+                predictions = model.predict(df.iloc[rows]).tolist() if len(rows) else []
+        except Exception as error:
+            ERRORS.inc(len(rows), endpoint="batch", kind="rows_rejected")
+            log_event("batch_chunk_rejected", logging.WARNING, start=start, stop=stop, error=str(error))
+            message = f"Error! Check your input format. ({error})"
+            for index in rows.tolist():
+                lines[index - start] = json.dumps({"index": index, "error": message})
+        else:
+            for index, value in zip(rows.tolist(), predictions):
+                if math.isfinite(value):
+                    lines[index - start] = json.dumps({"index": index, "prediction": round(value, 1),
+                                                       "model_version": model_version})
+                else:
+                    ERRORS.inc(endpoint="batch", kind="rows_rejected")
+                    lines[index - start] = json.dumps({"index": index, "error": "Error! Prediction out of range."})
+        yield "\n".join(lines) + "\n"
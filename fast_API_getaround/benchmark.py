@@ -0,0 +1,172 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+import psutil
+
+from batch import FEATURES
+
+
+# Local benchmarks of the prediction path.
+# Usage: python benchmark.py <name> [--model model.joblib] [--data ../EDA_getaround/src/get_around_pricing_project.csv]
+#        python benchmark.py startup --model model.joblib --artifact model.artifact --workers 4
+
+warnings.filterwarnings("ignore")
+
+
+def load_rows(path):
+    df = pd.read_csv(path, index_col=0)
+    return df[FEATURES]
+
+
+def per_row(func, items, repeat=1):
+    """
+    Mean time of `func(item)` in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            func(item)
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+
+def bench_encode(args):
+    """
+    Per-row encoding time: DataFrame + ColumnTransformer against FeatureEncoder.
+    """
+    from app import PredictionFeatures
+    from encoding import FeatureEncoder
+
+    pipeline = joblib.load(args.model)
+    preprocessor = pipeline.steps[0][1]
+    encoder = FeatureEncoder.from_model(pipeline)
+    df = load_rows(args.data).head(args.rows)
+    items = [PredictionFeatures(**record) for record in df.to_dict("records")]
+    out = np.zeros((1, encoder.n_features))
+
+    results = {
+        "DataFrame + ColumnTransformer": per_row(lambda item: preprocessor.transform(pd.DataFrame(dict(item), index=[0])), items),
+        "FeatureEncoder.encode": per_row(lambda item: encoder.encode([item]), items, repeat=10),
+        "FeatureEncoder.encode, preallocated": per_row(lambda item: encoder.encode([item], out=out), items, repeat=10),
+    }
+    start = time.perf_counter()
+    preprocessor.transform(df)
+    results["ColumnTransformer, whole batch"] = (time.perf_counter() - start) / len(df) * 1e6
+    start = time.perf_counter()
+    encoder.encode_columns(df)
+    results["FeatureEncoder.encode_columns, whole batch"] = (time.perf_counter() - start) / len(df) * 1e6
+
+    print(f"Encoding time per row over {len(items)} rows:")
+    for name, micros in results.items():
+        print(f"  {name:<45} {micros:10.1f} us")
+
+
+def bench_linear(args):
+    """
+    Per-row prediction time of the linear model: Pipeline.predict against LinearKernel.
+    """
+    from app import PredictionFeatures
+    from linear import LinearKernel, verify
+
+    pipeline = joblib.load(args.model)
+    kernel = LinearKernel.from_pipeline(pipeline)
+    df = load_rows(args.data).head(args.rows)
+    items = [PredictionFeatures(**record) for record in df.to_dict("records")]
+    print(f"Max difference with Pipeline.predict on probe rows: {verify(kernel, pipeline):.3g}")
+    print(f"Max difference with Pipeline.predict on the data: {np.abs(kernel.predict(df) - pipeline.predict(df)).max():.3g}")
+
+    results = {
+        "Pipeline.predict": per_row(lambda item: pipeline.predict(pd.DataFrame(dict(item), index=[0])), items),
+        "LinearKernel.predict_one": per_row(kernel.predict_one, items, repeat=10),
+    }
+    start = time.perf_counter()
+    pipeline.predict(df)
+    results["Pipeline.predict, whole batch"] = (time.perf_counter() - start) / len(df) * 1e6
+    start = time.perf_counter()
+    kernel.predict(df)
+    results["LinearKernel.predict, whole batch"] = (time.perf_counter() - start) / len(df) * 1e6
+
+    print(f"Prediction time per row over {len(items)} rows:")
+    for name, micros in results.items():
+        print(f"  {name:<45} {micros:10.1f} us")
+
+
+# Run by bench_startup in a new interpreter: time the imports, the load and the first prediction,
+# then wait on stdin so the memory of all the workers is measured while they are alive together.
+STARTUP_WORKER = """
+import json, sys, time
+start = time.perf_counter()
+from engines import build_engine
+from executor import FeatureRecord
+from registry import load_model_file
+imported = time.perf_counter()
+model = build_engine(load_model_file(sys.argv[1]), sys.argv[2])[1]
+loaded = time.perf_counter()
+model.predict_features([FeatureRecord(json.loads(sys.argv[3]))])
+predicted = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "load_s": loaded - imported, "first_predict_s": predicted - loaded}), flush=True)
+sys.stdin.readline()
+"""
+
+
+def start_workers(path, engine, record, n):
+    """
+    Start `n` worker interpreters loading `path` at the same time, and wait until they predicted once.
+    """
+    workers = [subprocess.Popen([sys.executable, "-c", STARTUP_WORKER, path, engine, record],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(n)]
+    timings = [json.loads(worker.stdout.readline()) for worker in workers]
+    memory = [psutil.Process(worker.pid).memory_full_info() for worker in workers]
+    for worker in workers:
+        worker.communicate("\n")
+    return timings, memory
+
+
+def bench_startup(args):
+    """
+    Startup time and memory of API workers for a joblib model against its artifact (artifact.py).
+    RSS counts the shared pages of the memory-mapped arrays in every worker, PSS splits them between
+    the workers, USS is the memory a worker would free on exit.
+    """
+    record = json.dumps(json.loads(load_rows(args.data).head(1).to_json(orient="records"))[0])
+    paths = [args.model] + ([args.artifact] if args.artifact else [])
+    print(f"Workers started together: {args.workers}, engine {args.engine} for joblib files")
+    print(f"  {'file':<28} {'import':>8} {'load':>8} {'predict':>8} {'total':>8} {'RSS':>8} {'PSS':>8} {'USS':>8}")
+    for path in paths:
+        start_workers(path, args.engine, record, 1) # warm the page cache
+        timings, memory = start_workers(path, args.engine, record, args.workers)
+        mean = {key: np.mean([t[key] for t in timings]) * 1000 for key in timings[0]}
+        total = sum(mean.values())
+        rss, pss, uss = (np.mean([getattr(m, key) for m in memory]) / 2**20 for key in ["rss", "pss", "uss"])
+        print(f"  {path[-28:]:<28} {mean['import_s']:6.0f}ms {mean['load_s']:6.0f}ms {mean['first_predict_s']:6.1f}ms "
+              f"{total:6.0f}ms {rss:6.1f}MB {pss:6.1f}MB {uss:6.1f}MB")
+
+
+BENCHMARKS = {
+    "encode": bench_encode,
+    "linear": bench_linear,
+    "startup": bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the Getaround API")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--model", default="model.joblib")
+    parser.add_argument("--data", default="../EDA_getaround/src/get_around_pricing_project.csv")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--artifact", help="artifact of --model, for the startup benchmark")
+    parser.add_argument("--engine", default="encoded", help="engine of the joblib model, for the startup benchmark")
+    parser.add_argument("--workers", type=int, default=4, help="workers started together, for the startup benchmark")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+# Prediction cache of the API.
+# Predictions are kept per worker in a bounded LRU with a time to live, keyed on a hash of the model
+# version and of the canonicalized car features. Memory is bounded by `max_entries` in each worker,
+# so a gunicorn deployment holds at most `workers * max_entries` entries.
+
+
+def quantize(value, bucket):
+    """
+    Center of the `bucket` wide interval holding `value`, or `value` itself when bucket is 0.
+    """
+    if not bucket:
+        return value
+    return (int(value // bucket) * bucket) + bucket / 2
+
+
+class PredictionCache:
+    """
+    LRU + TTL cache of predictions, with hit/miss/eviction counters.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600.0, mileage_bucket=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.mileage_bucket = mileage_bucket
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def canonical(self, features):
+        """
+        Features as a dict with the mileage quantized. Predictions are made on this dict so every
+        car of a mileage bucket gets the same price, whether it comes from the cache or not.
+        """
+        values = dict(features)
+        values["mileage"] = quantize(values["mileage"], self.mileage_bucket)
+        return values
+
+    def key(self, canonical, model_version):
+        payload = json.dumps([model_version, canonical], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(payload.encode(), digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, *_):
+        """
+        Drop every entry, e.g. when a new model is loaded.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "mileage_bucket": self.mileage_bucket,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+
+# Preprocessing fast path.
+# `export_encoding` reads the fitted ColumnTransformer of the pricing pipeline (StandardScaler on the
+# numeric columns, OneHotEncoder(drop='first') on the others) into plain lists and dicts, and
+# `FeatureEncoder` rebuilds the same feature matrix from `PredictionFeatures` without a DataFrame.
+
+
+class UnknownCategoryError(ValueError):
+    """
+    Raised when a categorical value was not seen when the model was trained.
+    """
+
+    def __init__(self, feature, value, rows=None):
+        self.feature = feature
+        self.value = value
+        self.rows = rows
+        message = f"Unknown value {value!r} for {feature}"
+        if rows is not None:
+            message += f" at rows {rows[:10]}"
+        super().__init__(message)
+
+
+def preprocessor_of(model):
+    """
+    Fitted ColumnTransformer of a model: the model itself or the first step of a Pipeline.
+    """
+    if hasattr(model, "steps"):
+        model = model.steps[0][1]
+    if not hasattr(model, "transformers_"):
+        raise TypeError(f"{type(model).__name__} is not a fitted ColumnTransformer")
+    return model
+
+
+def final_step(transformer):
+    return transformer.steps[-1][1] if hasattr(transformer, "steps") else transformer
+
+
+def plain(value):
+    # NumPy scalars of the fitted vocabularies to JSON friendly Python values
+    return value.item() if hasattr(value, "item") else value
+
+
+def lookup_codes(lookup, values, unknown=-2):
+    """
+    Map an array of values through `lookup` (None mapped to -1), `unknown` for missing values.
+    Lookups are done once per distinct value.
+    """
+    def code(value):
+        try:
+            column = lookup[value]
+        except (KeyError, TypeError):
+            return unknown
+        return -1 if column is None else column
+
+    # hashed, not sorted: np.unique compares object values one pair at a time
+    inverse, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return np.array([code(value) for value in uniques] + [unknown], dtype=np.int64)[inverse]
+
+
+def export_encoding(model):
+    """
+    Fitted scaling and vocabularies of the preprocessing, in output column order:
+    `{"numeric": [{"name", "mean", "scale"}], "categorical": [{"name", "categories", "drop"}], "n_features"}`
+    `drop` is the index of the category without a column (OneHotEncoder(drop='first')) or None.
+    """
+    preprocessor = preprocessor_of(model)
+    numeric, categorical = [], []
+    for _, transformer, columns in preprocessor.transformers_:
+        if transformer == "drop" or not len(columns):
+            continue
+        step = final_step(transformer)
+        if hasattr(step, "categories_"):
+            drop_idx = getattr(step, "drop_idx_", None)
+            for i, column in enumerate(columns):
+                drop = None if drop_idx is None or drop_idx[i] is None else int(drop_idx[i])
+                categorical.append({"name": column,
+                                    "categories": [plain(value) for value in step.categories_[i]],
+                                    "drop": drop})
+        elif hasattr(step, "scale_") or hasattr(step, "mean_"):
+            means = step.mean_ if getattr(step, "mean_", None) is not None else np.zeros(len(columns))
+            scales = step.scale_ if getattr(step, "scale_", None) is not None else np.ones(len(columns))
+            for column, mean, scale in zip(columns, means, scales):
+                numeric.append({"name": column, "mean": float(mean), "scale": float(scale)})
+        else:
+            raise TypeError(f"Unsupported transformer {type(step).__name__} for {columns}")
+
+    n_features = len(numeric) + sum(len(c["categories"]) - (c["drop"] is not None) for c in categorical)
+    return {"numeric": numeric, "categorical": categorical, "n_features": n_features}
+
+
+class FeatureEncoder:
+    """
+    Turns `PredictionFeatures` (or columns of a batch) into the matrix the regressor was trained on.
+    With `handle_unknown="error"` an unknown category raises UnknownCategoryError, with "ignore"
+    it gets no column, like the dropped category.
+    """
+
+    def __init__(self, spec, handle_unknown="error"):
+        if handle_unknown not in ("error", "ignore"):
+            raise ValueError("handle_unknown should be 'error' or 'ignore'")
+        self.spec = spec
+        self.handle_unknown = handle_unknown
+        self.n_features = spec["n_features"]
+        self.numeric = [(c["name"], i, c["mean"], c["scale"]) for i, c in enumerate(spec["numeric"])]
+
+        # value -> output column, None for the dropped category
+        self.categorical = []
+        column = len(self.numeric)
+        for c in spec["categorical"]:
+            lookup = {}
+            for i, value in enumerate(c["categories"]):
+                if i == c["drop"]:
+                    lookup[value] = None
+                else:
+                    lookup[value] = column
+                    column += 1
+            self.categorical.append((c["name"], lookup))
+
+    @classmethod
+    def from_model(cls, model, **kwargs):
+        return cls(export_encoding(model), **kwargs)
+
+    @property
+    def vocabularies(self):
+        return {c["name"]: c["categories"] for c in self.spec["categorical"]}
+
+    def encode_into(self, item, out):
+        """
+        Write the features of one item into the zeroed row `out`.
+        """
+        for name, i, mean, scale in self.numeric:
+            out[i] = (getattr(item, name) - mean) / scale
+        for name, lookup in self.categorical:
+            value = getattr(item, name)
+            try:
+                column = lookup[value]
+            except (KeyError, TypeError):
+                if self.handle_unknown == "error":
+                    raise UnknownCategoryError(name, value)
+                continue
+            if column is not None:
+                out[column] = 1.0
+        return out
+
+    def encode(self, items, out=None):
+        """
+        Matrix of shape (len(items), n_features). Pass a preallocated `out` to reuse its memory.
+        """
+        if out is None:
+            out = np.zeros((len(items), self.n_features))
+        else:
+            out[:] = 0.0
+        for row, item in zip(out, items):
+            self.encode_into(item, row)
+        return out
+
+    def encode_columns(self, columns):
+        """
+        Matrix for a batch given as columns (a DataFrame or a dict of arrays), one pass per column.
+        """
+        n_rows = len(columns[self.numeric[0][0]] if self.numeric else columns[self.categorical[0][0]])
+        out = np.zeros((n_rows, self.n_features))
+        for name, i, mean, scale in self.numeric:
+            out[:, i] = (np.asarray(columns[name], dtype=np.float64) - mean) / scale
+        rows = np.arange(n_rows)
+        for name, lookup in self.categorical:
+            values = np.asarray(columns[name], dtype=object)
+            codes = lookup_codes(lookup, values)
+            unknown = codes == -2
+            if unknown.any() and self.handle_unknown == "error":
+                bad_rows = np.flatnonzero(unknown).tolist()
+                raise UnknownCategoryError(name, values[bad_rows[0]], bad_rows)
+            hot = codes >= 0
+            out[rows[hot], codes[hot]] = 1.0
+        return out
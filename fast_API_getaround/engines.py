@@ -0,0 +1,89 @@
+import logging
+
+from artifact import ModelArtifact
+from batch import features_frame
+from encoding import FeatureEncoder
+from forest import ForestPredictor, forest_estimator
+from linear import LinearKernel, is_linear, verify
+from logs import log_event
+
+
+# Inference engines of the API.
+# `build_engine` wraps the unpickled pipeline into the object used to predict, with
+# `predict(df)` for DataFrames and `predict_features(items)` for validated `PredictionFeatures`.
+# "sklearn" serves the pipeline as is. "encoded" replaces the ColumnTransformer by the NumPy
+# FeatureEncoder. "compiled" also replaces the regressor by a faster equivalent when one exists.
+# Linear regressors are folded into a LinearKernel with both "encoded" and "compiled", once checked
+# against the pipeline.
+
+ENGINES = ["sklearn", "encoded", "compiled"]
+
+# Engines that price a car in a few microseconds: waiting to batch a car, or handing it to a thread,
+# costs more than its prediction, so the API predicts them one by one on the event loop
+INLINE_ENGINES = ["linear-kernel"]
+
+
+class SklearnEngine:
+    name = "sklearn"
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def predict(self, df):
+        return self.pipeline.predict(df)
+
+    def predict_features(self, items):
+        return self.pipeline.predict(features_frame(items))
+
+
+class EncodedEngine:
+    """
+    FeatureEncoder in front of any regressor with a `predict(X)` method.
+    """
+
+    def __init__(self, encoder, regressor, name="encoded"):
+        self.encoder = encoder
+        self.regressor = regressor
+        self.name = name
+
+    def predict(self, df):
+        return self.regressor.predict(self.encoder.encode_columns(df))
+
+    def predict_features(self, items):
+        return self.regressor.predict(self.encoder.encode(items))
+
+
+def build_engine(pipeline, engine="encoded"):
+    """
+    Returns `(engine_name, model)` where `model` gives the same prices as `pipeline.predict(df)`.
+    Falls back to a simpler engine when the pipeline is not supported.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if isinstance(pipeline, ModelArtifact):
+        # artifacts hold no scikit-learn objects, they have a single engine
+        return pipeline.build()
+    if engine == "sklearn" or not hasattr(pipeline, "steps"):
+        return "sklearn", SklearnEngine(pipeline)
+    try:
+        encoder = FeatureEncoder.from_model(pipeline)
+    except TypeError:
+        return "sklearn", SklearnEngine(pipeline)
+
+    regressor = pipeline.steps[-1][1]
+    if is_linear(regressor):
+        try:
+            kernel = LinearKernel.from_pipeline(pipeline)
+            verify(kernel, pipeline)
+        except (TypeError, ValueError) as error:
+            log_event("linear_kernel_not_used", logging.WARNING, error=str(error))
+        else:
+            return "linear-kernel", kernel
+    if engine == "compiled":
+        try:
+            forest_estimator(regressor)
+        except TypeError:
+            pass
+        else:
+            return "compiled-forest", EncodedEngine(encoder, ForestPredictor.from_estimator(regressor), "compiled-forest")
+    return "encoded", EncodedEngine(encoder, regressor)
@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from engines import build_engine
+from metrics import INFERENCE_PENDING, STAGE_SECONDS
+from registry import load_model_file
+
+
+# Inference pool of the API.
+# `/predict` runs the model outside of the event loop, so a slow prediction does not hold the other
+# requests of the worker. "thread" shares the model of the registry with a thread pool. "process"
+# starts child processes that each load the model once, so predictions of the random forest are not
+# serialized by the GIL. "inline" predicts on the event loop, as before. Models whose engine is in
+# `inline_engines` are predicted on the event loop with any pool: handing them to a thread or a child
+# costs more than their prediction.
+# At most `max_pending` predictions wait or run at the same time, past that `run` raises
+# PoolSaturated and the API answers 503 with a Retry-After header instead of queueing.
+# Children keep their models by file snapshot (see ModelRegistry), one per version: a request is
+# priced by the version it started with even when the API reloaded a new one since.
+
+CHILD_MODELS = 2 # versions kept by a child process: the current one and the one before
+
+POOLS = ["inline", "thread", "process"]
+
+
+class PoolSaturated(Exception):
+    """
+    Raised when the inference pool already holds `max_pending` predictions.
+    """
+
+    def __init__(self, pending, retry_after):
+        super().__init__(f"{pending} predictions pending")
+        self.pending = pending
+        self.retry_after = retry_after
+
+
+class FeatureRecord(dict):
+    """
+    Car features sent to a child process: a dict that also reads like `PredictionFeatures`.
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+# State of a child process: its engine and the models it loaded, by snapshot path, oldest first
+_child = {"models": {}}
+
+
+def _init_child(path, engine):
+    _child["engine"] = engine
+    _child_model(path)
+
+
+def _child_model(path):
+    models = _child["models"]
+    model = models.pop(path, None)
+    if model is None:
+        model = build_engine(load_model_file(path), _child["engine"])[1]
+    models[path] = model
+    while len(models) > CHILD_MODELS:
+        del models[next(iter(models))]
+    return model
+
+
+def _child_ready():
+    return os.getpid(), list(_child["models"])
+
+
+def _child_predict(path, records):
+    """
+    Predict in a child process with the model of the snapshot at `path`, loaded on first use.
+    """
+    return _child_model(path).predict_features([FeatureRecord(record) for record in records])
+
+
+def model_file(model_version):
+    # the snapshot of the version, the model path when the registry keeps no snapshots
+    return model_version.snapshot or model_version.path
+
+
+class InferencePool:
+    def __init__(self, kind="thread", workers=None, max_pending=256, retry_after=1, inline_engines=()):
+        if kind not in POOLS:
+            raise ValueError(f"Unknown inference pool {kind!r}, expected one of {POOLS}")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.inline_engines = list(inline_engines)
+        self.pending = 0
+        self._executor = None
+
+    def start(self, model_version, engine):
+        """
+        Create the pool. Child processes are started now and load the model before the first request.
+        """
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inference")
+        elif self.kind == "process":
+            # spawn: children do not inherit the threads and locks of the API (log writer, model watcher)
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_child, initargs=(model_file(model_version), engine))
+            futures = [self._executor.submit(_child_ready) for _ in range(self.workers)]
+            for future in futures:
+                future.result()
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def describe(self):
+        return {"kind": self.kind, "workers": self.workers if self.kind != "inline" else 0,
+                "inline_engines": self.inline_engines, "pending": self.pending, "max_pending": self.max_pending}
+
+    async def predict(self, model_version, items):
+        """
+        Predictions of `model_version` for a list of `PredictionFeatures`.
+        """
+        if self.kind == "inline" or self._executor is None or model_version.engine in self.inline_engines:
+            return model_version.model.predict_features(items)
+        if self.pending >= self.max_pending:
+            raise PoolSaturated(self.pending, self.retry_after)
+
+        self.pending += 1
+        INFERENCE_PENDING.set(self.pending)
+        submitted = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            if self.kind == "thread":
+                def task():
+                    STAGE_SECONDS.observe(time.perf_counter() - submitted, stage="queue_wait")
+                    return model_version.model.predict_features(items)
+                return await loop.run_in_executor(self._executor, task)
+            records = [dict(item) for item in items]
+            return await loop.run_in_executor(self._executor, _child_predict, model_file(model_version), records)
+        finally:
+            self.pending -= 1
+            INFERENCE_PENDING.set(self.pending)
@@ -0,0 +1,163 @@
+import argparse
+import time
+
+import numpy as np
+
+
+# Compiled inference for tree ensembles (RandomForestRegressor of PART_2).
+# Every tree of the fitted forest is flattened into the same contiguous node arrays, so a batch of
+# rows walks all the trees at once with NumPy indexing, one tree level per step.
+
+LEAF = -1
+
+
+def as_dense(X):
+    return X.toarray() if hasattr(X, "toarray") else np.asarray(X)
+
+
+def forest_estimator(model):
+    """
+    Fitted forest of a model: the model itself or the last step of a Pipeline.
+    """
+    if hasattr(model, "steps"):
+        model = model.steps[-1][1]
+    # gradient boosting also has estimators_, but adds up its trees instead of averaging them
+    if not hasattr(model, "estimators_") or hasattr(model, "learning_rate"):
+        raise TypeError(f"{type(model).__name__} is not a fitted random forest")
+    return model
+
+
+def export_forest(model):
+    """
+    Flatten a fitted forest into contiguous node arrays.
+    Leaves point to themselves with an infinite threshold, so walking a row past its leaf keeps it there.
+    """
+    forest = forest_estimator(model)
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    sizes = np.array([tree.node_count for tree in trees])
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    feature = np.concatenate([tree.feature for tree in trees]).astype(np.int32)
+    threshold = np.concatenate([tree.threshold for tree in trees]).astype(np.float64)
+    value = np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64)
+    left = np.concatenate([np.where(tree.children_left == LEAF, np.arange(tree.node_count), tree.children_left) + root
+                           for tree, root in zip(trees, roots)]).astype(np.int32)
+    right = np.concatenate([np.where(tree.children_right == LEAF, np.arange(tree.node_count), tree.children_right) + root
+                            for tree, root in zip(trees, roots)]).astype(np.int32)
+    is_leaf = left == np.arange(len(left))
+    feature[is_leaf] = 0
+    threshold[is_leaf] = np.inf
+
+    return {
+        "feature": feature,
+        "threshold": threshold,
+        "left": left,
+        "right": right,
+        "value": value,
+        "roots": roots.astype(np.int32),
+        "max_depth": np.int32(max(tree.max_depth for tree in trees)),
+        "n_features": np.int32(forest.n_features_in_),
+    }
+
+
+class ForestPredictor:
+    """
+    Batch predictor over the arrays of `export_forest`, equal to `RandomForestRegressor.predict`.
+    """
+
+    def __init__(self, arrays, chunk_size=1024):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+        self.n_features = int(arrays["n_features"])
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_estimator(cls, model, **kwargs):
+        return cls(export_forest(model), **kwargs)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None, **kwargs):
+        return cls(dict(np.load(path, mmap_mode=mmap_mode)), **kwargs)
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 value=self.value, roots=self.roots, max_depth=self.max_depth, n_features=self.n_features)
+
+    def _predict_chunk(self, X):
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].mean(axis=1)
+
+    def predict(self, X):
+        # sklearn compares float32 features with float64 thresholds, do the same for identical splits
+        X = as_dense(X).astype(np.float32).astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape}")
+        return np.concatenate([self._predict_chunk(X[start:start + self.chunk_size])
+                               for start in range(0, len(X), self.chunk_size)] or [np.empty(0)])
+
+
+class CompiledForestPipeline:
+    """
+    Drop-in for a fitted `Pipeline(preprocessor, forest)`: same preprocessing, compiled forest.
+    """
+
+    def __init__(self, preprocessor, predictor):
+        self.preprocessor = preprocessor
+        self.predictor = predictor
+
+    @classmethod
+    def from_pipeline(cls, pipeline, **kwargs):
+        return cls(pipeline.steps[0][1], ForestPredictor.from_estimator(pipeline, **kwargs))
+
+    def predict(self, df):
+        return self.predictor.predict(self.preprocessor.transform(df))
+
+
+def main():
+    import joblib
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Export a RandomForest pricing pipeline to NumPy node arrays")
+    parser.add_argument("model", help="joblib file of the fitted Pipeline, e.g. model_rforest.joblib")
+    parser.add_argument("output", help="npz file to write, e.g. model_rforest.npz")
+    parser.add_argument("--check", metavar="CSV", help="compare with sklearn on this pricing CSV")
+    args = parser.parse_args()
+
+    pipeline = joblib.load(args.model)
+    predictor = ForestPredictor.from_estimator(pipeline)
+    predictor.save(args.output)
+    print(f"Exported {len(predictor.roots)} trees, {len(predictor.value)} nodes to {args.output}")
+
+    if args.check:
+        df = pd.read_csv(args.check, index_col=0).drop(columns="rental_price_per_day", errors="ignore")
+        compiled = CompiledForestPipeline(pipeline.steps[0][1], ForestPredictor.load(args.output))
+        start = time.perf_counter()
+        expected = pipeline.predict(df)
+        sklearn_time = time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = compiled.predict(df)
+        compiled_time = time.perf_counter() - start
+        error = np.abs(expected - predicted).max()
+        print(f"Rows: {len(df)}, max abs difference: {error:.3g}")
+        print(f"sklearn: {sklearn_time:.3f}s, compiled: {compiled_time:.3f}s")
+        single = df.iloc[:1]
+        for name, model in [("sklearn", pipeline), ("compiled", compiled)]:
+            start = time.perf_counter()
+            for _ in range(100):
+                model.predict(single)
+            print(f"{name} single row: {(time.perf_counter() - start) * 10:.2f} ms")
+        if not np.allclose(expected, predicted, rtol=0, atol=1e-6):
+            raise SystemExit("Compiled forest does not match sklearn predictions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import numpy as np
+
+from encoding import UnknownCategoryError, export_encoding, lookup_codes
+
+
+# Closed-form kernel for linear pricing models (model_lr of PART_2).
+# The StandardScaler and the one-hot coefficients are folded into one weight table per categorical
+# feature, so a price is the bias, plus two scaled numerics, plus one table lookup per category.
+
+
+def is_linear(regressor):
+    coef = getattr(regressor, "coef_", None)
+    return coef is not None and np.ndim(coef) == 1
+
+
+class LinearKernel:
+    """
+    `price = bias + sum(numeric_weight * value) + sum(weights[feature][category])`
+    """
+
+    name = "linear-kernel"
+
+    def __init__(self, bias, numeric, categorical):
+        self.bias = bias
+        self.numeric = numeric # [(name, weight)]
+        self.categorical = categorical # [(name, {category: weight})]
+        # same tables as arrays, for batches: index of each category and its weight
+        self.indexes = [(name, {value: i for i, value in enumerate(table)}, np.array(list(table.values())))
+                        for name, table in categorical]
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """
+        Fold a fitted `Pipeline(ColumnTransformer, linear regressor)` into weight tables.
+        """
+        regressor = pipeline.steps[-1][1]
+        if not is_linear(regressor):
+            raise TypeError(f"{type(regressor).__name__} is not a single output linear model")
+        return cls.from_coefficients(export_encoding(pipeline), regressor.coef_, regressor.intercept_)
+
+    @classmethod
+    def from_coefficients(cls, spec, coef, intercept):
+        """
+        Fold the coefficients of a linear model trained on the features of `spec` (see `export_encoding`).
+        """
+        coef = np.asarray(coef, dtype=np.float64)
+        if len(coef) != spec["n_features"]:
+            raise TypeError(f"Regressor has {len(coef)} coefficients, preprocessing gives {spec['n_features']} features")
+
+        bias = float(intercept)
+        numeric = []
+        for i, c in enumerate(spec["numeric"]):
+            numeric.append((c["name"], float(coef[i] / c["scale"])))
+            bias -= float(coef[i] * c["mean"] / c["scale"])
+
+        categorical = []
+        column = len(spec["numeric"])
+        for c in spec["categorical"]:
+            table = {}
+            for i, value in enumerate(c["categories"]):
+                if i == c["drop"]:
+                    table[value] = 0.0
+                else:
+                    table[value] = float(coef[column])
+                    column += 1
+            categorical.append((c["name"], table))
+        return cls(bias, numeric, categorical)
+
+    def predict_one(self, item):
+        price = self.bias
+        for name, weight in self.numeric:
+            price += weight * getattr(item, name)
+        for name, table in self.categorical:
+            value = getattr(item, name)
+            try:
+                price += table[value]
+            except (KeyError, TypeError):
+                raise UnknownCategoryError(name, value)
+        return price
+
+    def predict_features(self, items):
+        return np.array([self.predict_one(item) for item in items], dtype=np.float64)
+
+    def predict(self, columns):
+        """
+        Prices for a batch given as columns (a DataFrame or a dict of NumPy arrays).
+        """
+        first = self.numeric[0][0] if self.numeric else self.categorical[0][0]
+        prices = np.full(len(columns[first]), self.bias)
+        for name, weight in self.numeric:
+            prices += weight * np.asarray(columns[name], dtype=np.float64)
+        for name, index, weights in self.indexes:
+            values = np.asarray(columns[name], dtype=object)
+            codes = lookup_codes(index, values, unknown=-1)
+            if (codes < 0).any():
+                bad_rows = np.flatnonzero(codes < 0).tolist()
+                raise UnknownCategoryError(name, values[bad_rows[0]], bad_rows)
+            prices += weights[codes]
+        return prices
+
+
+def probe_frame(spec, n_rows=64, seed=0):
+    """
+    Rows covering every category of every feature, with numerics spread around the training mean,
+    used to check a kernel against the pipeline it was built from.
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    n_rows = max(n_rows, max(len(c["categories"]) for c in spec["categorical"]))
+    columns = {}
+    for c in spec["numeric"]:
+        columns[c["name"]] = c["mean"] + c["scale"] * rng.normal(size=n_rows) * 2
+    for c in spec["categorical"]:
+        categories = c["categories"]
+        columns[c["name"]] = [categories[i % len(categories)] for i in rng.permutation(n_rows)]
+    return pd.DataFrame(columns)
+
+
+def verify(kernel, pipeline, atol=1e-9):
+    """
+    Largest absolute difference between the kernel and `pipeline.predict` on probe rows.
+    Raises ValueError if it is above `atol`.
+    """
+    probe = probe_frame(export_encoding(pipeline))
+    error = float(np.abs(kernel.predict(probe) - pipeline.predict(probe)).max())
+    if error > atol:
+        raise ValueError(f"Linear kernel differs from the pipeline by {error:.3g}")
+    return error
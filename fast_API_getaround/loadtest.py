@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+import pandas as pd
+import psutil
+
+from batch import FEATURES
+
+
+# Load test of the API.
+# Replays PredictionFeatures payloads sampled from get_around_pricing_project.csv against the app at a
+# given concurrency, either in-process through its ASGI interface (no server, no network), or against a
+# local uvicorn or gunicorn server started for the run. Latency percentiles, throughput and the RSS of
+# every server process are written as JSON, tagged with the git commit, so runs can be compared.
+# Usage: python loadtest.py --mode gunicorn --workers 2 --concurrency 16 --requests 2000 --output run.json
+#        python loadtest.py --mode asgi --compare run.json
+
+MODES = ["asgi", "uvicorn", "gunicorn"]
+SCENARIOS = ["predict", "preview", "batch", "mixed"]
+
+
+def sample_payloads(path, n, seed=0):
+    """
+    `n` PredictionFeatures payloads drawn from the pricing dataset, as JSON-ready dicts.
+    """
+    df = pd.read_csv(path, index_col=0)[FEATURES]
+    df = df.sample(n=n, replace=n > len(df), random_state=seed)
+    return json.loads(df.to_json(orient="records"))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    """
+    RSS in MB of the process `pid` and of its children (gunicorn workers), keyed on pid.
+    """
+    process = psutil.Process(pid)
+    result = {}
+    for p in [process] + process.children(recursive=True):
+        try:
+            result[str(p.pid)] = round(p.memory_info().rss / 2**20, 1)
+        except psutil.NoSuchProcess:
+            pass
+    return result
+
+
+def requests_for(scenario, payloads, batch_size):
+    """
+    Function of the request number returning the (method, url, kwargs) of the request.
+    """
+    if scenario == "predict":
+        return lambda i: ("POST", "/predict", {"json": payloads[i % len(payloads)]})
+    if scenario == "preview":
+        return lambda i: ("GET", "/", {"params": {"rows": 3}})
+    if scenario == "mixed":
+        # one preview for 9 predictions: shows whether predictions hold the cheap requests back
+        predict = requests_for("predict", payloads, batch_size)
+        return lambda i: ("GET", "/", {"params": {"rows": 3}}) if i % 10 == 0 else predict(i)
+    if scenario == "batch":
+        def batch(i):
+            start = (i * batch_size) % len(payloads)
+            return "POST", "/predict/batch", {"json": (payloads + payloads)[start:start + batch_size]}
+        return batch
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+async def run_scenario(client, make_request, n_requests, concurrency, warmup):
+    """
+    Send `n_requests` requests with `concurrency` requests in flight, after `warmup` untimed ones.
+    """
+    for i in range(warmup):
+        method, url, kwargs = make_request(i)
+        await client.request(method, url, **kwargs)
+
+    latencies = np.zeros(n_requests)
+    urls = [None] * n_requests
+    errors = 0
+    shed = 0
+    counter = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors, shed
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            urls[i] = url
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                await response.aread()
+                if response.status_code == 503:
+                    shed += 1
+                elif response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    result = {
+        "requests": n_requests,
+        "errors": errors,
+        "shed": shed,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(n_requests / duration, 1),
+        "latency_ms": latency_summary(latencies),
+    }
+    urls = np.array(urls)
+    if len(set(urls)) > 1:
+        result["latency_ms_by_route"] = {url: latency_summary(latencies[urls == url]) for url in sorted(set(urls))}
+    return result
+
+
+def latency_summary(latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "p50": round(p50, 3),
+        "p95": round(p95, 3),
+        "p99": round(p99, 3),
+        "mean": round(latencies.mean() * 1000, 3),
+        "max": round(latencies.max() * 1000, 3),
+    }
+
+
+async def run_all(client, pid, args, payloads):
+    results = {}
+    for scenario in args.scenarios:
+        make_request = requests_for(scenario, payloads, args.batch_size)
+        n_requests = args.batch_requests if scenario == "batch" else args.requests
+        result = await run_scenario(client, make_request, n_requests, args.concurrency, args.warmup)
+        result["rss_mb"] = rss_mb(pid)
+        results[scenario] = result
+        print_result(scenario, result)
+    return results
+
+
+async def run_asgi(args, payloads):
+    """
+    Requests go straight to the ASGI app of this process, with its startup and shutdown events.
+    """
+    from app import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            return await run_all(client, os.getpid(), args, payloads)
+
+
+def server_command(args, port):
+    if args.mode == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(args.workers), "--log-level", "warning"]
+    return [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers),
+            "--worker-class", "uvicorn.workers.UvicornWorker", "--log-level", "warning"]
+
+
+async def wait_ready(client, server, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/admin/model")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit(f"Server not ready after {timeout} seconds")
+
+
+async def run_server(args, payloads):
+    """
+    Requests go to a local uvicorn or gunicorn server started for the run, on a free port.
+    """
+    port = free_port()
+    server = subprocess.Popen(server_command(args, port), env=os.environ.copy())
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=args.timeout) as client:
+            await wait_ready(client, server)
+            return await run_all(client, server.pid, args, payloads)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def print_result(scenario, result):
+    latency = result["latency_ms"]
+    rss = sum(result["rss_mb"].values())
+    print(f"{scenario:<8} {result['requests']:>7} req  {result['errors']:>5} err  {result['shed']:>5} 503  "
+          f"{result['throughput_rps']:>9.1f} req/s  "
+          f"p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms  p99 {latency['p99']:8.2f} ms  "
+          f"RSS {rss:7.1f} MB ({len(result['rss_mb'])} processes)")
+    for url, latency in result.get("latency_ms_by_route", {}).items():
+        print(f"  {url:<14} p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms  p99 {latency['p99']:8.2f} ms")
+
+
+def compare(previous, current):
+    """
+    Print the change of throughput and latency percentiles since a previous run.
+    """
+    print(f"Compared with {previous.get('commit')} ({previous.get('mode')}, concurrency {previous.get('concurrency')}):")
+    for scenario, result in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(scenario)
+        if before is None:
+            continue
+        changes = [f"throughput {(result['throughput_rps'] / before['throughput_rps'] - 1) * 100:+.1f}%"]
+        for p in ["p50", "p95", "p99"]:
+            changes.append(f"{p} {(result['latency_ms'][p] / before['latency_ms'][p] - 1) * 100:+.1f}%")
+        print(f"  {scenario:<8} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the Getaround API")
+    parser.add_argument("--mode", choices=MODES, default="asgi")
+    parser.add_argument("--workers", type=int, default=1, help="server processes (uvicorn and gunicorn modes)")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--batch-requests", type=int, default=50, help="requests of the batch scenario")
+    parser.add_argument("--batch-size", type=int, default=500, help="cars per batch request")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds per request")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS[:3])
+    parser.add_argument("--data", default="../EDA_getaround/src/get_around_pricing_project.csv")
+    parser.add_argument("--payloads", type=int, default=1000, help="distinct cars replayed by /predict")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-cache", action="store_true", help="disable the prediction cache of the API")
+    parser.add_argument("--output", help="JSON file of the results")
+    parser.add_argument("--compare", help="JSON file of a previous run")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ["CACHE_MAX_ENTRIES"] = "0"
+    payloads = sample_payloads(args.data, max(args.payloads, args.batch_size), args.seed)
+    print(f"{args.mode} mode, {args.workers if args.mode != 'asgi' else 1} worker(s), concurrency {args.concurrency}")
+    if args.mode == "asgi":
+        scenarios = asyncio.run(run_asgi(args, payloads))
+    else:
+        scenarios = asyncio.run(run_server(args, payloads))
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "machine": platform.machine()},
+        "mode": args.mode,
+        "workers": args.workers if args.mode != "asgi" else 1,
+        "concurrency": args.concurrency,
+        "cache": not args.no_cache,
+        "model_engine": os.environ.get("MODEL_ENGINE", "encoded"),
+        "inference_pool": os.environ.get("INFERENCE_POOL", "thread"),
+        "batch_size": args.batch_size,
+        "scenarios": scenarios,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
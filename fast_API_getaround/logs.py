@@ -0,0 +1,90 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+from metrics import LOG_DROPPED
+
+
+# Structured logging of the API.
+# Records are JSON lines written by a background thread: the request only puts the record in a
+# bounded queue, and drops it (counted in /metrics) when the queue is full instead of waiting.
+# Routine records (one per prediction) are sampled, warnings and errors are always kept.
+
+LOGGER_NAME = "getaround"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keep `sample_rate` of the records below WARNING, and every record from WARNING up.
+    """
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.sample_rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+    def prepare(self, record):
+        # formatting happens in the listener thread, only the exception text is resolved here
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(sample_rate=0.01, level=logging.INFO, max_queue=10000, stream=None):
+    """
+    Configure the "getaround" logger and start its writer thread. Returns the listener, to stop
+    on shutdown (`listener.stop()` flushes the queue).
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    records = queue.Queue(maxsize=max_queue)
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(SampleFilter(sample_rate))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=False)
+    listener.start()
+    return listener
+
+
+def log_event(event, level=logging.INFO, exc_info=False, **fields):
+    """
+    Log `event` with `fields` as JSON keys, e.g. `log_event("prediction", price=120.8)`.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
@@ -0,0 +1,209 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Prometheus-style metrics of the API, in the text exposition format served on `/metrics`.
+# Counters and histograms live in the worker process: with several gunicorn workers every scrape
+# reaches one worker, so each series carries a `worker` label (the pid) to be summed by the query.
+# Instruments are module-level objects, like prometheus_client, so any module can record into them.
+
+# seconds, from 50 microseconds (cache hit) to 10 seconds (large batch)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self, extra=()):
+        lines = self.header()
+        with self._lock:
+            values = self._values or ({(): 0} if not self.labelnames else {})
+            for key, value in sorted(values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames + extra[0::2], key + extra[1::2])} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    """
+    Cumulative bucket counts, sum and count of the observed values, per label values.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # one count per bucket plus +Inf, then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def render(self, extra=()):
+        lines = self.header()
+        names = self.labelnames + extra[0::2]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                values = key + extra[1::2]
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{format_labels(names + ('le',), values + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(names, values)} {total}")
+                lines.append(f"{self.name}_count{format_labels(names, values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, **extra_labels):
+        """
+        Every metric in the text exposition format, with `extra_labels` added to each series.
+        """
+        extra = tuple(item for pair in extra_labels.items() for item in pair)
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(extra))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REQUESTS = REGISTRY.register(Counter(
+    "getaround_requests_total", "HTTP requests by route, method and status code.", ("route", "method", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "getaround_request_duration_seconds", "Time from the request to the last byte of the response.", ("route", "method")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "getaround_stage_duration_seconds", "Time spent in each stage of the prediction path.", ("stage",)))
+ERRORS = REGISTRY.register(Counter(
+    "getaround_errors_total", "Errors by endpoint and kind, including those returned with a 200 status.", ("endpoint", "kind")))
+BATCH_ROWS = REGISTRY.register(Histogram(
+    "getaround_batch_rows", "Number of cars per batch request.", (), buckets=(1, 10, 100, 1000, 10000, 100000)))
+MODEL_INFO = REGISTRY.register(Gauge(
+    "getaround_model_info", "Model currently served, value is always 1.", ("version", "engine")))
+MODEL_LOAD_SECONDS = REGISTRY.register(Histogram(
+    "getaround_model_load_seconds", "Time to unpickle a model file and build its engine.", (),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+MICROBATCH_SIZE = REGISTRY.register(Histogram(
+    "getaround_microbatch_size", "Number of /predict requests answered by one call to the model.", (),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+INFERENCE_PENDING = REGISTRY.register(Gauge(
+    "getaround_inference_pending", "Predictions waiting for or running in the inference pool."))
+LOG_DROPPED = REGISTRY.register(Counter(
+    "getaround_log_records_dropped_total", "Log records dropped because the log queue was full."))
+
+
+def set_model(model_version):
+    """
+    Registry listener: publish the version served and the time it took to load.
+    """
+    MODEL_INFO.clear()
+    MODEL_INFO.set(1, version=model_version.version, engine=model_version.engine)
+    MODEL_LOAD_SECONDS.observe(model_version.load_seconds)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them until the response body is sent, streamed
+    responses included. Routes are labelled with their path template, unknown paths as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        scope.setdefault("state", {})["request_start"] = start
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUESTS.inc(route=path, method=scope["method"], status=status)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route=path, method=scope["method"])
+            if status >= 400:
+                ERRORS.inc(endpoint=path, kind=f"http_{status}")
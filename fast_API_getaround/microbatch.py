@@ -0,0 +1,150 @@
+import asyncio
+import time
+from collections import namedtuple
+
+from executor import PoolSaturated
+from metrics import ERRORS, MICROBATCH_SIZE, STAGE_SECONDS
+
+
+# Micro-batching of /predict.
+# Concurrent single predictions are queued and sent to the model together, as one vectorized call
+# of at most `max_size` cars, and every result is handed back to its request. It adapts to the load:
+# a car that comes alone to an idle API goes at once, so it adds no wait. When batches are running
+# (one per worker of the inference pool) or the last batch had several cars, new requests wait up
+# to `max_wait` seconds for more cars. Each request can have a deadline: a car still queued when it
+# passes is dropped.
+
+Pending = namedtuple("Pending", ["model_version", "item", "future", "deadline", "queued_at"])
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a prediction is not done before the deadline of its request.
+    """
+
+
+class MicroBatcher:
+    def __init__(self, pool, max_size=32, max_wait=0.005, timeout=None, max_pending=256):
+        self.pool = pool
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.timeout = timeout or None # seconds per request, None waits for the result
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.last_size = 0
+        self._queue = None
+        self._collector = None
+        self._slots = None
+
+    def _start(self):
+        # created on the first request, inside the event loop of the worker
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(1 if self.pool.kind == "inline" else self.pool.workers)
+        self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+
+    def describe(self):
+        return {"max_size": self.max_size, "max_wait": self.max_wait, "timeout": self.timeout,
+                "queued": self._queue.qsize() if self._queue is not None else 0, "in_flight": self.in_flight}
+
+    async def predict(self, model_version, item, elapsed=0.0):
+        """
+        Prediction of one `PredictionFeatures`, computed in a batch with the concurrent requests.
+        `elapsed` is the time the request already spent before, counted in its deadline.
+        """
+        if self._collector is None:
+            self._start()
+        if self._queue.qsize() >= self.max_pending:
+            raise PoolSaturated(self._queue.qsize(), self.pool.retry_after)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        future = loop.create_future()
+        deadline = now + self.timeout - elapsed if self.timeout else None
+        if deadline is not None and deadline <= now:
+            ERRORS.inc(endpoint="/predict", kind="deadline_exceeded")
+            raise DeadlineExceeded(f"Request already took more than {self.timeout} seconds")
+        self._queue.put_nowait(Pending(model_version, item, future, deadline, now))
+        if deadline is None:
+            return await future
+        try:
+            # shield: a batch already running still sets the result of the other cars
+            return await asyncio.wait_for(asyncio.shield(future), deadline - now)
+        except asyncio.TimeoutError:
+            future.cancel()
+            ERRORS.inc(endpoint="/predict", kind="deadline_exceeded")
+            raise DeadlineExceeded(f"No prediction after {self.timeout} seconds")
+
+    def _take(self, batch):
+        while len(batch) < self.max_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            self._take(batch)
+            if (self.in_flight or self.last_size > 1) and len(batch) < self.max_size:
+                # under load: wait a little for more cars rather than sending a small batch
+                cutoff = loop.time() + self.max_wait
+                while len(batch) < self.max_size:
+                    remaining = cutoff - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                    self._take(batch)
+            await self._slots.acquire()
+            # cars that came in while every slot was busy join this batch
+            self._take(batch)
+            self.last_size = len(batch)
+            self.in_flight += 1
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            now = loop.time()
+            live = []
+            for pending in batch:
+                if pending.future.done():
+                    continue # request timed out or went away
+                if pending.deadline is not None and now >= pending.deadline:
+                    pending.future.set_exception(DeadlineExceeded("Deadline passed before the prediction started"))
+                    continue
+                STAGE_SECONDS.observe(now - pending.queued_at, stage="batch_wait")
+                live.append(pending)
+            MICROBATCH_SIZE.observe(len(live))
+            # a model reload can put two versions in the same batch
+            by_version = {}
+            for pending in live:
+                by_version.setdefault(pending.model_version.version, []).append(pending)
+            for group in by_version.values():
+                await self._predict_group(group)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def _predict_group(self, group):
+        model_version = group[0].model_version
+        try:
+            start = time.perf_counter()
+            predictions = await self.pool.predict(model_version, [pending.item for pending in group])
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="batch_predict")
+        except Exception as error:
+            if len(group) == 1:
+                if not group[0].future.done():
+                    group[0].future.set_exception(error)
+                return
+            # one bad car (e.g. unknown model_key) fails the call: predict them one by one
+            for pending in group:
+                await self._predict_group([pending])
+            return
+        for pending, value in zip(group, predictions.tolist()):
+            if not pending.future.done():
+                pending.future.set_result(value)
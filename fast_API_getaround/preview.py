@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Dataset served by the `/` preview endpoint.
+# The table is read once per worker, from the pricing dataset of the repository (EDA_getaround/src) by
+# default, and kept in memory with compact dtypes. A remote source can be configured: it is cached on
+# disk with its ETag and revalidated on load, and the cached or local copy is used when the network
+# is unavailable.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.path.join(os.path.dirname(HERE), "EDA_getaround", "src", "get_around_pricing_project.csv")
+CACHE_DIR = os.path.join(HERE, "src", ".cache")
+
+
+def compact(df):
+    """
+    Shrink a pricing table in memory: categories for strings, smallest integer types for numbers.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("category")
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="float")
+    return df
+
+
+def fetch_cached(url, cache_dir, timeout=10):
+    """
+    Download `url` into `cache_dir`, sending the ETag of the cached copy so an unchanged file is not
+    downloaded again. Returns the path of the cached file, even if the server could not be reached.
+    """
+    import requests
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path = os.path.join(cache_dir, os.path.basename(url.split("?")[0]) or "preview.csv")
+    meta_path = data_path + ".meta.json"
+    headers = {}
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+    except requests.RequestException:
+        return data_path if os.path.exists(data_path) else None
+    if response.status_code == 304:
+        return data_path
+    if response.status_code != 200:
+        return data_path if os.path.exists(data_path) else None
+
+    tmp_path = data_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(response.content)
+    os.replace(tmp_path, data_path)
+    with open(meta_path, "w") as f:
+        json.dump({"etag": response.headers.get("ETag"),
+                   "last_modified": response.headers.get("Last-Modified")}, f)
+    return data_path
+
+
+def floyd_sample(rng, n, k):
+    """
+    `k` distinct row positions out of `n` with Robert Floyd's algorithm, in O(k) time and memory.
+    """
+    selected = {}
+    for j in range(n - k, n):
+        t = int(rng.integers(0, j + 1))
+        selected[j if t in selected else t] = None
+    return np.fromiter(selected, dtype=np.int64, count=k)
+
+
+class PreviewDataset:
+    """
+    In-memory pricing table with O(rows requested) random sampling.
+    """
+
+    def __init__(self, path=DATASET_PATH, url=None, cache_dir=None):
+        self.path = path
+        self.url = url
+        self.cache_dir = cache_dir or CACHE_DIR
+        self._data = None
+
+    def load(self):
+        path = self.path
+        if self.url:
+            path = fetch_cached(self.url, self.cache_dir) or self.path
+        self._data = compact(pd.read_csv(path))
+        return self._data
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.load()
+        return self._data
+
+    def sample(self, rows, seed=None):
+        """
+        `rows` random rows of the table. The same `seed` always returns the same rows.
+        """
+        if rows < 0:
+            raise ValueError("Number of rows should be positive")
+        data = self.data
+        rows = min(rows, len(data))
+        rng = np.random.default_rng(seed)
+        return data.take(floyd_sample(rng, len(data), rows))
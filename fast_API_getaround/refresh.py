@@ -0,0 +1,237 @@
+import argparse
+import io
+import itertools
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import SGDRegressor
+
+from artifact import write_artifact
+from batch import NUMERIC_FEATURES, validate_columns
+from encoding import export_encoding
+from train import TARGET, build_preprocessor, categorical_columns, rmse
+
+
+# Incremental refresh of the pricing model.
+# Reads only the rows appended to a get_around_pricing_project.csv-shaped file since the last run
+# (the state file keeps the byte offset), and learns them in chunks with an SGDRegressor on the same
+# preprocessing as train.py. The StandardScaler follows the running mean and variance of all the
+# rows seen, and the coefficients are rescaled when it moves so the model gives the same prices.
+# Each chunk is scored before it is learnt (prequential validation): the running RMSE is an error on
+# rows the model had not seen yet. The result is published as a linear artifact (artifact.py) that
+# the API reloads with MODEL_PATH=model.artifact MODEL_WATCH_INTERVAL=5.
+# The file is read `--chunk-size` rows at a time, so memory does not grow with the rows appended.
+# Categories are those of the model given with --categories-from on the first run (default: the model
+# served by the API): rows with a new model_key are skipped and counted, a full training (train.py)
+# is needed to learn them.
+# Usage: python refresh.py ../EDA_getaround/src/get_around_pricing_project.csv --state refresh.state --output model.artifact
+
+NUMERIC_COLUMNS = slice(0, len(NUMERIC_FEATURES))
+
+
+def new_state(regressor_params):
+    return {
+        "offset": None,
+        "header": None,
+        "vocabulary": None,
+        "preprocessor": None,
+        "regressor": SGDRegressor(**regressor_params),
+        "target_offset": 0.0,
+        "rows_trained": 0,
+        "rows_skipped": 0,
+        "squared_error": 0.0,
+        "rows_scored": 0,
+        "runs": [],
+    }
+
+
+def load_state(path, regressor_params):
+    if path and os.path.exists(path):
+        return joblib.load(path)
+    return new_state(regressor_params)
+
+
+def save_state(state, path):
+    tmp_path = path + ".tmp"
+    joblib.dump(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def model_vocabulary(path):
+    """
+    Categories of the model in `path` (joblib Pipeline or artifact), in the column order of train.py.
+    """
+    from registry import load_model_file, vocabularies_of
+
+    vocabularies = vocabularies_of(load_model_file(path))
+    return [vocabularies[name] for name in categorical_columns()]
+
+
+def new_chunks(path, state, chunk_size):
+    """
+    Yield `(DataFrame, offset after it)` for every `chunk_size` rows appended since the last run.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        if state["header"] is None:
+            state["header"], state["offset"] = header, len(header)
+        elif header != state["header"]:
+            raise SystemExit(f"The columns of {path} changed since the last run, start again with --reset")
+        size = os.fstat(f.fileno()).st_size
+        if size < state["offset"]:
+            raise SystemExit(f"{path} is shorter than at the last run, start again with --reset")
+        f.seek(state["offset"])
+        offset = state["offset"]
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if lines and not lines[-1].endswith(b"\n"):
+                # a line still being written is left for the next run
+                lines.pop()
+            if not lines:
+                return
+            data = b"".join(lines)
+            offset += len(data)
+            if data.strip():
+                yield pd.read_csv(io.BytesIO(header + data), index_col=0), offset
+
+
+def clean(df, vocabulary):
+    """
+    Validated features, target, and the number of rows dropped: invalid values or unknown categories.
+    """
+    n_rows = len(df)
+    # drop the rows validate_columns rejects
+    features, errors = validate_columns(df)
+    valid = pd.isna(errors)
+    df, features = df[valid], features[valid].reset_index(drop=True)
+    target = pd.to_numeric(df[TARGET], errors="coerce").to_numpy()
+    keep = ~np.isnan(target)
+    for name, categories in zip(categorical_columns(), vocabulary):
+        keep &= features[name].isin(categories).to_numpy()
+    return features[keep].reset_index(drop=True), target[keep], n_rows - int(keep.sum())
+
+
+def rescale(state, X_numeric):
+    """
+    Update the scaler with the numeric columns of a chunk, and fold the change into the coefficients:
+    w * (x - m0) / s0 == w * s1 / s0 * (x - m1) / s1 + w * (m1 - m0) / s0
+    """
+    scaler = state["preprocessor"].named_transformers_["num"].steps[-1][1]
+    mean, scale = scaler.mean_.copy(), scaler.scale_.copy()
+    scaler.partial_fit(X_numeric)
+    regressor = state["regressor"]
+    if hasattr(regressor, "coef_"):
+        weights = regressor.coef_[NUMERIC_COLUMNS].copy()
+        regressor.coef_[NUMERIC_COLUMNS] = weights * scaler.scale_ / scale
+        regressor.intercept_ += np.sum(weights * (scaler.mean_ - mean) / scale)
+
+
+def learn_chunk(state, features, target, epochs, rng):
+    """
+    Score the chunk with the current model, then learn it. Returns the RMSE of the chunk, or None
+    for the first chunk ever, which fits the preprocessing.
+    """
+    score = None
+    if state["preprocessor"] is None:
+        state["preprocessor"] = build_preprocessor(state["vocabulary"]).fit(features)
+        state["target_offset"] = float(target.mean())
+    else:
+        predicted = state["regressor"].predict(state["preprocessor"].transform(features)) + state["target_offset"]
+        score = rmse(predicted, target)
+        state["squared_error"] += float(((predicted - target) ** 2).sum())
+        state["rows_scored"] += len(target)
+        rescale(state, features[NUMERIC_FEATURES].to_numpy(dtype=np.float64))
+
+    X = state["preprocessor"].transform(features)
+    y = target - state["target_offset"]
+    for _ in range(epochs):
+        order = rng.permutation(len(y))
+        state["regressor"].partial_fit(X[order], y[order])
+    state["rows_trained"] += len(y)
+    return score
+
+
+def running_rmse(state):
+    return float(np.sqrt(state["squared_error"] / state["rows_scored"])) if state["rows_scored"] else None
+
+
+def publish(state, path, source):
+    regressor = state["regressor"]
+    metrics = {
+        "prequential_rmse": running_rmse(state),
+        "rows_scored": state["rows_scored"],
+        "rows_trained": state["rows_trained"],
+        "rows_skipped": state["rows_skipped"],
+    }
+    intercept = float(regressor.intercept_[0]) + state["target_offset"]
+    coef = np.asarray(regressor.coef_, dtype=np.float64)
+    return write_artifact(path, "linear", {"intercept": intercept}, {"coef": coef},
+                          export_encoding(state["preprocessor"]), metrics, source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn the rows appended to the pricing dataset and publish a model artifact")
+    parser.add_argument("data", help="CSV shaped like get_around_pricing_project.csv, appended to over time")
+    parser.add_argument("--state", default="refresh.state", help="file of the model and offset between runs")
+    parser.add_argument("--output", default="model.artifact", help="artifact published for the API")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--epochs", type=int, default=5, help="passes over each chunk")
+    parser.add_argument("--alpha", type=float, default=1e-4, help="L2 penalty of the SGDRegressor")
+    parser.add_argument("--eta0", type=float, default=0.01, help="initial learning rate of the SGDRegressor")
+    parser.add_argument("--categories-from", metavar="MODEL", default=os.environ.get("MODEL_PATH", "model.joblib"),
+                        help="take the categories of this model on the first run (default: MODEL_PATH or model.joblib)")
+    parser.add_argument("--max-rmse", type=float, help="do not publish when the RMSE of this run is above")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset", action="store_true", help="forget the state and learn the whole file again")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    start = time.perf_counter()
+    regressor_params = {"alpha": args.alpha, "eta0": args.eta0, "random_state": args.seed}
+    state = new_state(regressor_params) if args.reset else load_state(args.state, regressor_params)
+    if state["vocabulary"] is None:
+        if not os.path.exists(args.categories_from):
+            raise SystemExit(f"{args.categories_from} not found, give the model to take the categories from with --categories-from")
+        state["vocabulary"] = model_vocabulary(args.categories_from)
+
+    rng = np.random.default_rng(args.seed + len(state["runs"]))
+    squared_error, scored, skipped, rows, offset = 0.0, 0, 0, 0, state["offset"]
+    for df, offset in new_chunks(args.data, state, args.chunk_size):
+        features, target, dropped = clean(df, state["vocabulary"])
+        skipped += dropped
+        rows += len(df)
+        if not len(target):
+            continue
+        score = learn_chunk(state, features, target, args.epochs, rng)
+        if score is not None:
+            squared_error += score ** 2 * len(target)
+            scored += len(target)
+            print(f"  rows {rows - len(df):>7}-{rows:<7} "
+                  f"RMSE before learning {score:8.2f}   running {running_rmse(state):8.2f}")
+    if not rows:
+        print(f"No new rows in {args.data} since offset {state['offset']}")
+        return
+    state["rows_skipped"] += skipped
+    state["offset"] = offset
+    run_rmse = float(np.sqrt(squared_error / scored)) if scored else None
+    state["runs"].append({"time": time.time(), "rows": rows, "skipped": skipped, "rmse": run_rmse, "offset": offset})
+
+    published = False
+    if args.max_rmse is not None and run_rmse is not None and run_rmse > args.max_rmse:
+        print(f"RMSE of this run {run_rmse:.2f} above {args.max_rmse}, {args.output} not published")
+    elif skipped < rows:
+        publish(state, args.output, {"file": os.path.basename(args.data), "offset": offset, "trained_by": "refresh.py"})
+        published = True
+    save_state(state, args.state)
+
+    print(f"{rows} new rows ({skipped} skipped) in {time.perf_counter() - start:.2f} s, "
+          f"{state['rows_trained']} rows learnt in total, running RMSE {running_rmse(state) or float('nan'):.2f}"
+          + (f", published {args.output}" if published else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+
+from artifact import ModelArtifact, is_artifact
+from encoding import FeatureEncoder
+from logs import log_event
+
+
+# Model registry of the API.
+# The pricing pipeline is unpickled once per worker and shared by every request. A reload
+# builds a complete new ModelVersion before swapping the reference, so a request that already
+# holds the previous version keeps using it until it returns.
+# MODEL_PATH can be a joblib pickle or a compact artifact (artifact.py), recognized by its content.
+# With a `snapshot_dir`, every version is loaded from its own copy of the file, which child processes
+# read to get exactly that version. The copy is removed once nothing holds the version any more.
+
+
+def file_version(path):
+    """
+    Short content hash of a model file, used as the version reported by the API.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def snapshot_file(path, directory):
+    """
+    Copy of a model file in `directory`, under a name of its own that is never written again.
+    """
+    fd, snapshot = tempfile.mkstemp(dir=directory, prefix="model-", suffix=os.path.splitext(path)[1])
+    with os.fdopen(fd, "wb") as out, open(path, "rb") as f:
+        shutil.copyfileobj(f, out)
+    return snapshot
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def load_model_file(path):
+    """
+    Memory-mapped ModelArtifact, or the object unpickled from a joblib file.
+    """
+    if is_artifact(path):
+        return ModelArtifact.load(path)
+    import joblib
+
+    return joblib.load(path)
+
+
+def vocabularies_of(model):
+    """
+    Categories of every categorical feature of a model (Pipeline or ModelArtifact), by feature.
+    """
+    if isinstance(model, ModelArtifact):
+        return model.vocabularies
+    return FeatureEncoder.from_model(model).vocabularies
+
+
+def known_categories(model):
+    """
+    `vocabularies_of(model)`, None when the model does not expose its categories (it checks them itself).
+    """
+    try:
+        return vocabularies_of(model)
+    except TypeError:
+        return None
+
+
+@dataclass(frozen=True)
+class ModelVersion:
+    version: str
+    path: str
+    pipeline: object # object unpickled from the file
+    model: object # object used to predict, built from the pipeline
+    engine: str
+    mtime: float
+    load_seconds: float = 0.0 # time to unpickle the file and build the model
+    vocabularies: dict = None # categories the model was trained on, by feature, see known_categories
+    snapshot: str = None # copy of the file this version was loaded from, removed with the version
+    loaded_at: float = field(default_factory=time.time)
+
+    def describe(self):
+        description = {
+            "version": self.version,
+            "path": self.path,
+            "model": type(self.pipeline).__name__,
+            "engine": self.engine,
+            "load_seconds": self.load_seconds,
+            "loaded_at": self.loaded_at,
+        }
+        if isinstance(self.pipeline, ModelArtifact):
+            manifest = self.pipeline.manifest
+            description["artifact"] = {"kind": manifest["kind"], "metrics": manifest["metrics"],
+                                       "source": manifest["source"]}
+        return description
+
+
+class ModelRegistry:
+    """
+    Holds the model currently served by the API.
+    `current()` returns an immutable snapshot, `load()` swaps it atomically.
+    """
+
+    def __init__(self, path, build=None, snapshot_dir=None):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        # build(pipeline) -> (engine_name, model), e.g. engines.build_engine
+        self.build = build or (lambda pipeline: ("sklearn", pipeline))
+        self._current = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def load(self, path=None):
+        """
+        Load `path` (default: the registry path) and make it the served version.
+        Returns the new ModelVersion, or the current one if the file did not change.
+        """
+        path = path or self.path
+        with self._lock:
+            version = file_version(path)
+            current = self._current
+            if current is not None and current.version == version and current.path == path:
+                return current
+            start = time.perf_counter()
+            mtime = os.path.getmtime(path)
+            snapshot = None
+            if self.snapshot_dir is not None:
+                snapshot = snapshot_file(path, self.snapshot_dir)
+                # the file may have been replaced since it was hashed
+                version = file_version(snapshot)
+            try:
+                pipeline = load_model_file(snapshot or path)
+                engine, model = self.build(pipeline)
+            except BaseException:
+                if snapshot is not None:
+                    remove_file(snapshot)
+                raise
+            new = ModelVersion(version=version, path=path, pipeline=pipeline, model=model, engine=engine,
+                               mtime=mtime, load_seconds=time.perf_counter() - start,
+                               vocabularies=known_categories(pipeline), snapshot=snapshot)
+            if snapshot is not None:
+                # requests still running on this version hold it, its copy goes with the last of them
+                weakref.finalize(new, remove_file, snapshot)
+            self._current = new
+            self.path = path
+        for listener in self._listeners:
+            listener(new)
+        return new
+
+    def current(self):
+        current = self._current
+        if current is None:
+            current = self.load()
+        return current
+
+    def on_reload(self, listener):
+        """
+        Register `listener(model_version)`, called after every successful swap.
+        """
+        self._listeners.append(listener)
+
+    def _poll(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                current = self._current
+                if current is None or os.path.getmtime(self.path) != current.mtime:
+                    self.load()
+            except Exception as error:
+                # A file still being copied in will fail to unpickle, next poll will retry it
+                log_event("model_reload_failed", logging.WARNING, path=self.path, error=repr(error))
+
+    def watch(self, interval=5.0):
+        """
+        Start a daemon thread that reloads the model when the file on disk changes.
+        Drop a new file with an atomic rename (`mv model.tmp model.joblib`) to avoid
+        reading a partial copy.
+        """
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._poll, args=(interval,), daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
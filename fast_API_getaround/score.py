@@ -0,0 +1,222 @@
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch import validate_columns
+from engines import ENGINES, build_engine
+from registry import file_version, known_categories, load_model_file
+
+
+# Offline bulk scoring of listings, without the API.
+# A CSV or Parquet file shaped like get_around_pricing_project.csv is read in chunks of `--chunk-size`
+# rows. Each chunk goes to a child process that loaded the model once (same file and engines as the
+# API), where it is validated and encoded column by column and priced with one `predict` call; rows
+# that cannot be priced get an error message instead. At most two chunks per process are read ahead,
+# and chunks are written to the output CSV in input order as they come back, so memory does not grow
+# with the size of the input.
+# After every chunk the output is flushed and a checkpoint (`<output>.progress`) records how far the
+# input and the output went. A run started again with the same input, model and output truncates
+# the output to the checkpoint and carries on from there.
+# Parquet files need pyarrow.
+# Usage: python score.py listings.csv --output prices.csv --model model.joblib --workers 4
+
+# State of a child process: the model it loaded and its categories
+_worker = {}
+
+
+def _init_worker(path, engine):
+    pipeline = load_model_file(path)
+    _worker["model"] = build_engine(pipeline, engine)[1]
+    _worker["vocabularies"] = known_categories(pipeline)
+
+
+def score_chunk(df):
+    """
+    Prices of a chunk of listings (NaN when the row cannot be priced) and the error of every row.
+    """
+    features, errors = validate_columns(df, _worker["vocabularies"])
+    valid = pd.isna(errors)
+    prices = np.full(len(df), np.nan)
+    if valid.any():
+        prices[valid] = np.round(_worker["model"].predict(features[valid]), 1)
+    return prices, errors
+
+
+def csv_chunks(path, chunk_size, position=None):
+    """
+    Yield `(DataFrame, byte offset after it)` for every `chunk_size` lines of a CSV, from byte `position`.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        position = position or len(header)
+        f.seek(position)
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            data = b"".join(lines)
+            position += len(data)
+            yield pd.read_csv(io.BytesIO(header + data)), position
+
+
+def parquet_chunks(path, chunk_size, position=None):
+    """
+    Yield `(DataFrame, rows read after it)` for every `chunk_size` rows of a Parquet file, from row `position`.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Reading Parquet files needs pyarrow: pip install pyarrow")
+
+    parquet = pq.ParquetFile(path)
+    position = position or 0
+    skip = position
+    row_groups = []
+    # whole row groups before the position are not read
+    for i in range(parquet.num_row_groups):
+        n_rows = parquet.metadata.row_group(i).num_rows
+        if skip >= n_rows and not row_groups:
+            skip -= n_rows
+        else:
+            row_groups.append(i)
+    for batch in parquet.iter_batches(batch_size=chunk_size, row_groups=row_groups):
+        df = batch.to_pandas()
+        if skip:
+            dropped = min(skip, len(df))
+            df, skip = df.iloc[dropped:].reset_index(drop=True), skip - dropped
+            if df.empty:
+                continue
+        position += len(df)
+        yield df, position
+
+
+def input_chunks(path, chunk_size, position=None):
+    if path.lower().endswith((".parquet", ".pq")):
+        return parquet_chunks(path, chunk_size, position)
+    return csv_chunks(path, chunk_size, position)
+
+
+def scored_chunks(chunks, workers, model_path, engine):
+    """
+    Yield `(df, prices, errors, position)` for every chunk, in input order.
+    """
+    if workers == 0:
+        _init_worker(model_path, engine)
+        for df, position in chunks:
+            yield (df, *score_chunk(df), position)
+        return
+
+    # spawn: children start with a clean interpreter, as the process pool of the API
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(model_path, engine)) as pool:
+        pending = deque()
+        for df, position in chunks:
+            pending.append((df, pool.submit(score_chunk, df), position))
+            if len(pending) >= 2 * workers:
+                df, future, position = pending.popleft()
+                yield (df, *future.result(), position)
+        while pending:
+            df, future, position = pending.popleft()
+            yield (df, *future.result(), position)
+
+
+class Checkpoint:
+    """
+    Progress of a run, saved next to the output after every chunk written.
+    """
+
+    def __init__(self, output, identity):
+        self.path = output + ".progress"
+        self.identity = identity
+        self.state = {"identity": identity, "position": None, "rows": 0, "errors": 0, "output_bytes": 0,
+                      "complete": False}
+
+    def resume(self, restart):
+        """
+        Load the saved progress. Returns False when the run starts from the beginning.
+        """
+        if restart or not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if state["identity"] != self.identity:
+            raise SystemExit(f"{self.path} is the checkpoint of another input or model, start again with --restart")
+        self.state = state
+        return True
+
+    def save(self, **changes):
+        self.state.update(changes)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price a large file of listings with the pricing model")
+    parser.add_argument("input", help="CSV or Parquet file with the columns of get_around_pricing_project.csv")
+    parser.add_argument("--output", default="prices.csv", help="CSV of the prices, one row per input row")
+    parser.add_argument("--model", default="model.joblib", help="joblib Pipeline or model artifact")
+    parser.add_argument("--engine", choices=ENGINES, default="compiled")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows per chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes, 0 to score in this one")
+    parser.add_argument("--id-column", help="input column copied to the output, e.g. the listing id")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and score the whole input again")
+    args = parser.parse_args()
+
+    stat = os.stat(args.input)
+    identity = {"input": os.path.abspath(args.input), "size": stat.st_size, "mtime": stat.st_mtime,
+                "model_version": file_version(args.model), "engine": args.engine, "id_column": args.id_column}
+    checkpoint = Checkpoint(args.output, identity)
+    resumed = checkpoint.resume(args.restart)
+    if checkpoint.state["complete"]:
+        print(f"{args.output} is complete ({checkpoint.state['rows']} rows), use --restart to score again")
+        return
+
+    start = time.perf_counter()
+    rows_before = checkpoint.state["rows"]
+    with open(args.output, "r+b" if resumed else "wb") as out:
+        # rows written after the last checkpoint are written again
+        out.truncate(checkpoint.state["output_bytes"])
+        out.seek(checkpoint.state["output_bytes"])
+        if not resumed:
+            out.write((",".join(["row"] + ([args.id_column] if args.id_column else []) + ["prediction", "error"]) + "\n").encode())
+        if resumed:
+            print(f"Resuming {args.output} after {rows_before} rows", file=sys.stderr)
+
+        chunks = input_chunks(args.input, args.chunk_size, checkpoint.state["position"])
+        for df, prices, errors, position in scored_chunks(chunks, args.workers, args.model, args.engine):
+            rows = checkpoint.state["rows"]
+            result = pd.DataFrame({"row": np.arange(rows, rows + len(df))})
+            if args.id_column:
+                result[args.id_column] = df[args.id_column].to_numpy()
+            result["prediction"] = prices
+            result["error"] = errors
+            out.write(result.to_csv(index=False, header=False).encode())
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.save(position=position, rows=rows + len(df), output_bytes=out.tell(),
+                            errors=checkpoint.state["errors"] + int((~pd.isna(errors)).sum()))
+            elapsed = time.perf_counter() - start
+            print(f"  {checkpoint.state['rows']:>10} rows  {(checkpoint.state['rows'] - rows_before) / elapsed:10.0f} rows/s",
+                  file=sys.stderr)
+    checkpoint.save(complete=True)
+
+    elapsed = time.perf_counter() - start
+    scored = checkpoint.state["rows"] - rows_before
+    print(f"Scored {scored} rows in {elapsed:.1f} s ({scored / elapsed:.0f} rows/s) with {args.workers} processes, "
+          f"{checkpoint.state['errors']} rows not priced, wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
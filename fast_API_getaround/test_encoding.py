@@ -0,0 +1,42 @@
+import joblib
+import numpy as np
+import pytest
+
+from encoding import FeatureEncoder, UnknownCategoryError, preprocessor_of
+from executor import FeatureRecord
+from forest import as_dense
+from train import load_dataset
+
+
+# Checks of the NumPy feature encoder against the ColumnTransformer of the model.joblib of this folder.
+# Usage: python -m pytest test_encoding.py
+
+DATA = "../EDA_getaround/src/get_around_pricing_project.csv"
+
+
+@pytest.fixture(scope="module")
+def X():
+    return load_dataset(DATA)[0]
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    return joblib.load("model.joblib")
+
+
+def test_encode_matches_the_column_transformer(X, pipeline):
+    encoder = FeatureEncoder.from_model(pipeline)
+    expected = as_dense(preprocessor_of(pipeline).transform(X))
+    items = [FeatureRecord(record) for record in X.to_dict("records")]
+    np.testing.assert_allclose(encoder.encode(items), expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(encoder.encode_columns(X), expected, rtol=0, atol=1e-12)
+
+
+def test_unknown_category(X, pipeline):
+    rows = X.head(3).copy()
+    rows["fuel"] = ["diesel", "steam", "diesel"]
+    with pytest.raises(UnknownCategoryError) as error:
+        FeatureEncoder.from_model(pipeline).encode_columns(rows)
+    assert error.value.rows == [1]
+    encoded = FeatureEncoder.from_model(pipeline, handle_unknown="ignore").encode_columns(rows)
+    assert encoded.shape == (3, FeatureEncoder.from_model(pipeline).n_features)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from forest import CompiledForestPipeline, ForestPredictor
+from train import build_pipeline, load_dataset, vocabularies
+
+
+# Checks of the compiled forest against the RandomForest pipeline it was exported from, on the pricing dataset.
+# Usage: python -m pytest test_forest.py
+
+DATA = "../EDA_getaround/src/get_around_pricing_project.csv"
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return load_dataset(DATA)
+
+
+@pytest.fixture(scope="module")
+def pipeline(dataset):
+    X, y = dataset
+    regressor = RandomForestRegressor(n_estimators=30, max_depth=12, random_state=0)
+    return build_pipeline(regressor, vocabularies(X)).fit(X, y)
+
+
+def test_forest_predictor_matches_sklearn(dataset, pipeline):
+    X, _ = dataset
+    predictor = ForestPredictor.from_estimator(pipeline, chunk_size=500)
+    expected = pipeline.predict(X)
+    np.testing.assert_allclose(predictor.predict(pipeline.steps[0][1].transform(X)), expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(CompiledForestPipeline.from_pipeline(pipeline).predict(X), expected, rtol=0, atol=1e-9)
+
+
+def test_saved_forest_matches_sklearn(dataset, pipeline, tmp_path):
+    X, _ = dataset
+    ForestPredictor.from_estimator(pipeline).save(tmp_path / "forest.npz")
+    predictor = ForestPredictor.load(tmp_path / "forest.npz", mmap_mode="r")
+    np.testing.assert_allclose(predictor.predict(pipeline.steps[0][1].transform(X)), pipeline.predict(X),
+                               rtol=0, atol=1e-9)
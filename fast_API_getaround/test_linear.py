@@ -0,0 +1,42 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import Ridge
+
+from executor import FeatureRecord
+from linear import LinearKernel
+from train import build_pipeline, load_dataset, vocabularies
+
+
+# Checks of the linear kernel against the pipelines it was folded from, on the pricing dataset:
+# the model.joblib of this folder and a Ridge fitted with the preprocessing of train.py.
+# Usage: python -m pytest test_linear.py
+
+DATA = "../EDA_getaround/src/get_around_pricing_project.csv"
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return load_dataset(DATA)
+
+
+@pytest.fixture(scope="module", params=["model.joblib", "ridge"])
+def pipeline(request, dataset):
+    if request.param == "ridge":
+        X, y = dataset
+        return build_pipeline(Ridge(alpha=1.0), vocabularies(X)).fit(X, y)
+    return joblib.load(request.param)
+
+
+def test_predict_matches_the_pipeline(dataset, pipeline):
+    X, _ = dataset
+    kernel = LinearKernel.from_pipeline(pipeline)
+    np.testing.assert_allclose(kernel.predict(X), pipeline.predict(X), rtol=0, atol=1e-9)
+
+
+def test_predict_one_matches_the_pipeline(dataset, pipeline):
+    X, _ = dataset
+    kernel = LinearKernel.from_pipeline(pipeline)
+    items = [FeatureRecord(record) for record in X.to_dict("records")]
+    np.testing.assert_allclose([kernel.predict_one(item) for item in items], pipeline.predict(X), rtol=0, atol=1e-9)
+    np.testing.assert_allclose(kernel.predict_features(items), pipeline.predict(X), rtol=0, atol=1e-9)
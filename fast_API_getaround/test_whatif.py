@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as api
+
+
+# Checks of /predict/sensitivity against /predict, with the model.joblib of this folder.
+# Usage: python -m pytest test_whatif.py
+
+CAR = {"model_key": "Citroën", "mileage": 140411, "engine_power": 100, "fuel": "diesel", "paint_color": "black",
+       "car_type": "convertible", "private_parking_available": True, "has_gps": True, "has_air_conditioning": False,
+       "automatic_car": False, "has_getaround_connect": True, "has_speed_regulator": True, "winter_tires": True}
+
+
+@pytest.fixture(scope="module")
+def client():
+    # startup and shutdown of the API run once for all the tests
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_base_prediction_is_the_predict_price(client):
+    price = client.post("/predict", json=CAR).json()["Predicted rental price per day in dollars"]
+    result = client.post("/predict/sensitivity", json={
+        "base": CAR, "mileage": {"start": 0, "stop": 200000, "steps": 5}, "toggle": ["has_gps", "winter_tires"],
+        "car_type": ["suv"]}).json()
+    assert result["base_prediction"] == price
+    assert result["shape"] == [5, 2, 2, 2]
+
+
+def test_only_boolean_options_can_be_toggled(client):
+    response = client.post("/predict/sensitivity", json={"base": CAR, "toggle": ["mileage"]})
+    assert response.status_code == 422
+
+
+def test_car_types_are_the_ones_of_the_model(client):
+    response = client.post("/predict/sensitivity", json={"base": CAR, "car_type": ["suv", "boat"]})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "car_type", 1]
@@ -0,0 +1,285 @@
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.model_selection import GridSearchCV, KFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from batch import BOOLEAN_FEATURES, CATEGORICAL_FEATURES, FEATURES, NUMERIC_FEATURES
+from engines import ENGINES, build_engine
+from executor import FeatureRecord
+
+
+# Training of the pricing model, out of PART_2_Get_Around_ML.ipynb.
+# Same cleaning, split and preprocessing as the notebook (StandardScaler on the numeric columns,
+# OneHotEncoder(drop='first') on the others), then a cross-validated grid search over linear,
+# random forest and gradient boosting candidates run in parallel processes (n_jobs). The fitted
+# preprocessing is cached on disk, so each fold fits it once for all the candidates.
+# The best candidate of every family is refitted on the training split and timed with the engine of
+# the API, and the winner is the most accurate one within the latency budget.
+# The model is written to train_model.joblib, not over the model.joblib served by the API: deploy it
+# with an atomic rename (`mv train_model.joblib model.joblib`) once the report is checked.
+# Usage: python train.py --output train_model.joblib --report train_report.json
+#        python train.py --families linear forest --max-latency-ms 1 --artifact model.artifact
+
+TARGET = "rental_price_per_day"
+
+# {family: (regressor, grid of its parameters)}
+CANDIDATES = {
+    "linear": [
+        (LinearRegression(), {}),
+        (Ridge(), {"alpha": [0.1, 1.0, 10.0]}),
+    ],
+    "forest": [
+        (RandomForestRegressor(random_state=0), {"n_estimators": [100, 300], "max_depth": [10, 20],
+                                                 "min_samples_split": [2, 5]}),
+    ],
+    "boosting": [
+        (GradientBoostingRegressor(random_state=0), {"n_estimators": [200, 500], "max_depth": [3, 5],
+                                                     "learning_rate": [0.05, 0.1]}),
+    ],
+}
+
+
+def rmse(preds, targets):
+    return float(np.sqrt(((preds - targets) ** 2).mean()))
+
+
+def load_dataset(path):
+    """
+    Features and target of the pricing dataset, without the car of negative mileage (as in PART_2).
+    """
+    dataset = pd.read_csv(path, index_col=0)
+    dataset = dataset[dataset["mileage"] > 0]
+    return dataset[FEATURES], dataset[TARGET]
+
+
+def categorical_columns():
+    # numeric then categorical columns, the order PART_2 found them in the dataset
+    return [name for name in FEATURES if name in CATEGORICAL_FEATURES or name in BOOLEAN_FEATURES]
+
+
+def vocabularies(X):
+    """
+    Sorted values of every categorical column of the training split, as OneHotEncoder finds them.
+    A rare model_key missing from a training fold is then still known when its validation fold is scored.
+    """
+    return [sorted(X[name].unique()) for name in categorical_columns()]
+
+
+def seen_rows(X, categories):
+    """
+    Mask of the cars whose categorical values are all in `categories` (see `vocabularies`).
+    """
+    mask = np.ones(len(X), dtype=bool)
+    for name, values in zip(categorical_columns(), categories):
+        mask &= X[name].isin(values).to_numpy()
+    return mask
+
+
+def build_preprocessor(categories="auto"):
+    numeric_transformer = Pipeline(steps=[("scaler", StandardScaler())])
+    categorical_transformer = Pipeline(steps=[("encoder", OneHotEncoder(categories=categories, drop="first"))])
+    return ColumnTransformer(
+        transformers=[
+            ("num", numeric_transformer, NUMERIC_FEATURES),
+            ("cat", categorical_transformer, categorical_columns())])
+
+
+def build_pipeline(regressor, categories="auto", memory=None):
+    return Pipeline(steps=[("Preprocessing", build_preprocessor(categories)), ("Regressor", regressor)], memory=memory)
+
+
+def param_grid(families):
+    """
+    Grid of GridSearchCV with the regressor as a parameter, one sub-grid per candidate.
+    """
+    grid = []
+    for family in families:
+        for regressor, params in CANDIDATES[family]:
+            grid.append({"Regressor": [regressor], **{f"Regressor__{name}": values for name, values in params.items()}})
+    return grid
+
+
+def family_of(regressor):
+    return next(family for family, candidates in CANDIDATES.items()
+                if any(type(regressor) is type(candidate) for candidate, _ in candidates))
+
+
+def describe_params(params):
+    described = {name.replace("Regressor__", ""): value for name, value in params.items() if name != "Regressor"}
+    return {"regressor": type(params["Regressor"]).__name__, **described}
+
+
+def search(X, y, families, categories, cv, n_jobs, memory):
+    """
+    Cross-validated search, returns the best parameters of every family with their CV RMSE.
+    """
+    folds = KFold(n_splits=cv, shuffle=True, random_state=0)
+    grid = GridSearchCV(build_pipeline(LinearRegression(), categories, memory), param_grid(families),
+                        scoring="neg_root_mean_squared_error", cv=folds, n_jobs=n_jobs, refit=False,
+                        error_score="raise")
+    start = time.perf_counter()
+    grid.fit(X, y)
+    duration = time.perf_counter() - start
+
+    results = grid.cv_results_
+    best = {}
+    for i, params in enumerate(results["params"]):
+        family = family_of(params["Regressor"])
+        score = -results["mean_test_score"][i]
+        if family not in best or score < best[family]["cv_rmse"]:
+            best[family] = {"params": params, "cv_rmse": float(score), "cv_rmse_std": float(results["std_test_score"][i]),
+                            "fit_s": float(results["mean_fit_time"][i])}
+    return best, len(results["params"]), duration
+
+
+def measure_latency(pipeline, X, engine, n_single):
+    """
+    Prediction time with the engine the API builds for `pipeline`: one car per call (like /predict)
+    and the whole set in one call (like /predict/batch).
+    """
+    engine_name, model = build_engine(pipeline, engine)
+    items = [FeatureRecord(record) for record in X.head(n_single).to_dict("records")]
+    model.predict_features(items[:1])
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        model.predict_features([item])
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    model.predict(X)
+    batch = time.perf_counter() - start
+    p50, p95 = np.percentile(timings, [50, 95]) * 1000
+    return {"engine": engine_name, "single_p50_ms": round(float(p50), 3), "single_p95_ms": round(float(p95), 3),
+            "batch_us_per_row": round(batch / len(X) * 1e6, 2), "size_mb": round(model_size(pipeline) / 2**20, 2)}
+
+
+def model_size(pipeline):
+    buffer = io.BytesIO()
+    joblib.dump(pipeline, buffer)
+    return buffer.tell()
+
+
+def choose(candidates, max_latency_ms=None):
+    """
+    Family with the lowest CV RMSE among those within the latency budget of one /predict call.
+    """
+    eligible = {family: c for family, c in candidates.items()
+                if max_latency_ms is None or c["latency"]["single_p50_ms"] <= max_latency_ms}
+    if not eligible:
+        raise SystemExit(f"No candidate predicts one car in less than {max_latency_ms} ms")
+    return min(eligible, key=lambda family: eligible[family]["cv_rmse"])
+
+
+def write_artifact_of(pipeline, path, metrics):
+    from artifact import export_model, write_artifact
+    from encoding import export_encoding
+
+    try:
+        kind, params, arrays = export_model(pipeline)
+    except TypeError as error:
+        print(f"No artifact written: {error}")
+        return
+    write_artifact(path, kind, params, arrays, export_encoding(pipeline), metrics, {"trained_by": "train.py"})
+    print(f"Wrote {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the Getaround pricing model")
+    parser.add_argument("--data", default="../EDA_getaround/src/get_around_pricing_project.csv")
+    parser.add_argument("--families", nargs="+", choices=sorted(CANDIDATES), default=list(CANDIDATES))
+    parser.add_argument("--cv", type=int, default=5, help="cross-validation folds")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="processes of the search, -1 for one per CPU")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--engine", choices=ENGINES, default="compiled", help="engine timed for the latency")
+    parser.add_argument("--latency-rows", type=int, default=500, help="cars predicted one by one for the latency")
+    parser.add_argument("--max-latency-ms", type=float, help="latency budget of one /predict call (p50)")
+    parser.add_argument("--cache", help="directory of the preprocessing cache (default: temporary)")
+    parser.add_argument("--output", default="train_model.joblib",
+                        help="joblib file of the winning model, not the model.joblib served by the API")
+    parser.add_argument("--report", default="train_report.json")
+    parser.add_argument("--artifact", help="also write the winner in the artifact format (artifact.py)")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    X, y = load_dataset(args.data)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_size, random_state=42)
+    # the test cars stay out of the vocabularies too, the few with a value never seen in training are not scored
+    categories = vocabularies(X_train)
+    seen = seen_rows(X_test, categories)
+    n_unseen = int((~seen).sum())
+    X_test, y_test = X_test[seen], y_test[seen]
+    print(f"{len(X_train)} training and {len(X_test)} test cars ({n_unseen} with an unseen category left out), "
+          f"families {', '.join(args.families)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = joblib.Memory(args.cache or tmp, verbose=0)
+        best, n_candidates, duration = search(X_train, y_train, args.families, categories, args.cv, args.n_jobs, memory)
+        print(f"Searched {n_candidates} candidates x {args.cv} folds in {duration:.1f} s")
+
+        candidates = {}
+        fitted = {}
+        for family, result in best.items():
+            pipeline = build_pipeline(clone(result["params"]["Regressor"]), categories)
+            pipeline.set_params(**{name: value for name, value in result["params"].items() if name != "Regressor"})
+            start = time.perf_counter()
+            pipeline.fit(X_train, y_train)
+            fit_s = time.perf_counter() - start
+            fitted[family] = pipeline
+            candidates[family] = {
+                "params": describe_params(result["params"]),
+                "cv_rmse": round(result["cv_rmse"], 3),
+                "cv_rmse_std": round(result["cv_rmse_std"], 3),
+                "train_rmse": round(rmse(pipeline.predict(X_train), y_train), 3),
+                "test_rmse": round(rmse(pipeline.predict(X_test), y_test), 3),
+                "fit_s": round(fit_s, 2),
+                "latency": measure_latency(pipeline, X_test, args.engine, args.latency_rows),
+            }
+
+    winner = choose(candidates, args.max_latency_ms)
+    print(f"  {'family':<10} {'regressor':<26} {'CV RMSE':>12} {'test RMSE':>10} {'engine':<16} "
+          f"{'1 car p50':>10} {'batch/row':>10} {'size':>8}")
+    for family, c in sorted(candidates.items(), key=lambda item: item[1]["cv_rmse"]):
+        latency = c["latency"]
+        print(f"{'*' if family == winner else ' '} {family:<10} {c['params']['regressor']:<26} "
+              f"{c['cv_rmse']:6.2f} ±{c['cv_rmse_std']:4.2f} {c['test_rmse']:10.2f} {latency['engine']:<16} "
+              f"{latency['single_p50_ms']:8.3f}ms {latency['batch_us_per_row']:8.1f}us {latency['size_mb']:6.1f}MB")
+
+    joblib.dump(fitted[winner], args.output)
+    print(f"Wrote {args.output}: {winner}, {candidates[winner]['params']}")
+    report = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "data": os.path.basename(args.data),
+        "rows": {"train": len(X_train), "test": len(X_test), "test_unseen": n_unseen},
+        "cv": args.cv,
+        "candidates_searched": n_candidates,
+        "search_s": round(duration, 1),
+        "max_latency_ms": args.max_latency_ms,
+        "winner": winner,
+        "output": args.output,
+        "candidates": candidates,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=1, default=str)
+    print(f"Wrote {args.report}")
+    if args.artifact:
+        metrics = {name: candidates[winner][name] for name in ["cv_rmse", "train_rmse", "test_rmse"]}
+        write_artifact_of(fitted[winner], args.artifact, metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from batch import BOOLEAN_FEATURES, FEATURES, NUMERIC_FEATURES
+
+
+# What-if grid of /predict/sensitivity.
+# One base car and a few varying dimensions (numeric ranges, toggled options, alternate car types)
+# are expanded into the full cartesian grid as NumPy columns, with np.unravel_index giving the value
+# index of every dimension for every row, so no Python loop runs per row. The base car is added as
+# the last row and the whole grid goes to the model in a single call.
+
+VARYING = NUMERIC_FEATURES + BOOLEAN_FEATURES + ["car_type"]
+
+# Column types of the grid, whatever the values of a dimension look like
+DTYPES = {name: np.float64 if name in NUMERIC_FEATURES else bool if name in BOOLEAN_FEATURES else object
+          for name in FEATURES}
+
+
+class GridTooLarge(ValueError):
+    """
+    Raised when the grid has more rows than allowed.
+    """
+
+    def __init__(self, n_rows, max_rows):
+        super().__init__(f"Grid has {n_rows} rows, it should not have more than {max_rows}")
+        self.n_rows = n_rows
+        self.max_rows = max_rows
+
+
+def numeric_values(start, stop, steps):
+    if steps < 1:
+        raise ValueError("steps should be at least 1")
+    return np.linspace(start, stop, steps)
+
+
+def alternatives(base_value, values):
+    """
+    The base value first, then the other values once each, in the order given.
+    """
+    return list(dict.fromkeys([base_value] + list(values)))
+
+
+def build_grid(base, dimensions, max_rows):
+    """
+    Columns of every combination of `dimensions` ({feature: values}), other features as in `base`,
+    plus the base car as the last row. Returns `(columns, shape)`.
+    """
+    if not dimensions:
+        raise ValueError("Give at least one dimension to vary")
+    unknown = [name for name in dimensions if name not in VARYING]
+    if unknown:
+        raise ValueError(f"Cannot vary {unknown}, expected some of {VARYING}")
+    not_toggles = [name for name in BOOLEAN_FEATURES if name in dimensions
+                   and any(not isinstance(value, (bool, np.bool_)) for value in dimensions[name])]
+    if not_toggles:
+        raise ValueError(f"{not_toggles} can only be toggled between false and true")
+    shape = tuple(len(values) for values in dimensions.values())
+    n_rows = int(np.prod(shape, dtype=np.int64))
+    if n_rows + 1 > max_rows:
+        raise GridTooLarge(n_rows + 1, max_rows)
+
+    indexes = np.unravel_index(np.arange(n_rows), shape)
+    columns = {}
+    for name in FEATURES:
+        column = np.empty(n_rows + 1, dtype=DTYPES[name])
+        if name in dimensions:
+            values = np.asarray(dimensions[name], dtype=DTYPES[name])
+            column[:-1] = values[indexes[list(dimensions).index(name)]]
+        else:
+            column[:-1] = base[name]
+        # the base car as given in the request, not as a value of the grid
+        column[-1] = base[name]
+        columns[name] = column
+    return pd.DataFrame(columns, columns=FEATURES), shape
+
+
+def sensitivity(model, base, dimensions, max_rows):
+    """
+    Prices of the grid of `dimensions` around `base`, from one call to `model.predict`.
+    """
+    df, shape = build_grid(base, dimensions, max_rows)
+    prices = np.round(model.predict(df), 1)
+    return {
+        "base_prediction": float(prices[-1]),
+        "dimensions": {name: np.asarray(values).tolist() for name, values in dimensions.items()},
+        "shape": list(shape),
+        "predictions": prices[:-1].reshape(shape).tolist(),
+    }